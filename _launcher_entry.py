@@ -2,24 +2,27 @@
 _launcher_entry.py — PyInstaller entry point for ZeroToken.exe
 
 This is NOT the same as ZeroToken.pyw.  It is a frozen-aware wrapper that:
-  1. Locates a real Python interpreter (venv → system PATH fallback)
-  2. Launches ai_build.py gui as a subprocess under that interpreter
-  3. Opens the Tkinter launcher GUI so the user can see logs and stop the server
+  1. Starts the Flask server — in-process on a background thread when frozen
+     (the exe already bundles Python and ai_build), or as an `ai_build.py gui`
+     subprocess under a real interpreter when run from source
+  2. Opens the Tkinter launcher GUI so the user can see logs and stop the server
 
 The frozen exe is placed in the project root alongside ai_build.py.
-sys.executable in a frozen build points to the .exe itself — we must find
-a real python.exe separately.
+sys.executable in a frozen build points to the .exe itself, which is why the
+subprocess path has to find a real python.exe separately.
 """
 
+import io
 import os
 import sys
+import logging
+import socket
 import subprocess
 import threading
-import webbrowser
 import queue
 import time
-import urllib.request
-import urllib.error
+# tkinter stays top-level because ZeroTokenApp subclasses tk.Tk; webbrowser and
+# urllib.request (http.client, email, ssl…) are imported where they are used.
 import tkinter as tk
 from tkinter import scrolledtext, font as tkfont
 
@@ -33,6 +36,10 @@ else:
 
 SCRIPT = os.path.join(PROJECT_ROOT, "ai_build.py")
 
+# The frozen exe hosts the server itself; a source checkout keeps the
+# subprocess so edits to ai_build/ are picked up on every launch.
+IN_PROCESS = getattr(sys, "frozen", False)
+
 # ── Find a real Python interpreter ────────────────────────────────────────────
 def _find_python() -> str:
     """
@@ -67,17 +74,76 @@ YELLOW  = "#facc15"
 TEXT    = "#e8e8f0"
 TEXT2   = "#9090a8"
 TEXT3   = "#55556a"
-APP_URL = "http://127.0.0.1:5000"
+APP_HOST = "127.0.0.1"
+APP_PORT = 5000
+APP_URL = f"http://{APP_HOST}:{APP_PORT}"
 
 MONO_FAMILIES = ("JetBrains Mono", "Cascadia Code", "Consolas", "Courier New")
 
+# One Tcl named font per (size, bold); the winning family is probed only once.
+_FONT_CACHE: dict[tuple[int, bool], "tkfont.Font"] = {}
+_MONO_FAMILY: str | None = None
+
 def _mono(size=10, bold=False):
-    for f in MONO_FAMILIES:
+    global _MONO_FAMILY
+    key = (size, bold)
+    if key in _FONT_CACHE:
+        return _FONT_CACHE[key]
+    weight = "bold" if bold else "normal"
+    font = None
+    if _MONO_FAMILY is not None:
+        font = tkfont.Font(family=_MONO_FAMILY, size=size, weight=weight)
+    else:
+        for f in MONO_FAMILIES:
+            try:
+                font = tkfont.Font(family=f, size=size, weight=weight)
+                _MONO_FAMILY = f
+                break
+            except Exception:
+                pass
+    if font is None:
+        font = tkfont.Font(size=size, weight=weight)
+    _FONT_CACHE[key] = font
+    return font
+
+
+# ── In-process log plumbing ───────────────────────────────────────────────────
+class _QueueLogHandler(logging.Handler):
+    """Forward log records straight to the launcher's log queue."""
+
+    def __init__(self, emit_fn):
+        super().__init__()
+        self._emit_fn = emit_fn
+
+    def emit(self, record):
         try:
-            return tkfont.Font(family=f, size=size, weight="bold" if bold else "normal")
+            msg = self.format(record)
         except Exception:
-            pass
-    return tkfont.Font(size=size, weight="bold" if bold else "normal")
+            self.handleError(record)
+            return
+        self._emit_fn("err" if record.levelno >= logging.ERROR else "info", msg)
+
+
+class _QueueWriter(io.TextIOBase):
+    """Line-buffered stand-in for stdout/stderr (both are None under --noconsole)."""
+
+    def __init__(self, emit_fn, tag="info"):
+        super().__init__()
+        self._emit_fn = emit_fn
+        self._tag     = tag
+        self._buf     = ""
+        self._lock    = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        with self._lock:
+            self._buf += s
+            *lines, self._buf = self._buf.split("\n")
+        for line in lines:
+            self._emit_fn(self._tag, line.rstrip())
+        return len(s)
 
 
 class ZeroTokenApp(tk.Tk):
@@ -88,6 +154,7 @@ class ZeroTokenApp(tk.Tk):
         self.minsize(560, 360)
         self.configure(bg=BG)
         self._proc   = None
+        self._server_thread = None
         self._log_q  = queue.Queue()
         self._ready  = False
         self._stopping = False
@@ -102,8 +169,11 @@ class ZeroTokenApp(tk.Tk):
 
         self._build_ui()
         self.protocol("WM_DELETE_WINDOW", self._on_close)
+        # Background threads signal new log lines with a virtual event, so the
+        # mainloop only wakes when there is something to drain.
+        self.bind("<<LogArrived>>", self._drain_log)
         self.after(100, self._start_server)
-        self.after(200, self._poll_log)
+        self.after(1000, self._safety_drain)
 
     # ── UI ────────────────────────────────────────────────────────────────────
     def _build_ui(self):
@@ -147,13 +217,26 @@ class ZeroTokenApp(tk.Tk):
         self._log.tag_config("info", foreground=TEXT2)
 
     def _append(self, msg: str, tag="info"):
+        self._append_many([(msg, tag)])
+
+    def _append_many(self, items: list[tuple[str, str]]):
+        """Insert several (msg, tag) lines with one state toggle and one scroll."""
+        if not items:
+            return
+        # Only follow the tail if the user has not scrolled up to read history
+        at_bottom = float(self._log.yview()[1]) > 0.999
         self._log.configure(state="normal")
-        self._log.insert("end", msg + "\n", tag)
-        self._log.see("end")
+        for msg, tag in items:
+            self._log.insert("end", msg + "\n", tag)
+        if at_bottom:
+            self._log.see("end")
         self._log.configure(state="disabled")
 
     # ── Server lifecycle ──────────────────────────────────────────────────────
     def _start_server(self):
+        if IN_PROCESS:
+            self._start_server_in_process()
+            return
         if not os.path.isfile(SCRIPT):
             self._append(f"ERROR: ai_build.py not found at:\n  {SCRIPT}", "err")
             self._status_lbl.config(text="● Error", fg=RED)
@@ -168,58 +251,160 @@ class ZeroTokenApp(tk.Tk):
         self._append(f"URL     : {APP_URL}\n", "info")
 
         def _run():
+            # Coalesce bursty output: up to 32 lines or 20 ms per queue put.
+            # The timer flushes the tail of a burst so no line is held back.
+            batch: list[str] = []
+            batch_lock = threading.Lock()
+            timer = None
+
+            def _flush():
+                nonlocal batch, timer
+                with batch_lock:
+                    if timer is not None:
+                        timer.cancel()
+                        timer = None
+                    if not batch:
+                        return
+                    lines, batch = batch, []
+                self._emit("info_batch", lines)
+
             try:
                 self._proc = subprocess.Popen(
                     [PYTHON, SCRIPT, "gui"],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
                     text=True,
-                    bufsize=1,
+                    # Block-buffered: readline() is served from a 64 KiB
+                    # buffer instead of one read() per short chunk.
+                    bufsize=65536,
                     cwd=PROJECT_ROOT,
                     creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0,
                 )
                 for line in self._proc.stdout:
-                    self._log_q.put(("info", line.rstrip()))
+                    with batch_lock:
+                        batch.append(line.rstrip())
+                        full = len(batch) >= 32
+                        if not full and timer is None:
+                            timer = threading.Timer(0.02, _flush)
+                            timer.daemon = True
+                            timer.start()
+                    if full:
+                        _flush()
+                _flush()
             except Exception as exc:
-                self._log_q.put(("err", f"Failed to start server: {exc}"))
+                _flush()
+                self._emit("err", f"Failed to start server: {exc}")
 
         threading.Thread(target=_run, daemon=True).start()
         threading.Thread(target=self._wait_for_ready, daemon=True).start()
 
-    def _wait_for_ready(self):
-        for _ in range(40):  # 20 s timeout
-            time.sleep(0.5)
+    def _start_server_in_process(self):
+        # Same working directory the subprocess would get — .ai-build/ is cwd-relative
+        os.chdir(PROJECT_ROOT)
+        self._append("Mode    : in-process", "info")
+        self._append(f"URL     : {APP_URL}\n", "info")
+
+        handler = _QueueLogHandler(self._emit)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root_log = logging.getLogger()
+        root_log.addHandler(handler)
+        root_log.setLevel(logging.INFO)
+        sys.stdout = _QueueWriter(self._emit, "info")
+        sys.stderr = _QueueWriter(self._emit, "err")
+
+        def _run():
+            try:
+                from ai_build.server import run_server
+                run_server(host=APP_HOST, port=APP_PORT, open_browser=False)
+            except Exception as exc:
+                self._emit("err", f"Failed to start server: {exc}")
+
+        self._server_thread = threading.Thread(target=_run, daemon=True, name="zerotoken-server")
+        self._server_thread.start()
+        # Same process, so a bound port means Flask is serving — no HTTP round trip
+        threading.Thread(target=self._wait_for_ready, args=(False,), daemon=True).start()
+
+    def _wait_for_ready(self, confirm_http: bool = True):
+        # Probe with a bare TCP connect (backing off 25 ms → 250 ms) so we
+        # notice the listener the moment it binds, then confirm once over HTTP.
+        import urllib.request
+        delay = 0.025
+        deadline = time.monotonic() + 20  # 20 s timeout
+        while time.monotonic() < deadline:
+            try:
+                s = socket.create_connection((APP_HOST, APP_PORT), timeout=0.25)
+                s.close()
+            except OSError:
+                time.sleep(delay)
+                delay = min(delay * 1.5, 0.25)
+                continue
             try:
-                urllib.request.urlopen(APP_URL, timeout=1)
-                self._log_q.put(("ok", f"✓ Server ready at {APP_URL}"))
-                self._log_q.put(("__ready__", ""))
+                if confirm_http:
+                    urllib.request.urlopen(APP_URL, timeout=1)
+                self._emit("ok", f"✓ Server ready at {APP_URL}")
+                self._emit("__ready__", "")
                 return
             except Exception:
-                pass
-        self._log_q.put(("err", "Server did not respond within 20 s. Check the log above."))
+                # Port is bound but Flask is not serving yet
+                time.sleep(delay)
+        self._emit("err", "Server did not respond within 20 s. Check the log above.")
+
+    # ── Log queue ─────────────────────────────────────────────────────────────
+    def _emit(self, tag: str, msg):
+        """Queue a log line from any thread and wake the Tk mainloop."""
+        self._log_q.put((tag, msg))
+        try:
+            self.event_generate("<<LogArrived>>", when="tail")
+        except Exception:
+            # Window already destroyed, or Tk refused a cross-thread event —
+            # the safety-net drain picks the line up.
+            pass
 
-    def _poll_log(self):
-        while not self._log_q.empty():
-            tag, msg = self._log_q.get_nowait()
-            if tag == "__ready__":
-                self._on_ready()
-            else:
-                self._append(msg, tag)
-        self.after(150, self._poll_log)
+    def _drain_log(self, _evt=None):
+        # Collect everything queued so far, then touch the Text widget once.
+        items: list[tuple[str, str]] = []
+        ready = False
+        get = self._log_q.get_nowait
+        try:
+            while True:
+                tag, msg = get()
+                if tag == "__ready__":
+                    ready = True
+                elif tag == "info_batch":
+                    items.extend((line, "info") for line in msg)
+                else:
+                    items.append((msg, tag))
+        except queue.Empty:
+            pass
+        self._append_many(items)
+        if ready:
+            self._on_ready()
+
+    def _safety_drain(self):
+        # Catches any line whose <<LogArrived>> event was dropped.
+        self._drain_log()
+        self.after(1000, self._safety_drain)
 
     def _on_ready(self):
         self._ready = True
         self._status_lbl.config(text="● Running", fg=GREEN)
         self._open_btn.config(state="normal")
-        webbrowser.open(APP_URL)
+        self._open_browser()
 
     def _open_browser(self):
+        import webbrowser
         webbrowser.open(APP_URL)
 
     def _stop_server(self):
         if self._proc and self._proc.poll() is None:
             self._proc.terminate()
             self._append("Server stopped.", "err")
+        elif self._server_thread and self._server_thread.is_alive():
+            from ai_build.shutdown import get_shutdown_manager
+            get_shutdown_manager().shutdown(reason="launcher")
+            self._server_thread.join(timeout=5)
+            self._drain_log()
+            self._append("Server stopped.", "err")
         self._status_lbl.config(text="● Stopped", fg=RED)
         self._open_btn.config(state="disabled")
 
@@ -14,8 +14,11 @@ CLI commands (advanced / scripting):
     python ai_build.py show-plan                 # pretty-print plan with statuses
     python ai_build.py reset [step_id]           # reset one step (or all) to pending
     python ai_build.py -h / --help / help        # show this help
+
+Add --no-cache to any command to bypass the OLLAMA_CACHE=1 reply cache.
 """
 
+import os
 import sys
 
 
@@ -41,25 +44,25 @@ def cmd_show_plan():
     if not plan:
         print("No plan found. Run: python ai_build.py plan \"your goal\"")
         return
-    print(f"\nGoal: {bold(plan['goal'])}\n")
-    print(f"{'#':<4} {'Title':<40} {'Status':<12} Files")
-    print("-" * 80)
-    ICONS = {"applied": "✓", "skipped": "-", "failed": "✗", "pending": "·"}
+    # Coloured status cells, built once per call instead of once per step
+    STATUS_FMT = {
+        "applied": green(f"{'[✓] applied':<14}"),
+        "failed":  red(f"{'[✗] failed':<14}"),
+        "skipped": yellow(f"{'[-] skipped':<14}"),
+        "pending": cyan(f"{'[·] pending':<14}"),
+    }
+    rows = [
+        f"\nGoal: {bold(plan['goal'])}\n\n",
+        f"{'#':<4} {'Title':<40} {'Status':<12} Files\n",
+        "-" * 80 + "\n",
+    ]
     for step in plan["steps"]:
         files = ", ".join(step.get("suggested_files", []))
         status = step.get("status", "pending")
-        icon = ICONS.get(status, "?")
-        status_str = f"[{icon}] {status}"
-        if status == "applied":
-            coloured = green(f"{status_str:<14}")
-        elif status == "failed":
-            coloured = red(f"{status_str:<14}")
-        elif status == "skipped":
-            coloured = yellow(f"{status_str:<14}")
-        else:
-            coloured = cyan(f"{status_str:<14}")
-        print(f"{step['id']:<4} {step['title']:<40} {coloured} {files}")
-    print()
+        coloured = STATUS_FMT.get(status) or cyan(f"{f'[?] {status}':<14}")
+        rows.append(f"{step['id']:<4} {step['title']:<40} {coloured} {files}\n")
+    rows.append("\n")
+    sys.stdout.write("".join(rows))
 
 
 def cmd_gui(host: str = "127.0.0.1", port: int = 5000):
@@ -103,51 +106,70 @@ def cmd_reset(step_id_str: str | None):
         save_plan(plan, quiet=True)
 
 
-def main():
-    if len(sys.argv) < 2:
-        print(__doc__)
-        sys.exit(0)
+# ---------------------------------------------------------------------------
+# argv adapters — each takes the arguments after the command name
+# ---------------------------------------------------------------------------
 
-    command = sys.argv[1].lower()
+def _help_argv(argv: list[str]):
+    print(__doc__)
+    sys.exit(0)
 
-    if command in ("-h", "--help", "help"):
-        print(__doc__)
-        sys.exit(0)
 
-    elif command == "plan":
-        if len(sys.argv) < 3:
-            print("Usage: python ai_build.py plan \"your goal here\"")
-            sys.exit(1)
-        goal = " ".join(sys.argv[2:])
-        cmd_plan(goal)
+def _plan_argv(argv: list[str]):
+    if not argv:
+        print("Usage: python ai_build.py plan \"your goal here\"")
+        sys.exit(1)
+    cmd_plan(" ".join(argv))
 
-    elif command == "run":
-        cmd_run()
 
-    elif command == "resume":
-        cmd_resume()
+def _gui_argv(argv: list[str]):
+    host = "127.0.0.1"
+    port = 5000
+    for arg in argv:
+        if arg.startswith("--port="):
+            port = int(arg.split("=", 1)[1])
+        elif arg.startswith("--host="):
+            host = arg.split("=", 1)[1]
+    cmd_gui(host=host, port=port)
 
-    elif command == "show-plan":
-        cmd_show_plan()
 
-    elif command == "gui":
-        host = "127.0.0.1"
-        port = 5000
-        for arg in sys.argv[2:]:
-            if arg.startswith("--port="):
-                port = int(arg.split("=", 1)[1])
-            elif arg.startswith("--host="):
-                host = arg.split("=", 1)[1]
-        cmd_gui(host=host, port=port)
+def _reset_argv(argv: list[str]):
+    cmd_reset(argv[0] if argv else None)
 
-    elif command == "reset":
-        step_id = sys.argv[2] if len(sys.argv) > 2 else None
-        cmd_reset(step_id)
 
-    else:
+COMMANDS = {
+    "-h":        _help_argv,
+    "--help":    _help_argv,
+    "help":      _help_argv,
+    "plan":      _plan_argv,
+    "run":       lambda argv: cmd_run(),
+    "resume":    lambda argv: cmd_resume(),
+    "show-plan": lambda argv: cmd_show_plan(),
+    "gui":       _gui_argv,
+    "reset":     _reset_argv,
+}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(0)
+
+    argv = sys.argv[1:]
+    if "--no-cache" in argv:
+        argv.remove("--no-cache")
+        os.environ["OLLAMA_CACHE"] = "0"
+    if not argv:
+        print(__doc__)
+        sys.exit(0)
+
+    command = argv[0].lower()
+    handler = COMMANDS.get(command)
+    if handler is None:
         print(f"Unknown command: {command!r}")
         print(__doc__)
         sys.exit(1)
+    handler(argv[1:])
 
 
 if __name__ == "__main__":
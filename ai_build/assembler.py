@@ -110,6 +110,29 @@ def assemble_final_prompt(goal: str, plan: dict, diffs: dict, root: str = ".") -
     Returns:
         The complete agent prompt as a single string ready to paste into Claude.
     """
+    return "".join(_prompt_sections(goal, plan, diffs, root))
+
+
+def write_final_prompt(goal: str, plan: dict, diffs: dict, path: str, root: str = ".") -> int:
+    """
+    Same prompt as assemble_final_prompt(), written section by section to
+    *path* (atomically, via a temp file) instead of being built in memory.
+
+    Returns:
+        The number of characters written.
+    """
+    tmp = f"{path}.tmp"
+    n_chars = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        for section in _prompt_sections(goal, plan, diffs, root):
+            f.write(section)
+            n_chars += len(section)
+    os.replace(tmp, path)
+    return n_chars
+
+
+def _prompt_sections(goal: str, plan: dict, diffs: dict, root: str):
+    """Yield the final prompt in order: header, one block per step, skipped steps, footer."""
     import pathlib
 
     root_path = pathlib.Path(root).resolve()
@@ -139,7 +162,8 @@ def assemble_final_prompt(goal: str, plan: dict, diffs: dict, root: str = ".") -
         n_skipped_note= n_skipped_note,
     )
 
-    body_parts: list[str] = []
+    yield header
+
     checklist_lines: list[str] = []
 
     for step in approved_steps:
@@ -158,7 +182,7 @@ def assemble_final_prompt(goal: str, plan: dict, diffs: dict, root: str = ".") -
         # Source tracking — helps Claude calibrate trust
         source = step.get("_source", "Ollama-local (auto-generated)")
 
-        body_parts.append(_STEP_TEMPLATE.format(
+        yield _STEP_TEMPLATE.format(
             id             = sid,
             total          = len(approved_steps),
             title          = step.get("title", f"Step {sid}"),
@@ -167,7 +191,7 @@ def assemble_final_prompt(goal: str, plan: dict, diffs: dict, root: str = ".") -
             description    = desc,
             criteria_lines = criteria_lines,
             diff           = diff.strip(),
-        ))
+        )
 
         # Build validation checklist entry for footer
         for c in criteria:
@@ -180,7 +204,7 @@ def assemble_final_prompt(goal: str, plan: dict, diffs: dict, root: str = ".") -
         skip_lines = "\n".join(
             f"  - Step {s['id']}: {s.get('title', '')}" for s in skipped_steps
         )
-        body_parts.append(
+        yield (
             f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
             f"SKIPPED STEPS (do not apply)\n"
             f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
@@ -189,6 +213,4 @@ def assemble_final_prompt(goal: str, plan: dict, diffs: dict, root: str = ".") -
 
     validation_checklist = "\n".join(checklist_lines) if checklist_lines else "  (no criteria specified)"
 
-    footer = _FOOTER.format(validation_checklist=validation_checklist)
-
-    return header + "".join(body_parts) + footer
+    yield _FOOTER.format(validation_checklist=validation_checklist)
@@ -10,16 +10,107 @@ Provides three functions used by planner.py and executor.py:
 import os
 import re
 import json
+import hashlib
 import subprocess
 import pathlib
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from ai_build.storage import get_repo_file_tree, IGNORE_DIRS, IGNORE_EXTENSIONS
+from ai_build.storage import cached_repo_file_tree, AI_BUILD_DIR, IGNORE_DIRS, IGNORE_EXTENSIONS
 
 
 # ---------------------------------------------------------------------------
 # Stack detection
 # ---------------------------------------------------------------------------
 
+# Files whose (mtime, size) key the on-disk stack cache
+_STACK_MANIFESTS = (
+    "requirements.txt", "pyproject.toml", "setup.py",
+    "package.json", "composer.json", "Gemfile",
+)
+_STACK_CACHE_FILE = "stack.json"
+
+# root → (root mtime_ns, manifests known to be absent at that mtime)
+_MANIFEST_NEG_CACHE: dict[str, tuple[int, frozenset[str]]] = {}
+
+# Requirement name at the start of a line; comment lines never match the
+# leading-letter anchor.  Works on raw bytes so no decode pass is needed.
+_REQ_DEP_RE = re.compile(rb"(?m)^[ \t]*([A-Za-z][A-Za-z0-9_.\-]*)[ \t]*(?=[>=<!~;\[\s@,]|$)")
+# Quoted "name>=..." specifiers anywhere in pyproject.toml
+_PYPROJECT_DEP_RE = re.compile(rb'"([A-Za-z][A-Za-z0-9_\-]+)\s*[>=<!]')
+
+# Python distribution name → display label; dict order is the tag order
+_PY_FRAMEWORKS = {
+    "django":        "Django",
+    "flask":         "Flask",
+    "fastapi":       "FastAPI",
+    "tornado":       "Tornado",
+    "starlette":     "Starlette",
+    "aiohttp":       "aiohttp",
+    "pygame":        "pygame",
+    "pyside6":       "PySide6",
+    "pyside2":       "PySide2",
+    "pyqt6":         "PyQt6",
+    "pyqt5":         "PyQt5",
+    "kivy":          "Kivy",
+    "sqlalchemy":    "SQLAlchemy",
+    "peewee":        "Peewee",
+    "celery":        "Celery",
+    "dramatiq":      "Dramatiq",
+    "numpy":         "numpy",
+    "pandas":        "pandas",
+    "torch":         "PyTorch",
+    "tensorflow":    "TensorFlow",
+    "scikit-learn":  "scikit-learn",
+    "scipy":         "scipy",
+    "pytest":        "pytest",
+    "click":         "Click",
+    "typer":         "Typer",
+    "pydantic":      "Pydantic",
+}
+
+# Build tooling that says nothing about the project itself
+_PY_DEP_NOISE = frozenset({"pip", "wheel", "setuptools", "pkg-resources"})
+
+
+def _stack_cache_key(root: pathlib.Path) -> str | None:
+    """
+    Hash (name, mtime_ns, size) of every manifest present, plus the root
+    directory's own mtime so top-level additions/removals also invalidate.
+    Returns None when no manifest exists — the extension-count fallback
+    depends on the whole tree and is not worth caching.
+
+    Manifests found missing are remembered against the root's mtime: a new
+    top-level file would change it, so until then they are not re-probed.
+    """
+    try:
+        root_mtime = os.stat(root).st_mtime_ns
+    except OSError:
+        root_mtime = None
+    neg = _MANIFEST_NEG_CACHE.get(str(root))
+    skip = neg[1] if neg is not None and neg[0] == root_mtime else frozenset()
+
+    stats = []
+    missing = set(skip)
+    for name in _STACK_MANIFESTS:
+        if name in skip:
+            continue
+        try:
+            st = os.stat(root / name)
+        except OSError:
+            missing.add(name)
+            continue
+        stats.append((name, st.st_mtime_ns, st.st_size))
+    if root_mtime is not None:
+        _MANIFEST_NEG_CACHE[str(root)] = (root_mtime, frozenset(missing))
+    if not stats:
+        return None
+    if root_mtime is not None:
+        stats.append((".", root_mtime, 0))
+    return hashlib.blake2b(repr(stats).encode(), digest_size=16).hexdigest()
+
+
 def detect_stack(project_root: str = ".") -> str:
     """
     Scan the project and return a human-readable description of the tech stack.
@@ -27,6 +118,11 @@ def detect_stack(project_root: str = ".") -> str:
     Checks: requirements.txt, pyproject.toml, setup.py, package.json,
             composer.json, Gemfile, *.csproj, and dominant file extensions.
 
+    The result is cached in .ai-build/stack.json and reused until one of the
+    manifest files (or the project root listing) changes.  Changes further
+    down the tree — a *.csproj added in a subfolder, say — are not noticed
+    until then.
+
     Examples:
         "Python 3, Flask, SQLAlchemy, pytest"
         "Node.js, React, TypeScript"
@@ -34,75 +130,87 @@ def detect_stack(project_root: str = ".") -> str:
         "primarily .rs, .toml files"
     """
     root = pathlib.Path(project_root).resolve()
-    tags: list[str] = []
+    key = _stack_cache_key(root)
+    cache_path = root / AI_BUILD_DIR / _STACK_CACHE_FILE
+    if key is not None and not cache_path.parent.is_dir():
+        # Creating .ai-build changes the root's mtime, which is part of the
+        # key — do it before the key is taken, or the next call misses
+        try:
+            os.makedirs(cache_path.parent, exist_ok=True)
+            key = _stack_cache_key(root)
+        except OSError:
+            pass
+
+    if key is not None:
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached.get("key") == key:
+                return cached["value"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    value = _detect_stack_uncached(root)
+
+    if key is not None:
+        try:
+            os.makedirs(cache_path.parent, exist_ok=True)
+            cache_path.write_text(json.dumps({"key": key, "value": value}), encoding="utf-8")
+        except OSError:
+            pass  # cache is best-effort
+    return value
+
+
+def _detect_stack_uncached(root: pathlib.Path) -> str:
+    """Run the full stack detection for *root* (see detect_stack)."""
+    # The manifest readers are independent and I/O bound, so run them side
+    # by side; results are collected in a fixed order to keep tags stable.
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        futures = [ex.submit(fn, root) for fn in (_python_tags, _js_tags, _php_tags, _ruby_tags)]
+        tags: list[str] = [tag for fut in futures for tag in fut.result()]
 
-    # ── Python ───────────────────────────────────────────────────────────────
+    # ── C# / .NET ────────────────────────────────────────────────────────────
+    if _has_ext_within(str(root), ".csproj"):
+        tags.append("C#/.NET")
+
+    # ── Fallback: dominant extensions ─────────────────────────────────────────
+    if not tags:
+        ext_count = _count_extensions(str(root))
+        if ext_count:
+            top = [ext for ext, _ in ext_count.most_common(3)]
+            tags.append(f"primarily {', '.join(top)} files")
+
+    return ", ".join(tags) if tags else "unknown stack"
+
+
+def _python_tags(root: pathlib.Path) -> list[str]:
+    """Tags for a Python project: the language plus recognised frameworks."""
+    tags: list[str] = []
     req_file  = root / "requirements.txt"
     pyproject = root / "pyproject.toml"
     setup_py  = root / "setup.py"
     has_python = (
         req_file.exists() or pyproject.exists() or setup_py.exists()
-        or bool(list(root.glob("*.py")))
+        or next(root.glob("*.py"), None) is not None
     )
 
     if has_python:
         tags.append("Python 3")
-        deps: set[str] = set()
-
-        if req_file.exists():
-            for line in req_file.read_text(errors="replace").splitlines():
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                dep = re.split(r"[>=<!;\[\s]", line)[0].strip().lower()
-                if dep:
-                    deps.add(dep)
-
-        if pyproject.exists():
-            for m in re.finditer(
-                r'"([a-zA-Z][a-zA-Z0-9_-]+)\s*[>=<!]',
-                pyproject.read_text(errors="replace"),
-            ):
-                deps.add(m.group(1).lower())
-
-        FRAMEWORK_MAP = {
-            "django":        "Django",
-            "flask":         "Flask",
-            "fastapi":       "FastAPI",
-            "tornado":       "Tornado",
-            "starlette":     "Starlette",
-            "aiohttp":       "aiohttp",
-            "pygame":        "pygame",
-            "pyside6":       "PySide6",
-            "pyside2":       "PySide2",
-            "pyqt6":         "PyQt6",
-            "pyqt5":         "PyQt5",
-            "kivy":          "Kivy",
-            "sqlalchemy":    "SQLAlchemy",
-            "peewee":        "Peewee",
-            "celery":        "Celery",
-            "dramatiq":      "Dramatiq",
-            "numpy":         "numpy",
-            "pandas":        "pandas",
-            "torch":         "PyTorch",
-            "tensorflow":    "TensorFlow",
-            "scikit-learn":  "scikit-learn",
-            "scipy":         "scipy",
-            "pytest":        "pytest",
-            "click":         "Click",
-            "typer":         "Typer",
-            "pydantic":      "Pydantic",
-        }
-        found_frameworks = [label for key, label in FRAMEWORK_MAP.items() if key in deps]
+        deps = _read_python_deps(root)
+        hits = deps & _PY_FRAMEWORKS.keys()
+        found_frameworks = [label for key, label in _PY_FRAMEWORKS.items() if key in hits] if hits else []
         tags.extend(found_frameworks)
 
         # If no recognised frameworks, list up to 6 deps
-        noise = {"pip", "wheel", "setuptools", "pkg-resources"}
-        other_deps = [d for d in sorted(deps) if d not in FRAMEWORK_MAP and d not in noise]
-        if other_deps and not found_frameworks:
-            tags.append(f"packages: {', '.join(other_deps[:6])}")
+        if not found_frameworks:
+            other_deps = sorted(deps - _PY_FRAMEWORKS.keys() - _PY_DEP_NOISE)
+            if other_deps:
+                tags.append(f"packages: {', '.join(other_deps[:6])}")
+    return tags
+
 
-    # ── JavaScript / Node.js ─────────────────────────────────────────────────
+def _js_tags(root: pathlib.Path) -> list[str]:
+    """Tags from package.json."""
+    tags: list[str] = []
     pkg_json = root / "package.json"
     if pkg_json.exists():
         try:
@@ -123,8 +231,12 @@ def detect_stack(project_root: str = ".") -> str:
             tags.extend(v for k, v in JS_FW.items() if k in all_deps)
         except Exception:
             tags.append("JavaScript/Node.js")
+    return tags
+
 
-    # ── PHP ──────────────────────────────────────────────────────────────────
+def _php_tags(root: pathlib.Path) -> list[str]:
+    """Tags from composer.json."""
+    tags: list[str] = []
     composer = root / "composer.json"
     if composer.exists():
         tags.append("PHP")
@@ -137,8 +249,12 @@ def detect_stack(project_root: str = ".") -> str:
                 tags.append("Symfony")
         except Exception:
             pass
+    return tags
+
 
-    # ── Ruby ─────────────────────────────────────────────────────────────────
+def _ruby_tags(root: pathlib.Path) -> list[str]:
+    """Tags from the Gemfile."""
+    tags: list[str] = []
     gemfile = root / "Gemfile"
     if gemfile.exists():
         tags.append("Ruby")
@@ -147,27 +263,86 @@ def detect_stack(project_root: str = ".") -> str:
             tags.append("Rails")
         elif "sinatra" in gf_text:
             tags.append("Sinatra")
+    return tags
 
-    # ── C# / .NET ────────────────────────────────────────────────────────────
-    if list(root.glob("*.csproj")) or list(root.glob("**/*.csproj")):
-        tags.append("C#/.NET")
 
-    # ── Fallback: dominant extensions ─────────────────────────────────────────
-    if not tags:
-        ext_count: dict[str, int] = {}
+def _read_python_deps(root: pathlib.Path) -> set[str]:
+    """Lower-cased dependency names from requirements.txt and pyproject.toml."""
+    deps: set[str] = set()
+    for name, pattern in (("requirements.txt", _REQ_DEP_RE),
+                          ("pyproject.toml", _PYPROJECT_DEP_RE)):
         try:
-            for f in root.rglob("*"):
-                if f.is_file() and not any(p in IGNORE_DIRS for p in f.parts):
-                    ext = f.suffix.lower()
-                    if ext and ext not in IGNORE_EXTENSIONS:
-                        ext_count[ext] = ext_count.get(ext, 0) + 1
-        except Exception:
-            pass
-        if ext_count:
-            top = sorted(ext_count, key=lambda x: -ext_count[x])[:3]
-            tags.append(f"primarily {', '.join(top)} files")
+            data = (root / name).read_bytes()
+        except OSError:
+            continue
+        for m in pattern.finditer(data):
+            deps.add(m.group(1).decode("ascii", "ignore").lower())
+    return deps
 
-    return ", ".join(tags) if tags else "unknown stack"
+
+def _count_extensions(root: str, budget: int = 20_000) -> Counter:
+    """
+    Count file extensions under *root* with an explicit os.scandir DFS.
+
+    IGNORE_DIRS are pruned at the directory level (never descended into) and
+    the walk stops after *budget* files, so huge trees cost a bounded amount
+    of I/O.  Dotfiles and extension-less names are skipped, like Path.suffix.
+    """
+    counts: Counter = Counter()
+    stack = [root]
+    while stack and budget > 0:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if e.name not in IGNORE_DIRS:
+                            stack.append(e.path)
+                        continue
+                    if not e.is_file():
+                        continue
+                except OSError:
+                    continue
+                budget -= 1
+                name = e.name
+                dot = name.rfind(".")
+                if 0 < dot < len(name) - 1:
+                    ext = name[dot:].lower()
+                    if ext not in IGNORE_EXTENSIONS:
+                        counts[ext] += 1
+                if budget <= 0:
+                    break
+    return counts
+
+
+def _has_ext_within(root: str, ext: str, max_depth: int = 4) -> bool:
+    """
+    True if a file ending in *ext* exists within *max_depth* directory levels
+    of *root*.  Stops at the first hit and never descends into IGNORE_DIRS,
+    so the common negative case stays cheap even on large trees.
+    """
+    stack = [(root, 0)]
+    while stack:
+        path, depth = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if depth < max_depth and e.name not in IGNORE_DIRS:
+                            stack.append((e.path, depth + 1))
+                        continue
+                except OSError:
+                    continue
+                if e.name.endswith(ext):
+                    return True
+    return False
 
 
 # ---------------------------------------------------------------------------
@@ -177,42 +352,150 @@ def detect_stack(project_root: str = ".") -> str:
 def build_file_tree(project_root: str = ".") -> str:
     """
     Return a clean directory listing string, excluding noise directories.
-    Delegates to storage.get_repo_file_tree which already applies all filters.
+    Delegates to storage.cached_repo_file_tree, which applies all filters and
+    reuses the last walk while no directory has changed.
     """
-    return get_repo_file_tree(project_root)
+    return cached_repo_file_tree(project_root)
 
 
 # ---------------------------------------------------------------------------
 # Git status
 # ---------------------------------------------------------------------------
 
-def get_git_status(project_root: str = ".") -> str:
+# project_root -> (key, stamp, summary).  The key tracks .git/index and
+# .git/HEAD; the TTL bounds staleness from unstaged edits, which touch neither.
+_GIT_CACHE: dict[str, tuple[tuple[int, int], float, str]] = {}
+_GIT_CACHE_TTL = 1.0
+
+
+def git_cache_key(project_root: str) -> tuple[int, int] | None:
+    """Return (index, HEAD) mtimes for cache validation, or None outside a repo."""
+    git_dir = os.path.join(project_root, ".git")
+    try:
+        return (
+            os.stat(os.path.join(git_dir, "index")).st_mtime_ns,
+            os.stat(os.path.join(git_dir, "HEAD")).st_mtime_ns,
+        )
+    except OSError:
+        return None
+
+
+def get_git_status(project_root: str = ".", force: bool = False) -> str:
     """
     Run `git status --short` and `git diff --stat`, return a concise summary
     string suitable for inclusion in a Claude prompt.
 
+    Repeated calls within a second are served from an in-process cache as
+    long as the index and HEAD are untouched; pass force=True to bypass it.
+
     Returns a safe fallback string if git is unavailable or not a repo.
     """
-    try:
-        status_proc = subprocess.run(
-            ["git", "status", "--short"],
-            capture_output=True, text=True, timeout=10, cwd=project_root,
+    cache_id = os.path.abspath(project_root)
+    key = git_cache_key(project_root)
+    now = time.monotonic()
+    if not force and key is not None:
+        hit = _GIT_CACHE.get(cache_id)
+        if hit is not None and hit[0] == key and now - hit[1] < _GIT_CACHE_TTL:
+            return hit[2]
+
+    summary = _git_status_uncached(project_root)
+    if key is not None:
+        # git status may refresh the index; re-key so the next call can hit.
+        _GIT_CACHE[cache_id] = (git_cache_key(project_root) or key, now, summary)
+    return summary
+
+
+# One machine-readable status call; --no-optional-locks keeps repeated calls
+# from contending for index.lock while other git processes are running.
+_GIT_STATUS_V2 = [
+    "git", "--no-optional-locks", "status",
+    "--porcelain=v2", "--branch", "-z", "--untracked-files=normal",
+]
+_GIT_DIFF_STAT = ["git", "--no-optional-locks", "diff", "--stat"]
+
+
+def _run_git(cmds: list[list[str]], cwd: str) -> list[tuple[int, str]]:
+    """
+    Start every command at once and collect (returncode, stdout) in order.
+    The commands only read the repo, so there is no reason to serialise the
+    fork/exec round trips.
+    """
+    procs = [
+        subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", errors="replace", cwd=cwd,
         )
-        diff_proc = subprocess.run(
-            ["git", "diff", "--stat"],
-            capture_output=True, text=True, timeout=10, cwd=project_root,
+        for cmd in cmds
+    ]
+    try:
+        outs = [p.communicate(timeout=10)[0] for p in procs]
+    except subprocess.TimeoutExpired:
+        for p in procs:
+            p.kill()
+            p.communicate()
+        raise
+    return [(p.returncode, out) for p, out in zip(procs, outs)]
+
+
+def _parse_porcelain_v2(raw: str) -> tuple[str | None, list[str]]:
+    """
+    Turn `status --porcelain=v2 --branch -z` output into the branch name and
+    `git status --short` style "XY path" lines.
+    """
+    branch = None
+    lines: list[str] = []
+    records = iter(raw.split("\0"))
+    for rec in records:
+        if not rec:
+            continue
+        kind = rec[0]
+        if kind == "#":
+            if rec.startswith("# branch.head "):
+                branch = rec[14:]
+        elif kind == "1":
+            # 1 XY sub mH mI mW hH hI path
+            fields = rec.split(" ", 8)
+            lines.append(f"{fields[1].replace('.', ' ')} {fields[8]}")
+        elif kind == "2":
+            # 2 XY sub mH mI mW hH hI Xscore path, then origPath as its own record
+            fields = rec.split(" ", 9)
+            orig = next(records, "")
+            lines.append(f"{fields[1].replace('.', ' ')} {orig} -> {fields[9]}")
+        elif kind == "u":
+            # u XY sub m1 m2 m3 mW h1 h2 h3 path
+            fields = rec.split(" ", 10)
+            lines.append(f"{fields[1]} {fields[10]}")
+        elif kind == "?":
+            lines.append(f"?? {rec[2:]}")
+    return branch, lines
+
+
+def _git_status_uncached(project_root: str) -> str:
+    try:
+        (status_rc, status_raw), (diff_rc, diff_out) = _run_git(
+            [_GIT_STATUS_V2, _GIT_DIFF_STAT], project_root,
         )
 
+        branch = None
+        if status_rc == 0:
+            branch, entries = _parse_porcelain_v2(status_raw)
+            out = "\n".join(entries)
+        else:
+            # Older git without porcelain v2 (or not a repo at all)
+            [(status_rc, out)] = _run_git([["git", "status", "--short"]], project_root)
+            out = out.strip()
+
         parts: list[str] = []
 
-        if status_proc.returncode == 0:
-            out = status_proc.stdout.strip()
+        if status_rc == 0:
+            if branch:
+                parts.append(f"Branch: {branch}")
             parts.append(f"Working tree:\n{out}" if out else "Working tree: clean (no uncommitted changes)")
         else:
             return "(not a git repository)"
 
-        if diff_proc.returncode == 0 and diff_proc.stdout.strip():
-            parts.append(f"Unstaged diff stats:\n{diff_proc.stdout.strip()}")
+        if diff_rc == 0 and diff_out.strip():
+            parts.append(f"Unstaged diff stats:\n{diff_out.strip()}")
 
         return "\n".join(parts)
 
@@ -10,12 +10,19 @@ This gives Ollama everything it needs to plan and generate patches:
   - current plan status
 """
 
+import heapq
+import io
 import os
+import re
 import pathlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
 from ai_build.storage import (
     get_repo_file_tree,
     load_plan,
+    stamps_unchanged,
     IGNORE_DIRS,
     IGNORE_DIR_PREFIXES,
     IGNORE_EXTENSIONS,
@@ -29,17 +36,28 @@ _KEY_FILES = [
     "requirements.txt", "pyproject.toml", "setup.py", "setup.cfg",
     "Makefile", "Dockerfile",
 ]
+_KEY_FILES_SET = frozenset(_KEY_FILES)
 _KEY_FILE_MAX_CHARS = 2_000
 
 # Source extensions whose file contents are included (up to _MAX_SOURCE_FILES)
-_SOURCE_EXTENSIONS = {
+_SOURCE_EXTENSIONS = frozenset({
     ".py", ".js", ".ts", ".jsx", ".tsx",
     ".go", ".rs", ".rb", ".java", ".cs", ".cpp", ".c", ".h",
     ".sh", ".bash", ".yaml", ".yml", ".toml", ".html", ".css",
-}
+})
 _SOURCE_FILE_MAX_CHARS = 3_000
+
+# Section rules used by context_to_text
+_KEY_SEP    = "─" * 6
+_SOURCE_SEP = "═" * 6
 _MAX_SOURCE_FILES = 25    # cap total number — prevents blowing up context
 
+# Common entrypoint file names
+_EP_NAMES = frozenset({
+    "main.py", "app.py", "server.py", "manage.py", "index.py",
+    "__main__.py", "cli.py", "run.py",
+})
+
 # Framework fingerprints (checked in requirements + file paths)
 _FRAMEWORK_PATTERNS = {
     "flask":    ["flask"],
@@ -53,6 +71,150 @@ _FRAMEWORK_PATTERNS = {
 }
 
 
+def _trie_pattern(words) -> str:
+    """
+    Regex source matching any of *words*, factored by shared prefix
+    ("next", "nextjs" → "next(?:js)?") so each position is tried against a
+    trie rather than every word in turn.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            return body + "?" if len(alts) > 1 else "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+
+# Every fingerprint in one trie-shaped pattern, so a single pass finds them
+# all.  Matches must not touch another letter/digit — "preact" is not React —
+# but "_" and "-" count as separators, so "flask_cors" still hits.
+_PATTERN_TO_FW = {p: fw for fw, pats in _FRAMEWORK_PATTERNS.items() for p in pats}
+_FW_RE = re.compile(
+    r"(?<![a-z0-9])(" + _trie_pattern(_PATTERN_TO_FW) + r")(?![a-z0-9])",
+    re.I,
+)
+
+# build_context results: (root, priority_files) → (mtime stamps, context
+# without plan).  Insertion-ordered; the oldest entry is evicted first.
+_CTX_CACHE: dict[tuple[str, frozenset[str]], tuple[dict[str, int], dict]] = {}
+_CTX_CACHE_MAX = 4
+
+
+# ---------------------------------------------------------------------------
+# File walk
+# ---------------------------------------------------------------------------
+
+def _ext(name: str) -> str:
+    """Lower-cased extension with its dot — same rules as PurePath.suffix."""
+    i = name.rfind(".")
+    return name[i:].lower() if 0 < i < len(name) - 1 else ""
+
+
+def _iter_files(root: str, dir_stamps: dict[str, int] | None = None):
+    """
+    Yield (rel_path, abs_path, ext, size, mtime_ns) for every non-ignored
+    file under *root*.  If *dir_stamps* is given, each visited directory's
+    mtime is recorded in it (taken before listing, so no change is missed).
+
+    A manual os.scandir walk: names, types and sizes come from the DirEntry
+    (no Path objects, no second stat per file), and each directory carries
+    its "/"-joined relative prefix so rel_path is one concatenation.
+    Entries come out in directory order — nothing is sorted per directory;
+    callers that need a stable order sort the result once.  Symlinked directories are listed but
+    not followed.
+    """
+    pending = deque([(root, "")])
+    while pending:
+        dirpath, rel_dir = pending.pop()
+        try:
+            if dir_stamps is not None:
+                dir_stamps[dirpath] = os.stat(dirpath).st_mtime_ns
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        subdirs: list[tuple[str, str]] = []
+        for entry in entries:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if (
+                    name not in IGNORE_DIRS
+                    and not name.endswith(".egg-info")
+                    and not name.startswith(IGNORE_DIR_PREFIXES)
+                    and not entry.is_symlink()
+                ):
+                    subdirs.append((entry.path, rel_dir + name + "/"))
+                continue
+            if name in IGNORE_FILENAMES or name.startswith(IGNORE_FILENAME_PREFIXES):
+                continue
+            ext = _ext(name)
+            if ext in IGNORE_EXTENSIONS:
+                continue
+            try:
+                st = entry.stat()
+                size, mtime_ns = st.st_size, st.st_mtime_ns
+            except OSError:
+                size, mtime_ns = 0, 0
+            yield rel_dir + name, entry.path, ext, size, mtime_ns
+        pending.extend(subdirs)
+
+
+def _read_prefix(path: str, max_chars: int) -> str:
+    """
+    Return the first *max_chars* characters of *path* (trailing whitespace
+    stripped), with a "...(truncated)" marker when the file is longer.
+
+    Only enough bytes to cover *max_chars* of UTF-8 are read, so a large file
+    costs the same as a small one.  Newlines are normalised like text mode.
+    """
+    nbytes = max_chars * 4 + 64
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        data = os.read(fd, nbytes)
+    finally:
+        os.close(fd)
+    text = data.decode("utf-8", errors="replace")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = text.rstrip()
+    if len(text) > max_chars or len(data) == nbytes:
+        return text[:max_chars] + "\n...(truncated)"
+    return text
+
+
+def _read_prefixes(jobs: list[tuple[str, int]]) -> list[str | None]:
+    """
+    _read_prefix over (path, max_chars) jobs, in order; None for unreadable
+    files.  More than two reads go through a small thread pool — the reads
+    are I/O bound and release the GIL, so cold-cache latency overlaps.
+    """
+    def one(job: tuple[str, int]) -> str | None:
+        try:
+            return _read_prefix(*job)
+        except Exception:
+            return None
+
+    if len(jobs) <= 2:
+        return [one(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        return list(ex.map(one, jobs))
+
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
@@ -65,102 +227,127 @@ def build_context(root: str = ".", priority_files: list[str] | None = None) -> d
     source_files even if they are large; they are prepended before the
     smallest-first selection so they are never evicted by the budget trimmer.
 
+    The scanned part is cached per (root, priority_files) and reused while
+    every walked directory and every file whose contents were included keeps
+    its mtime.  In-place edits to other files do not invalidate it, so their
+    sizes (used only to rank source files) may lag until a directory changes.
+    The plan summary is always read fresh.
+
     Returns a JSON-serialisable dict with:
       project_name, root, file_tree, files, architecture, key_files,
       source_files, plan.
     """
     root_path = pathlib.Path(root).resolve()
+    priority = frozenset(p.replace("\\", "/") for p in (priority_files or []))
+    key = (str(root_path), priority)
+
+    hit = _CTX_CACHE.get(key)
+    if hit is not None and stamps_unchanged(hit[0]):
+        ctx = hit[1]
+    else:
+        ctx, stamps = _scan_project(root_path, root, priority)
+        _CTX_CACHE.pop(key, None)
+        _CTX_CACHE[key] = (stamps, ctx)
+        while len(_CTX_CACHE) > _CTX_CACHE_MAX:
+            del _CTX_CACHE[next(iter(_CTX_CACHE))]
+
+    return {**ctx, "plan": _plan_summary()}
+
+
+def _scan_project(root_path: pathlib.Path, root: str, priority: frozenset[str]) -> tuple[dict, dict[str, int]]:
+    """
+    Walk, read and analyse the project (everything in build_context except
+    the plan).  Returns the context dict and the mtimes that validate it.
+    """
+    stamps: dict[str, int] = {}
+    file_mtimes: dict[str, int] = {}   # abs path → mtime, source/key files only
 
     # ── 1. Walk the file list ───────────────────────────────────────────────
     files: list[dict] = []
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        dirnames[:] = [
-            d for d in sorted(dirnames)
-            if d not in IGNORE_DIRS
-            and not d.endswith(".egg-info")
-            and not d.startswith(IGNORE_DIR_PREFIXES)
-        ]
-        for fname in sorted(filenames):
-            if fname in IGNORE_FILENAMES:
-                continue
-            if fname.startswith(IGNORE_FILENAME_PREFIXES):
-                continue
-            ext = pathlib.Path(fname).suffix.lower()
-            if ext in IGNORE_EXTENSIONS:
-                continue
-            fpath = pathlib.Path(dirpath) / fname
-            rel = str(fpath.relative_to(root_path)).replace("\\", "/")
-            try:
-                size = fpath.stat().st_size
-            except OSError:
-                size = 0
-            files.append({"path": rel, "type": ext.lstrip(".") or "unknown", "size": size})
-
-    # ── 2. Key file contents ────────────────────────────────────────────────
-    key_file_contents: dict[str, str] = {}
-    for fname in _KEY_FILES:
-        fpath = root_path / fname
-        if fpath.exists():
-            try:
-                content = fpath.read_text(encoding="utf-8", errors="replace").rstrip()
-                if len(content) > _KEY_FILE_MAX_CHARS:
-                    content = content[:_KEY_FILE_MAX_CHARS] + "\n...(truncated)"
-                key_file_contents[fname] = content
-            except Exception:
-                pass
-
-    # ── 3. Source file contents (priority files first, then smallest-first) ──
-    _priority = {p.replace("\\", "/") for p in (priority_files or [])}
-    source_candidates = [
-        f for f in files if f["type"] in {e.lstrip(".") for e in _SOURCE_EXTENSIONS}
-    ]
-    # Split into priority (preserve order given) and the rest (smallest first)
-    priority_entries = [f for f in source_candidates if f["path"] in _priority]
-    rest_entries     = sorted(
-        [f for f in source_candidates if f["path"] not in _priority],
-        key=lambda f: f["size"],
+    source_candidates: list[dict] = []
+    key_paths: dict[str, str] = {}   # top-level key file name → abs path
+    source_paths: dict[str, str] = {}   # source file rel path → abs path
+    # Architecture signals gathered in the same pass (used in steps 4–5)
+    exts_seen: set[str] = set()
+    top_dirs_seen: set[str] = set()
+    entrypoints: list[str] = []
+    path_haystack: list[str] = []
+    for rel, abs_path, ext, size, mtime_ns in _iter_files(str(root_path), stamps):
+        entry = {"path": rel, "type": ext[1:] or "unknown", "size": size}
+        files.append(entry)
+        if ext in _SOURCE_EXTENSIONS:
+            source_candidates.append(entry)
+            source_paths[rel] = abs_path
+            file_mtimes[abs_path] = mtime_ns
+        exts_seen.add(ext)
+        path_haystack.append(rel)
+        top, sep, name = rel.rpartition("/")
+        if sep:
+            top_dirs_seen.add(top.partition("/")[0])
+        elif rel in _KEY_FILES_SET:   # a bare name, so it sits at the root
+            key_paths[rel] = abs_path
+            file_mtimes[abs_path] = mtime_ns
+        if name in _EP_NAMES:
+            entrypoints.append(rel)
+
+    # The walk is unordered; one sort by path keeps prompts deterministic.
+    files.sort(key=itemgetter("path"))
+    entrypoints.sort()
+
+    # ── 2. Key files, in _KEY_FILES order ──────────────────────────────────
+    key_jobs = [(fname, key_paths[fname]) for fname in _KEY_FILES if fname in key_paths]
+
+    # ── 3. Source files (priority files first, then smallest-first) ──────────
+    # Priority files in path order, then the smallest of the rest (ties by
+    # path).  nsmallest keeps a bounded heap, so only the handful that can
+    # still fit are ever ordered — not every candidate in the tree.
+    priority_entries = sorted(
+        (f for f in source_candidates if f["path"] in priority),
+        key=itemgetter("path"),
+    )[:_MAX_SOURCE_FILES]
+    rest_entries = heapq.nsmallest(
+        _MAX_SOURCE_FILES - len(priority_entries),
+        (f for f in source_candidates if f["path"] not in priority),
+        key=itemgetter("size", "path"),
     )
-    selected = (priority_entries + rest_entries)[:_MAX_SOURCE_FILES]
-    source_contents: dict[str, str] = {}
-    for f in selected:
-        fpath = root_path / f["path"]
-        try:
-            content = fpath.read_text(encoding="utf-8", errors="replace").rstrip()
-            if len(content) > _SOURCE_FILE_MAX_CHARS:
-                content = content[:_SOURCE_FILE_MAX_CHARS] + "\n...(truncated)"
-            source_contents[f["path"]] = content
-        except Exception:
-            pass
+    selected = priority_entries + rest_entries
+
+    # Read both sets in one batch (overlapped when there are enough of them)
+    jobs = [(path, _KEY_FILE_MAX_CHARS) for _, path in key_jobs]
+    jobs += [(source_paths[f["path"]], _SOURCE_FILE_MAX_CHARS) for f in selected]
+    for path, _ in jobs:
+        stamps[path] = file_mtimes[path]
+    texts = _read_prefixes(jobs)
+    key_file_contents: dict[str, str] = {
+        fname: text for (fname, _), text in zip(key_jobs, texts) if text is not None
+    }
+    source_contents: dict[str, str] = {
+        f["path"]: text for f, text in zip(selected, texts[len(key_jobs):]) if text is not None
+    }
 
     # ── 4. Architecture detection ───────────────────────────────────────────
-    all_exts = {pathlib.Path(f["path"]).suffix.lower() for f in files}
     languages: list[str] = []
-    if ".py" in all_exts:
+    if ".py" in exts_seen:
         languages.append("python")
-    if ".js" in all_exts or ".ts" in all_exts:
+    if ".js" in exts_seen or ".ts" in exts_seen:
         languages.append("javascript/typescript")
-    if ".go" in all_exts:
+    if ".go" in exts_seen:
         languages.append("go")
-    if ".rs" in all_exts:
+    if ".rs" in exts_seen:
         languages.append("rust")
-    if ".rb" in all_exts:
+    if ".rb" in exts_seen:
         languages.append("ruby")
-    if ".java" in all_exts:
+    if ".java" in exts_seen:
         languages.append("java")
 
-    haystack = (
-        " ".join(key_file_contents.values()).lower()
-        + " ".join(f["path"] for f in files).lower()
-    )
-    frameworks: list[str] = [
-        name for name, patterns in _FRAMEWORK_PATTERNS.items()
-        if any(p in haystack for p in patterns)
-    ]
-
-    # entrypoints — common names
-    _EP_NAMES = {"main.py", "app.py", "server.py", "manage.py", "index.py",
-                 "__main__.py", "cli.py", "run.py"}
-    entrypoints = [f["path"] for f in files if pathlib.Path(f["path"]).name in _EP_NAMES]
+    # Scan each key file, then all paths, as they are — _FW_RE is
+    # case-insensitive, so nothing is lowered or concatenated with the contents.
+    found: set[str] = set()
+    for text in (*key_file_contents.values(), "\n".join(path_haystack)):
+        found.update(_PATTERN_TO_FW[m.group(1).lower()] for m in _FW_RE.finditer(text))
+        if len(found) == len(_FRAMEWORK_PATTERNS):
+            break   # every framework already seen
+    frameworks: list[str] = [name for name in _FRAMEWORK_PATTERNS if name in found]
 
     # ── 5. Architecture summary + conventions (auto-detected) ─────────────
     # Style conventions: infer from file tree + key file content
@@ -171,7 +358,7 @@ def build_context(root: str = ".", priority_files: list[str] | None = None) -> d
         naming_convention = "PascalCase / camelCase"
 
     # Folder structure inference
-    top_dirs = sorted({f["path"].split("/")[0] for f in files if "/" in f["path"]})
+    top_dirs = sorted(top_dirs_seen)
     folder_desc = ", ".join(top_dirs[:8]) if top_dirs else "flat"
 
     arch_parts: list[str] = []
@@ -189,25 +376,6 @@ def build_context(root: str = ".", priority_files: list[str] | None = None) -> d
         "style":            "pep8" if "python" in languages else "standard",
     }
 
-    # ── 6. Plan summary ─────────────────────────────────────────────────────
-    plan = load_plan()
-    plan_summary: dict | None = None
-    if plan:
-        _ICON = {"applied": "✓", "skipped": "~", "pending": "·",
-                 "in_progress": "►", "failed": "✗"}
-        plan_summary = {
-            "goal": plan.get("goal", ""),
-            "steps": [
-                {
-                    "id": s["id"],
-                    "title": s["title"],
-                    "status": s.get("status", "pending"),
-                    "icon": _ICON.get(s.get("status", "pending"), "·"),
-                }
-                for s in plan.get("steps", [])
-            ],
-        }
-
     return {
         "project_name":       root_path.name,
         "root":               str(root_path),
@@ -222,7 +390,27 @@ def build_context(root: str = ".", priority_files: list[str] | None = None) -> d
         "conventions":     conventions,
         "key_files":       key_file_contents,
         "source_files":    source_contents,
-        "plan":            plan_summary,
+    }, stamps
+
+
+def _plan_summary() -> dict | None:
+    """Compact view of the current plan (never cached — statuses move)."""
+    plan = load_plan()
+    if not plan:
+        return None
+    _ICON = {"applied": "✓", "skipped": "~", "pending": "·",
+             "in_progress": "►", "failed": "✗"}
+    return {
+        "goal": plan.get("goal", ""),
+        "steps": [
+            {
+                "id": s["id"],
+                "title": s["title"],
+                "status": s.get("status", "pending"),
+                "icon": _ICON.get(s.get("status", "pending"), "·"),
+            }
+            for s in plan.get("steps", [])
+        ],
     }
 
 
@@ -238,56 +426,59 @@ def context_to_text(ctx: dict, max_chars: int = 16_000) -> str:
     prompt template and model response in an 8 192-token context window.
     (Previously 28 000 — too tight for gemma3:4b; prompted truncation.)
     """
-    parts: list[str] = []
+    buf = io.StringIO()
+    n = 0   # characters written so far
 
-    parts.append(f"PROJECT : {ctx['project_name']}")
-    parts.append(f"ROOT    : {ctx['root']}")
+    def w(text: str) -> None:
+        nonlocal n
+        buf.write(text)
+        n += len(text)
+
+    # Header lines; every later section starts with its own "\n"
+    w(f"PROJECT : {ctx['project_name']}")
+    w(f"\nROOT    : {ctx['root']}")
 
     arch = ctx.get("architecture", {})
     if arch.get("languages"):
-        parts.append(f"LANG    : {', '.join(arch['languages'])}")
+        w(f"\nLANG    : {', '.join(arch['languages'])}")
     if arch.get("frameworks"):
-        parts.append(f"STACK   : {', '.join(arch['frameworks'])}")
+        w(f"\nSTACK   : {', '.join(arch['frameworks'])}")
     if arch.get("entrypoints"):
-        parts.append(f"ENTRY   : {', '.join(arch['entrypoints'])}")
+        w(f"\nENTRY   : {', '.join(arch['entrypoints'])}")
     if ctx.get("architecture_summary"):
-        parts.append(f"SUMMARY : {ctx['architecture_summary']}")
+        w(f"\nSUMMARY : {ctx['architecture_summary']}")
 
     conv = ctx.get("conventions", {})
     if conv:
-        parts.append(
-            f"CONVENTIONS: naming={conv.get('naming','?')}, "
+        w(
+            f"\nCONVENTIONS: naming={conv.get('naming','?')}, "
             f"style={conv.get('style','?')}, "
             f"folders={conv.get('folder_structure','?')}"
         )
 
-    parts.append(f"\nFILE TREE:\n{ctx['file_tree']}")
+    w(f"\n\nFILE TREE:\n{ctx['file_tree']}")
 
     for fname, content in ctx.get("key_files", {}).items():
-        parts.append(f"\n{'─'*6} {fname} {'─'*6}\n{content}")
+        w(f"\n\n{_KEY_SEP} {fname} {_KEY_SEP}\n{content}")
 
     if ctx.get("plan"):
         plan = ctx["plan"]
-        parts.append(f"\nPROJECT GOAL: {plan['goal']}")
-        step_lines = [
-            f"  {s['icon']} Step {s['id']}: {s['title']} [{s['status']}]"
-            for s in plan["steps"]
-        ]
-        parts.append("PLAN:\n" + "\n".join(step_lines))
-
-    base_text = "\n".join(parts)
+        w(f"\n\nPROJECT GOAL: {plan['goal']}\nPLAN:")
+        for s in plan["steps"]:
+            w(f"\n  {s['icon']} Step {s['id']}: {s['title']} [{s['status']}]")
 
     # Budget remaining after the skeleton
-    remaining = max_chars - len(base_text)
-
-    source_parts: list[str] = []
-    for fpath, content in ctx.get("source_files", {}).items():
-        block = f"\n{'═'*6} {fpath} {'═'*6}\n{content}"
-        if remaining - len(block) < 200:
-            # Not enough room — skip remaining source files
-            source_parts.append(f"\n[{len(ctx['source_files']) - len(source_parts)} more source files omitted to stay within context budget]")
+    remaining = max_chars - n
+
+    sources = list(ctx.get("source_files", {}).items())
+    for i, (fpath, content) in enumerate(sources):
+        block = f"\n{_SOURCE_SEP} {fpath} {_SOURCE_SEP}\n{content}"
+        blen = len(block)
+        if remaining - blen < 200:
+            # Not enough room — skip this and the remaining source files
+            w(f"\n[{len(sources) - i} more source files omitted to stay within context budget]")
             break
-        source_parts.append(block)
-        remaining -= len(block)
+        w(block)
+        remaining -= blen
 
-    return base_text + "".join(source_parts)
+    return buf.getvalue()
@@ -4,12 +4,18 @@ then waits for you to paste the unified diff back. Sends the diff to Ollama for
 No API keys required.
 """
 
+import functools
+import os
+import re
+
 from ai_build.storage import (
     load_plan,
     update_step_status,
     save_patch,
     save_prompt,
     read_files,
+    patch_path,
+    queued_text,
 )
 from ai_build.reviewer import review_patch
 from ai_build.context import detect_stack, build_file_tree, get_git_status
@@ -69,10 +75,36 @@ For an existing file:
 ════════════════════════════════════════════════"""
 
 
+# A genuine --- a/ ... +++ b/ (or /dev/null) header pair, not just --- / +++
+# appearing inside string literals or prose.
+_DIFF_RE = re.compile(r"^--- (?:a/|/dev/null).+\n\+\+\+ (?:b/|/dev/null)", re.MULTILINE)
+
+
+# Statuses whose steps count as "done" for the previous-steps summary
+_DONE_STATUSES = frozenset({"applied", "approved", "skipped"})
+
+# How much of each prior diff the previous-steps summary quotes
+_SNIPPET_CHARS = 800
+
+# abs patch path → (mtime_ns, size, snippet, truncated)
+_PATCH_SNIPPET_CACHE: dict[str, tuple[int, int, str, bool]] = {}
+
+
 # ---------------------------------------------------------------------------
 # Context helpers
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=256)
+def _read_file_cached(path: str, mtime_ns: int, size: int) -> str:
+    """
+    Read *path* as text.  mtime_ns/size are part of the cache key only, so a
+    file re-read across retries and steps is served from memory until it
+    changes on disk.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        return fh.read()
+
+
 def _previous_steps_summary(plan: dict, current_step_id: int) -> str:
     """
     Return a brief summary of all steps completed before current_step_id,
@@ -80,12 +112,9 @@ def _previous_steps_summary(plan: dict, current_step_id: int) -> str:
     Only includes steps with status applied/approved/skipped.
     Returns an empty string if there are no prior completed steps.
     """
-    from ai_build.storage import load_patch
-
-    done_statuses = {"applied", "approved", "skipped"}
     prior = [
         s for s in plan.get("steps", [])
-        if s["id"] < current_step_id and s.get("status") in done_statuses
+        if s["id"] < current_step_id and s.get("status") in _DONE_STATUSES
     ]
     if not prior:
         return ""
@@ -97,10 +126,10 @@ def _previous_steps_summary(plan: dict, current_step_id: int) -> str:
         lines.append(f"    Files touched: {files}")
         if status != "skipped":
             try:
-                diff_text = load_patch(s["id"])
-                if diff_text:
-                    snippet = diff_text.strip()[:800]
-                    if len(diff_text.strip()) > 800:
+                found = _patch_snippet(s["id"])
+                if found and found[0]:
+                    snippet, truncated = found
+                    if truncated:
                         snippet += "\n    ...(truncated)"
                     lines.append(f"    Change applied (first 800 chars):\n{snippet}")
             except Exception:
@@ -109,16 +138,58 @@ def _previous_steps_summary(plan: dict, current_step_id: int) -> str:
 
 
 
+def _patch_snippet(step_id: int) -> tuple[str, bool] | None:
+    """
+    Return (first _SNIPPET_CHARS of the stripped diff, was_truncated) for a
+    saved step patch, or None if there is none.  Only a bounded prefix of the
+    file is read, and the result is cached until the patch file changes.
+    A patch still queued on the background writer is used as queued.
+    """
+    path = os.path.abspath(patch_path(step_id))
+    nbytes = _SNIPPET_CHARS * 4 + 64   # enough bytes for _SNIPPET_CHARS of UTF-8
+    queued = queued_text(path)
+    if queued is not None:
+        return _snippet(queued.encode("utf-8")[:nbytes], nbytes)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    hit = _PATCH_SNIPPET_CACHE.get(path)
+    if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2], hit[3]
+
+    with open(path, "rb") as fh:
+        data = fh.read(nbytes)
+    snippet, truncated = _snippet(data, nbytes)
+    _PATCH_SNIPPET_CACHE[path] = (st.st_mtime_ns, st.st_size, snippet, truncated)
+    return snippet, truncated
+
+
+def _snippet(data: bytes, nbytes: int) -> tuple[str, bool]:
+    """(first _SNIPPET_CHARS of the stripped text, was_truncated) for a patch's first *nbytes*."""
+    text = data.decode("utf-8", errors="replace")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = text.strip()
+    truncated = len(text) > _SNIPPET_CHARS or len(data) == nbytes
+    return text[:_SNIPPET_CHARS], truncated
+
+
 def _build_patch_prompt(
     step: dict,
     plan: dict | None = None,
     extra_instructions: str = "",
     previous_draft: str = "",
     previous_review: dict | None = None,
+    stack: str | None = None,
+    file_tree: str | None = None,
 ) -> str:
     """
     Assemble the complete prompt the user will paste into Claude.
 
+    `stack` / `file_tree` may be passed in by callers that build many prompts
+    in a row (run_all_steps); they are detected here when omitted.
+
     Incorporates:
     - Tech stack and project structure (context.py)
     - Git working-tree status (context.py)
@@ -135,8 +206,10 @@ def _build_patch_prompt(
     instructions = RETRY_PATCH_INSTRUCTIONS if is_retry else PATCH_INSTRUCTIONS
 
     # ── Stack + project structure ─────────────────────────────────────────────
-    stack = detect_stack(".")
-    file_tree = build_file_tree(".")
+    if stack is None:
+        stack = detect_stack(".")
+    if file_tree is None:
+        file_tree = build_file_tree(".")
 
     # ── Git status ────────────────────────────────────────────────────────────
     git_status = get_git_status(".")
@@ -148,11 +221,13 @@ def _build_patch_prompt(
         sep = "─" * 40
         if not path:
             continue
-        import os
-        if os.path.exists(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None:
             try:
-                with open(path, "r", encoding="utf-8", errors="replace") as fh:
-                    content = fh.read()
+                content = _read_file_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size)
                 files_block_parts.append(
                     f"{sep}\nFile: {path}\n{sep}\n{content}"
                 )
@@ -274,6 +349,8 @@ def _collect_patch_from_user(
     previous_draft: str = "",
     previous_review: dict | None = None,
     open_browser: bool = True,
+    stack: str | None = None,
+    file_tree: str | None = None,
 ) -> str:
     """Generate prompt, show it, wait for the user to paste the diff back."""
     prompt = _build_patch_prompt(
@@ -282,6 +359,8 @@ def _collect_patch_from_user(
         extra_instructions=extra_instructions,
         previous_draft=previous_draft,
         previous_review=previous_review,
+        stack=stack,
+        file_tree=file_tree,
     )
 
     step_id = step["id"]
@@ -314,22 +393,28 @@ def _collect_patch_from_user(
 
 def _strip_code_fences(text: str) -> str:
     """Remove markdown code fences if Claude wrapped the diff in them."""
-    if text.startswith("```"):
-        lines = text.splitlines()
-        end = len(lines) - 1 if lines[-1].strip() == "```" else len(lines)
-        return "\n".join(lines[1:end]).strip()
-    return text
+    if not text.startswith("```"):
+        return text
+    # Slice between the opening fence line and a closing ``` line, if any,
+    # without splitting the whole diff into a list of lines.
+    nl = text.find("\n")
+    if nl < 0:
+        return ""
+    body = text[nl + 1:]
+    end = len(body)
+    if body.endswith("\n"):
+        end -= 2 if body.endswith("\r\n") else 1
+    last = body.rfind("\n", 0, end) + 1
+    if body[last:end].strip() == "```":
+        body = body[:last]
+    if "\r" in body:
+        body = body.replace("\r\n", "\n")
+    return body.strip()
 
 
 def _looks_like_diff(text: str) -> bool:
     """Return True if the text contains a proper unified diff header sequence."""
-    # Require a genuine --- a/ ... +++ b/ (or /dev/null) header pair,
-    # not just --- / +++ appearing inside string literals or prose.
-    import re
-    return bool(re.search(
-        r'^--- (?:a/|/dev/null).+\n\+\+\+ (?:b/|/dev/null)',
-        text, re.MULTILINE
-    ))
+    return _DIFF_RE.search(text) is not None
 
 
 def run_all_steps(resume: bool = False):
@@ -343,6 +428,10 @@ def run_all_steps(resume: bool = False):
     print(f"Goal: {bold(plan['goal'])}")
     print(f"Total steps: {len(steps)}\n")
 
+    # Neither depends on the step; the tree is refreshed after each apply.
+    stack = detect_stack(".")
+    file_tree = build_file_tree(".")
+
     for step in steps:
         status = step.get("status", "pending")
 
@@ -378,6 +467,8 @@ def run_all_steps(resume: bool = False):
                 previous_draft=current_patch if attempt > 0 else "",
                 previous_review=current_review if attempt > 0 else None,
                 open_browser=(attempt == 0),
+                stack=stack,
+                file_tree=file_tree,
             )
             attempt += 1
 
@@ -428,6 +519,7 @@ def run_all_steps(resume: bool = False):
                 if success:
                     print(f"\n{green('Patch applied successfully.')}")
                     update_step_status(step["id"], "applied")
+                    file_tree = build_file_tree(".")
                     if _is_git_repo():
                         ok, commit_msg = commit_step(step["id"], step["title"])
                         if ok:
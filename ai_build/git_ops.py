@@ -2,20 +2,38 @@
 git_ops.py - Apply patches safely using git or a pure-Python fallback.
 """
 
+import io
 import subprocess
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_build.context import git_cache_key
+
+
+# Real paths already known to be inside a work tree.  Only positive answers
+# are kept: a folder can become a repo mid-session (the GUI's "Initialise
+# Git"), but a repo rarely stops being one.
+_GIT_REPO_ROOTS: set[str] = set()
 
 
 def _is_git_repo(root: str = ".") -> bool:
     """Check if *root* is inside a git repository."""
+    key = os.path.realpath(root)
+    if key in _GIT_REPO_ROOTS:
+        return True
     result = subprocess.run(
         ["git", "rev-parse", "--is-inside-work-tree"],
         capture_output=True,
         text=True,
         cwd=root,
     )
-    return result.returncode == 0
+    if result.returncode == 0:
+        _GIT_REPO_ROOTS.add(key)
+        return True
+    return False
 
 
 def apply_patch(patch_file: str, root: str = ".") -> tuple[bool, str]:
@@ -31,20 +49,17 @@ def apply_patch(patch_file: str, root: str = ".") -> tuple[bool, str]:
     """
     if not os.path.exists(patch_file):
         return False, f"Patch file not found: {patch_file}"
+    try:
+        return _apply_patch(patch_file, root)
+    finally:
+        # The working tree has (or may have) changed — re-read status next time
+        _forget_status(root)
 
-    if _is_git_repo(root):
-        # Dry-run first
-        dry = subprocess.run(
-            ["git", "apply", "--check", "--whitespace=nowarn", patch_file],
-            capture_output=True, text=True, cwd=root,
-        )
-        if dry.returncode != 0:
-            # git apply is strict about context lines matching exactly.
-            # Fall back to the Python patcher which is more tolerant —
-            # it trusts @@ line numbers and ignores context-line mismatches.
-            print("  git apply --check failed; trying Python patch fallback.")
-            return _apply_patch_python(patch_file, root)
 
+def _apply_patch(patch_file: str, root: str) -> tuple[bool, str]:
+    if _is_git_repo(root):
+        # No separate --check dry-run: git apply is all-or-nothing, so a
+        # failed apply leaves the tree untouched just like a failed check.
         result = subprocess.run(
             ["git", "apply", "--whitespace=nowarn", patch_file],
             capture_output=True, text=True, cwd=root,
@@ -52,8 +67,10 @@ def apply_patch(patch_file: str, root: str = ".") -> tuple[bool, str]:
         if result.returncode == 0:
             return True, "Patch applied successfully."
         err = result.stderr.strip() or result.stdout.strip()
-        # git apply passed the dry-run but failed for real — rare, but fall back.
-        print(f"  git apply failed after passing check; trying Python fallback: {err}")
+        # git apply is strict about context lines matching exactly.
+        # Fall back to the Python patcher which is more tolerant —
+        # it trusts @@ line numbers and ignores context-line mismatches.
+        print(f"  git apply failed; trying Python patch fallback: {err}")
         return _apply_patch_python(patch_file, root)
 
     # ── Pure-Python fallback (works on Windows without GNU patch) ──────────
@@ -61,86 +78,274 @@ def apply_patch(patch_file: str, root: str = ".") -> tuple[bool, str]:
     return _apply_patch_python(patch_file, root)
 
 
+# @@ -start[,count] +start[,count] @@ — matched against a single header line.
+# ASCII digits only; no group can backtrack into another.
+_HUNK_RE = re.compile(r"@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@", re.ASCII)
+
+
+def _split_file_blocks(patch_text: str) -> list[str]:
+    """
+    Split *patch_text* into per-file blocks, each starting at a `diff --git`
+    line.  Only the header occurrences are visited (str.find), so the text
+    between them is never split into lines.
+    """
+    blocks = []
+    start = 0
+    pos = patch_text.find("\ndiff --git ")
+    while pos != -1:
+        blocks.append(patch_text[start:pos + 1])
+        start = pos + 1
+        pos = patch_text.find("\ndiff --git ", start)
+    blocks.append(patch_text[start:])
+    return blocks
+
+
+def _line_starts(text: str, prefix: str):
+    """Yield the offset of every line in *text* that starts with *prefix*."""
+    if text.startswith(prefix):
+        yield 0
+    needle = "\n" + prefix
+    pos = text.find(needle)
+    while pos != -1:
+        yield pos + 1
+        pos = text.find(needle, pos + 1)
+
+
+def _parse_file_block(block: str) -> tuple[str | None, list[tuple[int, str]]]:
+    """
+    Returns the path named by the block's first `+++ ` header (without the
+    `b/` prefix; None if there is none) and a (0-based source start, body
+    text) pair per hunk.  A hunk body runs up to the next line starting with
+    `@@`, or the end of the block.
+
+    Only `+++ ` and `@@` lines are visited (str.find); bodies are sliced out
+    between them, never scanned.
+    """
+    rel_path = None
+    for pos in _line_starts(block, "+++ "):
+        eol = block.find("\n", pos)
+        name = block[pos + 4:eol if eol != -1 else len(block)]
+        if name:
+            if name.startswith("b/") and len(name) > 2:
+                name = name[2:]
+            rel_path = name.strip()
+            break
+
+    hunks: list[tuple[int, str]] = []
+    src_start = body_start = -1
+    for pos in _line_starts(block, "@@"):
+        if body_start >= 0:
+            hunks.append((src_start, block[body_start:pos]))
+            body_start = -1
+        eol = block.find("\n", pos)
+        if eol == -1:
+            break   # a header needs its newline; nothing follows anyway
+        m = _HUNK_RE.match(block, pos, eol)
+        if m:
+            src_start = int(m.group(1)) - 1
+            body_start = eol + 1
+    if body_start >= 0:
+        hunks.append((src_start, block[body_start:]))
+    return rel_path, hunks
+
+
+def _context_run(lines: list[str], start: int, stop: int) -> list[str]:
+    """
+    lines[start:stop], as reading each index in turn would see it: an
+    IndexError past the end, and a negative start (from an "@@ -0" header)
+    wrapping around like a single negative index does.
+    """
+    if 0 <= start and stop <= len(lines):
+        return lines[start:stop]
+    return [lines[i] for i in range(start, stop)]
+
+
+# Patched-file lines: path → (mtime_ns, size, lines).  Lets the next patch to
+# the same file start from memory; any other write changes the stat and
+# misses.  Insertion-ordered; the oldest entry is evicted first.
+_TARGET_CACHE: dict[str, tuple[int, int, list[str]]] = {}
+_TARGET_CACHE_MAX = 32
+_TARGET_CACHE_LOCK = threading.Lock()   # files are patched in parallel
+
+
+def _text_lines(text: str) -> list[str]:
+    """*text* split after each "\n" — what readlines() on a text-mode file gives."""
+    return io.StringIO(text).readlines()   # one C-level split, no translation
+
+
+def _read_text(path: str) -> str:
+    """
+    Whole-file equivalent of a text-mode read (UTF-8, errors replaced,
+    universal newlines): one binary read and one decode, which is several
+    times faster than TextIOWrapper.read() on non-ASCII text.
+    """
+    with open(path, "rb") as fh:
+        text = fh.read().decode("utf-8", errors="replace")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _read_target(target: str) -> list[str]:
+    """Lines of *target* ([] if it does not exist), from the cache when current."""
+    try:
+        st = os.stat(target)
+    except OSError:
+        return []
+    hit = _TARGET_CACHE.get(target)
+    if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    with open(target, encoding="utf-8", errors="replace") as fh:
+        return fh.readlines()
+
+
+def _remember_target(target: str, content: str) -> None:
+    """Cache *content*, just written to *target*, under the file's new stat."""
+    try:
+        st = os.stat(target)
+    except OSError:
+        return
+    lines = _text_lines(content)
+    with _TARGET_CACHE_LOCK:
+        _TARGET_CACHE.pop(target, None)
+        _TARGET_CACHE[target] = (st.st_mtime_ns, st.st_size, lines)
+        while len(_TARGET_CACHE) > _TARGET_CACHE_MAX:
+            del _TARGET_CACHE[next(iter(_TARGET_CACHE))]
+
+
+def _apply_hunks(lines: list[str], hunks: list[tuple[int, str]]) -> list[str]:
+    """
+    Return *lines* with *hunks* ((0-based source start, body) pairs, in
+    order) applied.  Trusts the @@ start lines rather than matching context;
+    raises IndexError when a hunk reaches past the end of the file.
+    """
+    new_lines = []
+    src_pos = 0  # 0-based index into `lines`
+
+    for src_start, body in hunks:
+        # Copy unchanged lines before this hunk
+        new_lines.extend(lines[src_pos:src_start])
+        src_pos = run_start = src_start
+
+        # Context lines are counted, then copied from the original
+        # as one slice when the run ends
+        for hl in body.splitlines(keepends=True):
+            first = hl[0]
+            if first == "+":
+                new_lines += _context_run(lines, run_start, src_pos)
+                new_lines.append(hl[1:])
+                run_start = src_pos
+            elif first == "-":
+                new_lines += _context_run(lines, run_start, src_pos)
+                src_pos += 1  # consume the original line
+                run_start = src_pos
+            else:
+                src_pos += 1
+        new_lines += _context_run(lines, run_start, src_pos)
+
+    # Copy any remaining lines after the last hunk
+    new_lines.extend(lines[src_pos:])
+    return new_lines
+
+
+def _apply_one_block(rel_path: str, target: str, hunks: list[tuple[int, str]]) -> tuple[bool, str | None]:
+    """
+    Apply one file block's *hunks* to *target*.  Returns (True, None) once
+    written, (False, error) on a hunk mismatch, (False, None) if there was
+    nothing to apply.
+    """
+    # Read existing file (may not exist for new files)
+    lines = _read_target(target)
+
+    # Apply hunks
+    if not hunks:
+        return False, None
+
+    try:
+        new_lines = _apply_hunks(lines, hunks)
+    except IndexError as exc:
+        return False, f"{rel_path}: hunk mismatch — {exc}"
+
+    # Write result
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    content = "".join(new_lines)
+    with open(target, "w", encoding="utf-8") as fh:
+        fh.write(content)
+    _remember_target(target, content)
+    return True, None
+
+
+def _target_path(root_norm: str, rel_path: str) -> str | None:
+    """
+    Path of *rel_path* under the normalised *root_norm*, or None when it is
+    absolute or has a ".." component and so could land outside the root.
+    Plain relative paths are joined directly; odd ones ("./x", "a//b",
+    trailing "/") still go through normpath.
+    """
+    if os.sep != "/":
+        rel_path = rel_path.replace("/", os.sep)
+    parts = rel_path.split(os.sep)
+    if ".." in parts or os.path.isabs(rel_path) or os.path.splitdrive(rel_path)[0]:
+        return None
+    if "" in parts or "." in parts:
+        return os.path.normpath(os.path.join(root_norm, rel_path))
+    if root_norm == ".":
+        return rel_path
+    return os.path.join(root_norm, rel_path) if root_norm.endswith(os.sep) else root_norm + os.sep + rel_path
+
+
 def _apply_patch_python(patch_file: str, root: str = ".") -> tuple[bool, str]:
     """
     Pure-Python unified diff applier.  Handles standard `--- a/` / `+++ b/`
     prefixes and strips one path component (equivalent to `patch -p1`).
     """
     try:
-        with open(patch_file, encoding="utf-8", errors="replace") as fh:
-            patch_text = fh.read()
+        patch_text = _read_text(patch_file)
     except OSError as exc:
         return False, f"Cannot read patch file: {exc}"
 
-    # Split into per-file blocks
-    file_blocks = re.split(r"(?=^diff --git |\A(?=--- ))", patch_text, flags=re.M)
-
-    applied = []
-    errors = []
-
-    for block in file_blocks:
+    root_norm = os.path.normpath(root)
+    # (rel_path, target, hunks) per file block, in patch order; target is
+    # None for a path that would leave the project root
+    jobs: list[tuple[str, str | None, list[tuple[int, str]]]] = []
+    for block in _split_file_blocks(patch_text):
         block = block.strip()
         if not block:
             continue
 
-        # Locate +++ header to get the target file path
-        m = re.search(r"^\+\+\+ (?:b/)?(.+)$", block, re.M)
-        if not m:
+        # Target path from the +++ header, and the hunks that follow it
+        rel_path, hunks = _parse_file_block(block)
+        if rel_path is None:
             continue
-        rel_path = m.group(1).strip()
         if rel_path == "/dev/null":
             continue  # deletion — skip for now
 
-        target = os.path.normpath(os.path.join(root, rel_path))
+        jobs.append((rel_path, _target_path(root_norm, rel_path), hunks))
 
-        # Read existing file (may not exist for new files)
-        if os.path.exists(target):
-            with open(target, encoding="utf-8", errors="replace") as fh:
-                lines = fh.readlines()
+    # Blocks for different files are independent: with several files, each
+    # file's blocks run in order on a small thread pool so the reads and
+    # writes overlap.  Results are collected back in patch order.
+    by_target: dict[str, list[int]] = {}
+    results: list[tuple[bool, str | None]] = [(False, None)] * len(jobs)
+    for i, (rel_path, target, _) in enumerate(jobs):
+        if target is None:
+            results[i] = (False, f"{rel_path}: path is outside the project root — refused")
         else:
-            lines = []
-
-        # Parse and apply hunks
-        hunks = list(re.finditer(
-            r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[^\n]*\n(.*?)(?=^@@|\Z)",
-            block, re.M | re.S,
-        ))
-        if not hunks:
-            continue
+            by_target.setdefault(target, []).append(i)
 
-        new_lines = []
-        src_pos = 0  # 0-based index into `lines`
-
-        try:
-            for hunk in hunks:
-                src_start = int(hunk.group(1)) - 1  # convert to 0-based
-                hunk_lines = hunk.group(5).splitlines(keepends=True)
-
-                # Copy unchanged lines before this hunk
-                new_lines.extend(lines[src_pos:src_start])
-                src_pos = src_start
-
-                for hl in hunk_lines:
-                    if hl.startswith("+"):
-                        new_lines.append(hl[1:])
-                    elif hl.startswith("-"):
-                        src_pos += 1  # consume the original line
-                    else:
-                        # context line — copy from original
-                        new_lines.append(lines[src_pos])
-                        src_pos += 1
-
-            # Copy any remaining lines after the last hunk
-            new_lines.extend(lines[src_pos:])
-        except IndexError as exc:
-            errors.append(f"{rel_path}: hunk mismatch — {exc}")
-            continue
+    def run_file(indices: list[int]) -> None:
+        for i in indices:
+            results[i] = _apply_one_block(*jobs[i])
 
-        # Write result
-        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
-        with open(target, "w", encoding="utf-8") as fh:
-            fh.writelines(new_lines)
-        applied.append(rel_path)
+    if len(by_target) <= 2:
+        for indices in by_target.values():
+            run_file(indices)
+    else:
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            list(ex.map(run_file, by_target.values()))
+
+    applied = [rel_path for (rel_path, _, _), (ok, _) in zip(jobs, results) if ok]
+    errors = [err for _, err in results if err]
 
     if errors:
         return False, "Patch errors:\n" + "\n".join(errors)
@@ -149,15 +354,61 @@ def _apply_patch_python(patch_file: str, root: str = ".") -> tuple[bool, str]:
     return True, f"Patch applied to: {', '.join(applied)}"
 
 
-def is_repo_clean(root: str = ".") -> bool:
-    """Return True if *root*'s working tree has no uncommitted changes."""
+# ---------------------------------------------------------------------------
+# Working-tree status — one `git status` shared by is_repo_clean and
+# get_git_diff, cached like context.get_git_status
+# ---------------------------------------------------------------------------
+
+# real path -> (.git index/HEAD key, stamp, returncode, porcelain v2 output)
+_STATUS_CACHE: dict[str, tuple[tuple[int, int], float, int, str]] = {}
+_STATUS_CACHE_TTL = 1.0
+
+
+def _porcelain_status(root: str) -> tuple[int, str]:
+    """
+    Return (returncode, `git status --porcelain=v2 -z` output) for *root*.
+    Calls within a second reuse the last result while .git/index and HEAD
+    are untouched; the patch/commit helpers below drop it when they write.
+    """
+    cache_id = os.path.realpath(root)
+    key = git_cache_key(root)
+    now = time.monotonic()
+    hit = _STATUS_CACHE.get(cache_id)
+    if key is not None and hit is not None and hit[0] == key and now - hit[1] < _STATUS_CACHE_TTL:
+        return hit[2], hit[3]
     result = subprocess.run(
-        ["git", "status", "--porcelain"],
+        ["git", "--no-optional-locks", "status", "--porcelain=v2", "-z"],
         capture_output=True,
         text=True,
         cwd=root,
     )
-    return result.returncode == 0 and result.stdout.strip() == ""
+    if key is not None:
+        _STATUS_CACHE[cache_id] = (git_cache_key(root) or key, now, result.returncode, result.stdout)
+    return result.returncode, result.stdout
+
+
+def _forget_status(root: str) -> None:
+    _STATUS_CACHE.pop(os.path.realpath(root), None)
+
+
+def is_repo_clean(root: str = ".") -> bool:
+    """Return True if *root*'s working tree has no uncommitted changes."""
+    returncode, out = _porcelain_status(root)
+    return returncode == 0 and out.strip() == ""
+
+
+# Extra config for the add + commit sequence: no auto-gc after the commit
+# and no fsync of the index/objects it writes.  Unknown keys are ignored by
+# older git versions.
+_COMMIT_GIT_CONFIG = "'gc.auto=0' 'core.fsync=none'"
+
+
+def _commit_env() -> dict[str, str]:
+    """os.environ with _COMMIT_GIT_CONFIG appended to GIT_CONFIG_PARAMETERS."""
+    env = os.environ.copy()
+    prev = env.get("GIT_CONFIG_PARAMETERS")
+    env["GIT_CONFIG_PARAMETERS"] = f"{prev} {_COMMIT_GIT_CONFIG}" if prev else _COMMIT_GIT_CONFIG
+    return env
 
 
 def commit_step(step_id: int, title: str, suggested_files: list[str] | None = None, root: str = ".") -> tuple[bool, str]:
@@ -173,22 +424,35 @@ def commit_step(step_id: int, title: str, suggested_files: list[str] | None = No
 
     Returns (success, message).
     """
+    env = _commit_env()
+
     # Stage tracked modified files
     stage = subprocess.run(
         ["git", "add", "-u"],
         capture_output=True,
         text=True,
         cwd=root,
+        env=env,
     )
     if stage.returncode != 0:
         return False, stage.stderr.strip() or stage.stdout.strip()
 
-    # Stage only the specific new files the patch was supposed to create
-    if suggested_files:
-        for fpath in suggested_files:
-            full = os.path.join(root, fpath) if not os.path.isabs(fpath) else fpath
-            if os.path.exists(full):
-                subprocess.run(["git", "add", fpath], capture_output=True, text=True, cwd=root)
+    # Stage only the specific new files the patch was supposed to create —
+    # one `git add` for all of them, so the index is rewritten once
+    existing = [
+        fpath for fpath in suggested_files or []
+        if os.path.exists(fpath if os.path.isabs(fpath) else os.path.join(root, fpath))
+    ]
+    if existing:
+        batch = subprocess.run(
+            ["git", "add", "--", *existing],
+            capture_output=True, text=True, cwd=root, env=env,
+        )
+        if batch.returncode != 0:
+            # A path git refuses outright (e.g. outside the repo) aborts the
+            # whole batch — stage the rest one by one, as before
+            for fpath in existing:
+                subprocess.run(["git", "add", "--", fpath], capture_output=True, text=True, cwd=root, env=env)
 
     commit_msg = f"ai-build step {step_id}: {title}"
     result = subprocess.run(
@@ -196,7 +460,9 @@ def commit_step(step_id: int, title: str, suggested_files: list[str] | None = No
         capture_output=True,
         text=True,
         cwd=root,
+        env=env,
     )
+    _forget_status(root)
     if result.returncode == 0:
         return True, result.stdout.strip()
     return False, result.stderr.strip() or result.stdout.strip()
@@ -204,8 +470,27 @@ def commit_step(step_id: int, title: str, suggested_files: list[str] | None = No
 
 def get_git_diff(files: list[str] | None = None, root: str = ".") -> str:
     """Return the current git diff for the given files, or all files."""
+    returncode, out = _porcelain_status(root)
+    if returncode == 0 and not _has_unstaged_changes(out):
+        return ""   # nothing differs from the index, whatever the pathspec
+
     cmd = ["git", "diff"]
     if files:
         cmd += ["--"] + files
     result = subprocess.run(cmd, capture_output=True, text=True, cwd=root)
     return result.stdout
+
+
+def _has_unstaged_changes(porcelain_v2: str) -> bool:
+    """True if any porcelain v2 entry has a working-tree (Y) change or is unmerged."""
+    records = iter(porcelain_v2.split("\0"))
+    for rec in records:
+        kind = rec[:1]
+        if kind == "u":
+            return True
+        if kind in ("1", "2"):
+            if rec[3:4] != ".":   # "1 XY ..." — Y is the working-tree status
+                return True
+            if kind == "2":
+                next(records, None)   # skip the rename's origPath record
+    return False
@@ -5,9 +5,11 @@ Replaces the Claude → paste-diff workflow with a single local call:
   diff_text, err = generate_patch_local(step, root=".")
 """
 
+import io
 import os
-import pathlib
 import re
+from bisect import bisect_right
+from itertools import accumulate
 
 # ---------------------------------------------------------------------------
 # Patcher-specific context builder
@@ -20,6 +22,22 @@ import re
 #   Remaining  ≈ 4 817 tokens (~19 000 chars) for the diff response — plenty.
 _PATCHER_CONTEXT_BUDGET = 12_000
 
+# Prior approved diffs: banner, and how much of each diff is shown
+_PRIOR_DIFFS_HEADER = "\n".join([
+    "\n" + "═" * 60,
+    "⚠ CRITICAL — THESE CHANGES ARE ALREADY IN THE CODEBASE ⚠",
+    "The files below already contain these changes. Do NOT recreate them.",
+    "Your diff must ADD TO or MODIFY what already exists — not replace it.",
+    "If a file was created in a prior step, it already exists. Do not use --- /dev/null for it.",
+    "═" * 60,
+])
+_PRIOR_DIFF_PREVIEW = 800
+
+# Identifier-like words (3+ chars) used as relevance keywords, minus filler
+_WORD_RE = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]{2,}\b')
+_STOPWORDS = frozenset({'a','an','the','and','or','in','on','to','of','for','with',
+                        'is','it','its','be','by','from','that','this','as','at','if'})
+
 def _patcher_context(step: dict, root: str, prior_diffs: dict | None = None) -> str:
     """
     Build a compact context string optimised for the patch generator.
@@ -33,36 +51,39 @@ def _patcher_context(step: dict, root: str, prior_diffs: dict | None = None) ->
     - Includes prior approved diffs so each step knows exactly what
       previous steps already changed (prevents conflicting patches).
     """
-    from ai_build.storage import get_repo_file_tree
+    from ai_build.storage import cached_repo_file_tree
 
-    root_path = pathlib.Path(root).resolve()
+    root_abs = os.path.realpath(root)
     parts: list[str] = []
     remaining = _PATCHER_CONTEXT_BUDGET
 
     # 1. File tree (lightweight — gives the model project orientation)
-    tree = get_repo_file_tree(root)
+    tree = cached_repo_file_tree(root)
     tree_block = f"FILE TREE:\n{tree}"
     parts.append(tree_block)
     remaining -= len(tree_block)
 
     # 2. Prior approved diffs — BEFORE file contents so Ollama sees them first
     #    and understands what already exists before reading the files.
+    #    The block is all-or-nothing: writing stops as soon as it no longer
+    #    fits, rather than building it whole and then discarding it.
     if prior_diffs:
-        prior_block_lines = ["\n" + "═" * 60]
-        prior_block_lines.append("⚠ CRITICAL — THESE CHANGES ARE ALREADY IN THE CODEBASE ⚠")
-        prior_block_lines.append("The files below already contain these changes. Do NOT recreate them.")
-        prior_block_lines.append("Your diff must ADD TO or MODIFY what already exists — not replace it.")
-        prior_block_lines.append("If a file was created in a prior step, it already exists. Do not use --- /dev/null for it.")
-        prior_block_lines.append("═" * 60)
+        buf = io.StringIO()
+        n = buf.write(_PRIOR_DIFFS_HEADER)
         for step_id, diff_text in sorted(prior_diffs.items()):
-            diff_preview = diff_text[:800]
-            if len(diff_text) > 800:
-                diff_preview += "\n...(diff truncated)"
-            prior_block_lines.append(f"\n--- Step {step_id} diff ---\n{diff_preview}")
-        prior_block = "\n".join(prior_block_lines)
-        if remaining > len(prior_block):
-            parts.append(prior_block)
-            remaining -= len(prior_block)
+            if n >= remaining:
+                break
+            if len(diff_text) > _PRIOR_DIFF_PREVIEW:
+                # Cut at the last line break inside the preview, so the
+                # model only sees whole diff lines
+                cut = diff_text.rfind("\n", 0, _PRIOR_DIFF_PREVIEW)
+                diff_preview = diff_text[:cut if cut > 0 else _PRIOR_DIFF_PREVIEW] + "\n...(diff truncated)"
+            else:
+                diff_preview = diff_text
+            n += buf.write(f"\n\n--- Step {step_id} diff ---\n{diff_preview}")
+        if remaining > n:
+            parts.append(buf.getvalue())
+            remaining -= n
 
     # 3. Read each suggested file, extracting only the relevant section for
     #    large files so Ollama can write accurate @@ line numbers.
@@ -70,21 +91,27 @@ def _patcher_context(step: dict, root: str, prior_diffs: dict | None = None) ->
         if remaining < 500:
             parts.append("[context budget exhausted — remaining suggested files omitted]")
             break
-        fpath = root_path / rel_path
+        full = os.path.join(root_abs, rel_path)
 
-        if not fpath.exists():
+        try:
+            os.stat(full)
+        except OSError:
             block = f"\n{'═' * 60}\nFILE: {rel_path}\n{'═' * 60}\n[NEW FILE — does not exist yet. Use --- /dev/null in diff header.]"
             parts.append(block)
             remaining -= len(block)
             continue
 
         try:
-            content = fpath.read_text(encoding="utf-8", errors="replace")
+            with open(full, "rb") as fh:
+                content = fh.read().decode("utf-8", errors="replace")
         except Exception:
             parts.append(f"\n[Could not read {rel_path}]")
             continue
+        if "\r" in content:   # newlines as text mode would give them
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
 
-        total_lines = len(content.splitlines())
+        lines = content.splitlines()
+        total_lines = len(lines)
 
         if total_lines <= 60:
             # Small file — send whole thing
@@ -92,15 +119,13 @@ def _patcher_context(step: dict, root: str, prior_diffs: dict | None = None) ->
             location_note = f"(full file — {total_lines} lines)"
         else:
             # Large file — extract the section most relevant to this step
-            section, start_line = _extract_relevant_section(
-                content,
+            start, end = _extract_relevant_section(
+                lines,
                 step.get("description", "") + " " + step.get("title", "")
             )
-            display = section
-            section_lines = len(section.splitlines())
-            end_line = start_line + section_lines - 1
+            display = "\n".join(lines[start:end])
             location_note = (
-                f"(EXCERPT lines {start_line}–{end_line} of {total_lines} total — "
+                f"(EXCERPT lines {start + 1}–{end} of {total_lines} total — "
                 f"write @@ headers relative to the FULL file line numbers)"
             )
 
@@ -120,13 +145,14 @@ def _patcher_context(step: dict, root: str, prior_diffs: dict | None = None) ->
     return "\n".join(parts)
 
 
-def _extract_relevant_section(content: str, description: str, context_lines: int = 25) -> tuple[str, int]:
+def _extract_relevant_section(lines: list[str], description: str, context_lines: int = 25) -> tuple[int, int]:
     """
-    Find the most relevant section of a file for a given step description.
+    Find the most relevant section of a file (given as its *lines*) for a
+    given step description.
 
-    Returns (section_text, start_line) where start_line is the 1-based line
-    number where the section begins in the original file, so Ollama can write
-    correct @@ headers.
+    Returns the section as a 0-based [start, end) line range, so the caller
+    can slice the lines it already has and report 1-based line numbers
+    (start + 1 to end) that let Ollama write correct @@ headers.
 
     Strategy:
     1. Score each line by how many words from the description appear near it
@@ -134,41 +160,52 @@ def _extract_relevant_section(content: str, description: str, context_lines: int
     3. Return that line plus context_lines above and below
     4. If no good match, return the end of the file (where new code goes)
     """
-    lines = content.splitlines()
     total = len(lines)
 
     if total <= context_lines * 2:
         # File is small enough to send whole
-        return content, 1
+        return 0, total
 
     # Extract keywords from description (ignore common words)
-    stopwords = {'a','an','the','and','or','in','on','to','of','for','with',
-                 'is','it','its','be','by','from','that','this','as','at','if'}
-    words = set(re.findall(r'\b[a-zA-Z_][a-zA-Z0-9_]{2,}\b', description.lower()))
-    keywords = words - stopwords
+    words = set(_WORD_RE.findall(description.lower()))
+    keywords = words - _STOPWORDS
 
     if not keywords:
         # No useful keywords — return end of file (where new code usually goes)
-        start = max(0, total - context_lines * 2)
-        section = '\n'.join(lines[start:])
-        return section, start + 1
+        return max(0, total - context_lines * 2), total
+
+    # Score each line by keyword proximity with decay: count the keywords on
+    # each line, then spread each line's count over its neighbours (weight
+    # 5 - distance).  Lines without a hit cost nothing in the second pass.
+    hits = _keyword_hits(lines, keywords)
 
-    # Score each line by keyword proximity with decay
     scores = [0] * total
-    for i, line in enumerate(lines):
-        line_lower = line.lower()
-        for kw in keywords:
-            if kw in line_lower:
-                for offset in range(-5, 6):
-                    idx = i + offset
-                    if 0 <= idx < total:
-                        scores[idx] += max(0, 5 - abs(offset))
+    for i, n in hits.items():
+        for idx in range(max(0, i - 4), min(total, i + 5)):
+            scores[idx] += n * (5 - abs(idx - i))
 
     best = scores.index(max(scores))
-    start = max(0, best - context_lines)
-    end = min(total, best + context_lines)
-    section = '\n'.join(lines[start:end])
-    return section, start + 1
+    return max(0, best - context_lines), min(total, best + context_lines)
+
+
+def _keyword_hits(lines: list[str], keywords: set[str]) -> dict[int, int]:
+    """
+    Map line index → number of *keywords* occurring (case-folded) on that
+    line; lines without any are left out.
+
+    One scan of the whole text with a trie regex of all keywords finds the
+    lines that have at least one (line numbers by bisecting the line
+    starts); only those lines are then tested keyword by keyword.
+    """
+    from ai_build.context_engine import _trie_pattern
+
+    lower_lines = [line.lower() for line in lines]
+    text = "\n".join(lower_lines)
+    starts = list(accumulate((len(line) + 1 for line in lower_lines[:-1]), initial=0))
+    kw_re = re.compile(_trie_pattern(keywords))
+
+    candidates = {bisect_right(starts, m.start()) - 1 for m in kw_re.finditer(text)}
+    return {i: sum(kw in lower_lines[i] for kw in keywords) for i in sorted(candidates)}
 
 
 # ---------------------------------------------------------------------------
@@ -238,6 +275,14 @@ PROJECT CONTEXT:
 # Diff sanitizer
 # ---------------------------------------------------------------------------
 
+# "- a/file" or "``` - a/file" — a --- header with the dashes lost
+_FENCE_DASH_RE = re.compile(r"^(?:```+\s*)?- a/")
+_FENCE_DASH_PREFIX_RE = re.compile(r"^(?:```+\s*)?-\s+")
+_PLUS_HDR_RE = re.compile(r"^\+\+\+ (?:b/|/dev/null)")
+# @@ -start[,count] +start[,count] @@tail — counts are recomputed
+_SANITIZE_HUNK_RE = re.compile(r"@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)")
+
+
 def _extract_diff(text: str) -> str | None:
     """
     Extract the real unified diff block from potentially noisy model output.
@@ -251,20 +296,19 @@ def _extract_diff(text: str) -> str | None:
     before extraction.
     """
     # ── Step 1: normalise the ``` - a/ → --- a/ hallucination ────────────
-    fixed_lines: list[str] = []
-    raw_lines = text.splitlines(keepends=True)
-    for i, line in enumerate(raw_lines):
-        stripped = line.rstrip("\n\r")
-        # Pattern: line starts with optional backtick-fence noise then "- a/"
-        # e.g. "``` - a/foo.py" or "- a/foo.py"  (model forgot the two extra dashes)
-        if re.match(r"^(?:```+\s*)?- a/", stripped):
-            # Only repair when the very next line looks like +++ b/
-            next_stripped = raw_lines[i + 1].rstrip("\n\r") if i + 1 < len(raw_lines) else ""
-            if re.match(r"^\+\+\+ (?:b/|/dev/null)", next_stripped):
-                repaired = re.sub(r"^(?:```+\s*)?-\s+", "--- ", stripped)
-                line = repaired + "\n"
-        fixed_lines.append(line)
-    text = "".join(fixed_lines)
+    # The broken header always contains "- a/" and always sits on the line
+    # just before a "+++ " header, so only those lines are examined.
+    if "- a/" in text:
+        raw_lines = text.splitlines(keepends=True)
+        for i in range(1, len(raw_lines)):
+            if not (raw_lines[i].startswith("+++ ") and _PLUS_HDR_RE.match(raw_lines[i])):
+                continue
+            # Pattern: line starts with optional backtick-fence noise then "- a/"
+            # e.g. "``` - a/foo.py" or "- a/foo.py"  (model forgot the two extra dashes)
+            stripped = raw_lines[i - 1].rstrip("\n\r")
+            if _FENCE_DASH_RE.match(stripped):
+                raw_lines[i - 1] = _FENCE_DASH_PREFIX_RE.sub("--- ", stripped, count=1) + "\n"
+        text = "".join(raw_lines)
 
     # ── Step 2: strip outer markdown code fences if present ──────────────
     if text.lstrip().startswith("```"):
@@ -280,19 +324,16 @@ def _extract_diff(text: str) -> str | None:
         text = "\n".join(inner_lines[start + 1:end])
 
     # ── Step 3: find the first valid --- / +++ header pair ───────────────
+    # A header is "--- " / "+++ " followed by a path: a/…, b/… and /dev/null
+    # all contain a "/", so one prefix test and one "/" test cover them.
     lines = text.splitlines(keepends=True)
-    for i, line in enumerate(lines):
-        stripped = line.rstrip("\n\r")
-        if not (stripped.startswith("--- a/") or stripped.startswith("--- /dev/null") or
-                (stripped.startswith("--- ") and "/" in stripped)):
-            continue
-        if i + 1 >= len(lines):
-            continue
-        next_line = lines[i + 1].rstrip("\n\r")
-        if not (next_line.startswith("+++ b/") or next_line.startswith("+++ /dev/null") or
-                (next_line.startswith("+++ ") and "/" in next_line)):
+    for i in range(len(lines) - 1):
+        line = lines[i]
+        if not (line.startswith("--- ") and "/" in line):
             continue
-        return "".join(lines[i:])
+        next_line = lines[i + 1]
+        if next_line.startswith("+++ ") and "/" in next_line:
+            return "".join(lines[i:])
 
     return None
 
@@ -308,50 +349,108 @@ def _sanitize_diff(text: str) -> str:
     3. Ensure the patch ends with a newline.
     """
     # 1. Normalise line endings
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-
-    lines = text.splitlines()
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    # 2. One walk over the text: everything outside @@ header lines is copied
+    #    through as slices; each header is rebuilt from the body that follows
+    #    it (up to the next @@ or file header line).  Body lines are counted
+    #    by their first character with str.count — no per-line Python loop.
+    n = len(text)
     out: list[str] = []
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        # Pass through file headers and non-hunk lines unchanged
-        if not line.startswith("@@"):
-            out.append(line)
-            i += 1
-            continue
-
-        # Collect hunk body (lines that follow until the next @@ or file header)
-        hunk_body: list[str] = []
-        j = i + 1
-        while j < len(lines) and not lines[j].startswith("@@") \
-                               and not lines[j].startswith("--- ") \
-                               and not lines[j].startswith("diff "):
-            hunk_body.append(lines[j])
-            j += 1
-
-        # Recalculate counts from actual body
-        orig_count = sum(1 for l in hunk_body if l.startswith(" ") or l.startswith("-"))
-        new_count  = sum(1 for l in hunk_body if l.startswith(" ") or l.startswith("+"))
+    copied = 0   # text[:copied] is already in out
+    upcoming: dict[str, int] = {}   # prefix → next line start with it
+
+    def next_line(prefix: str, at: int) -> int:
+        i = upcoming.get(prefix, -1)
+        if i < at:
+            i = upcoming[prefix] = _next_line_start(text, prefix, at)
+        return i
+
+    pos = next_line("@@", 0)
+    while pos < n:
+        eol = text.find("\n", pos)
+        if eol == -1:
+            eol = n
+        end = min(next_line("@@", eol + 1), next_line("--- ", eol + 1), next_line("diff ", eol + 1))
+
+        # Every body line follows a "\n" in text[eol:end]
+        ctx_count  = text.count("\n ", eol, end)
+        orig_count = ctx_count + text.count("\n-", eol, end)
+        new_count  = ctx_count + text.count("\n+", eol, end)
 
         # Extract the start positions from the existing @@ line
-        m = re.match(r"@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)", line)
+        m = _SANITIZE_HUNK_RE.match(text, pos, eol)
         if m:
             orig_start = m.group(1)
             new_start  = m.group(2)
             tail       = m.group(3)   # optional function-name hint
-            line = f"@@ -{orig_start},{orig_count} +{new_start},{new_count} @@{tail}"
+            out.append(text[copied:pos])
+            out.append(f"@@ -{orig_start},{orig_count} +{new_start},{new_count} @@{tail}")
+            copied = eol
 
-        out.append(line)
-        out.extend(hunk_body)
-        i = j
+        pos = next_line("@@", end)
 
-    result = "\n".join(out)
-    if not result.endswith("\n"):
+    out.append(text[copied:])
+    result = "".join(out)
+    if result.endswith("\n\n"):
+        result = result[:-1]   # as when the lines were re-joined: one trailing blank line goes
+    elif not result.endswith("\n"):
         result += "\n"
     return result
 
 
+# Lines that can follow a blank line inside a diff
+_DIFF_LINE_PREFIXES = (
+    " ", "+", "-", "@@", "\\", "diff ", "index ", "new file", "deleted file",
+    "old mode", "new mode", "similarity", "rename ", "Binary files",
+)
+
+
+def _scan_diff(chunks) -> str:
+    """
+    Join streamed model output, stopping as soon as a diff has clearly
+    ended, so the model's closing explanation is neither waited for nor
+    mistaken for hunk lines.
+
+    Once an @@ line has been seen, the text is cut before a ``` fence
+    line, or before a blank line that is followed by a non-diff line.
+    Everything up to that point is returned unchanged (all of it if the
+    output never ends that way).
+    """
+    text = ""
+    scanned = 0        # text[:scanned] holds the complete lines looked at so far
+    seen_hunk = False
+    blank_at = -1      # start of the run of blank lines just seen, if any
+    for chunk in chunks:
+        text += chunk
+        eol = text.find("\n", scanned)
+        while eol != -1:
+            line = text[scanned:eol]
+            if not seen_hunk:
+                seen_hunk = line.startswith("@@")
+            elif line.startswith("```"):
+                return text[:scanned]
+            elif not line.strip():
+                if blank_at == -1:
+                    blank_at = scanned
+            elif blank_at != -1 and not line.startswith(_DIFF_LINE_PREFIXES):
+                return text[:blank_at]
+            else:
+                blank_at = -1
+            scanned = eol + 1
+            eol = text.find("\n", scanned)
+    return text
+
+
+def _next_line_start(text: str, prefix: str, pos: int) -> int:
+    """Offset of the first line at or after line start *pos* that begins with *prefix* (len(text) if none)."""
+    if text.startswith(prefix, pos):
+        return pos
+    i = text.find("\n" + prefix, pos)
+    return len(text) if i == -1 else i + 1
+
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
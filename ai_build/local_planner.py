@@ -7,7 +7,10 @@ Replaces the Claude → paste-JSON workflow with a single local call:
 
 import json
 import os
-import re
+import threading
+
+from ai_build.planner import _strip_plan_fences
+from ai_build.prompt_optim import compress_prompt
 
 # ---------------------------------------------------------------------------
 # Prompts
@@ -57,6 +60,7 @@ RULES:
   BAD:  "feature is added"
   BAD:  "it runs correctly"
 """
+_PLAN_PROMPT = compress_prompt(_PLAN_PROMPT)
 
 # Fallback: used when model still fails with tree context
 _PLAN_PROMPT_BARE = """\
@@ -92,6 +96,33 @@ RULES:
   GOOD: "function save_user() writes a row to the database"
   BAD:  "the code works" / "feature is added" / "it runs correctly"
 """
+_PLAN_PROMPT_BARE = compress_prompt(_PLAN_PROMPT_BARE)
+
+# Shape of the plan both prompts ask for, sent as Ollama's "format" so the
+# model cannot wander off it (an empty {} or a bare list, say)
+_PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "plan_name": {"type": "string"},
+        "steps": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id":                  {"type": "integer"},
+                    "title":               {"type": "string"},
+                    "description":         {"type": "string"},
+                    "suggested_files":     {"type": "array", "items": {"type": "string"}},
+                    "acceptance_criteria": {"type": "array", "items": {"type": "string"}},
+                    "status":              {"type": "string"},
+                },
+                "required": ["id", "title", "description", "suggested_files", "acceptance_criteria"],
+            },
+        },
+    },
+    "required": ["plan_name", "steps"],
+}
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -99,8 +130,8 @@ RULES:
 
 def _file_tree_only(root: str, max_lines: int = 120) -> str:
     """Return just the file tree from context (no file contents — keeps prompt small)."""
-    from ai_build.storage import get_repo_file_tree
-    tree_lines = get_repo_file_tree(root).splitlines()
+    from ai_build.storage import cached_repo_file_tree
+    tree_lines = cached_repo_file_tree(root).splitlines()
     if len(tree_lines) > max_lines:
         tree_lines = tree_lines[:max_lines] + [f"… ({len(tree_lines) - max_lines} more lines)"]
     return "\n".join(tree_lines)
@@ -111,18 +142,15 @@ def _parse_plan(raw: str) -> dict | None:
     Extract a valid plan dict from a raw model response.
     Returns the dict if it contains a non-empty 'steps' list, else None.
     """
-    text = raw.strip()
-    # Strip markdown fences
-    if text.startswith("```"):
-        lines = text.splitlines()
-        end = len(lines) - 1 if lines[-1].strip() == "```" else len(lines)
-        text = "\n".join(lines[1:end]).strip()
-    # Find outermost JSON object
-    match = re.search(r"\{[\s\S]*\}", text)
-    if not match:
+    from ai_build.reviewer import _json_loads, _scan_json_object
+
+    text = _strip_plan_fences(raw)
+    # Find the first complete JSON object
+    obj = _scan_json_object((text,))
+    if obj is None:
         return None
     try:
-        data = json.loads(match.group())
+        data = _json_loads(obj)
     except json.JSONDecodeError:
         return None
     steps = data.get("steps")
@@ -153,6 +181,10 @@ def generate_plan_local(goal: str, root: str = ".", model: str | None = None) ->
     Attempt 1: file tree + goal  (small context, leaves room for response).
     Attempt 2: goal only         (bare prompt, last resort).
 
+    Attempt 2 is queued right behind attempt 1, so a failed attempt 1
+    costs little extra wait.  Attempt 1 still wins whenever it yields a
+    plan; attempt 2 is then cancelled, ideally before Ollama gets to it.
+
     Returns:
         (plan_dict, "")            on success
         (None,      error_string)  on failure
@@ -161,19 +193,38 @@ def generate_plan_local(goal: str, root: str = ".", model: str | None = None) ->
 
     model = model or os.getenv("OLLAMA_MODEL", "gemma3:4b")
 
-    # ── Attempt 1: file tree context ──────────────────────────────────────
     file_tree = _file_tree_only(root)
     prompt1   = _PLAN_PROMPT.format(goal=goal, file_tree=file_tree)
-    raw1      = _call_ollama_api(model, prompt1, force_json=True)
+    prompt2   = _PLAN_PROMPT_BARE.format(goal=goal)
 
-    if not raw1.startswith("(Ollama"):
-        data = _parse_plan(raw1)
-        if data:
-            return _finalise(data, goal), ""
+    # ── Attempt 2: bare prompt (no context), queued behind attempt 1 ──────
+    first_sent  = threading.Event()
+    cancel_bare = threading.Event()
+    bare_raw:   list[str] = []
 
-    # ── Attempt 2: bare prompt (no context) ───────────────────────────────
-    prompt2 = _PLAN_PROMPT_BARE.format(goal=goal)
-    raw2    = _call_ollama_api(model, prompt2, force_json=True)
+    def _bare():
+        first_sent.wait()
+        if cancel_bare.is_set():
+            bare_raw.append("(Ollama request cancelled.)")
+            return
+        bare_raw.append(_call_ollama_api(model, prompt2, force_json=True, cancel=cancel_bare, schema=_PLAN_SCHEMA))
+
+    bare = threading.Thread(target=_bare, daemon=True)
+    bare.start()
+
+    # ── Attempt 1: file tree context ──────────────────────────────────────
+    try:
+        raw1 = _call_ollama_api(model, prompt1, force_json=True, schema=_PLAN_SCHEMA, sent=first_sent)
+        if not raw1.startswith("(Ollama"):
+            data = _parse_plan(raw1)
+            if data:
+                cancel_bare.set()
+                return _finalise(data, goal), ""
+    finally:
+        first_sent.set()  # in case attempt 1 returned without reaching Ollama
+
+    bare.join()
+    raw2 = bare_raw[0] if bare_raw else "(Ollama planner attempt 2 did not return.)"
 
     if raw2.startswith("(Ollama"):
         return None, raw2
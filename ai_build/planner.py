@@ -5,7 +5,8 @@ No API keys required.
 """
 
 import json
-from ai_build.storage import save_plan, get_repo_file_tree
+import re
+from ai_build.storage import save_plan, cached_repo_file_tree
 from ai_build.context import detect_stack
 from ai_build.ui import (
     print_prompt_block,
@@ -17,6 +18,16 @@ from ai_build.ui import (
     yellow,
 )
 
+# Pasted replies often come wrapped in ```json … ``` (and sometimes with a
+# BOM in front); group 1 is what sits between the fences
+_FENCE_RE = re.compile(r"\ufeff?\s*```[^\n]*(.*?)(?:\n[ \t]*```)?\s*$", re.DOTALL)
+
+
+def _strip_plan_fences(raw: str) -> str:
+    """*raw* without a leading BOM, surrounding whitespace or a ```json … ``` wrapper."""
+    m = _FENCE_RE.match(raw)
+    return m.group(1).strip() if m else raw.strip().lstrip("\ufeff").strip()
+
 # The instruction block that tells Claude exactly what format to return.
 PLAN_INSTRUCTIONS = """You are a senior software engineer helping to plan code changes.
 You will receive a goal, the project's tech stack, and a file tree of the project.
@@ -69,7 +80,7 @@ def generate_plan(goal: str):
     print(f"Goal: {bold(goal)}\n")
     print("Scanning repository...")
 
-    file_tree = get_repo_file_tree()
+    file_tree = cached_repo_file_tree()
     stack = detect_stack(".")
     print(f"Detected stack: {yellow(stack)}")
     prompt = _build_planning_prompt(goal, file_tree, stack)
@@ -104,12 +115,7 @@ def generate_plan(goal: str):
         print("Nothing was pasted. Aborting.")
         return
 
-    # Strip BOM and markdown code fences if present
-    stripped = raw.strip().lstrip('\ufeff')
-    if stripped.startswith("```"):
-        lines = stripped.splitlines()
-        end = len(lines) - 1 if lines[-1].strip() == "```" else len(lines)
-        stripped = "\n".join(lines[1:end])
+    stripped = _strip_plan_fences(raw)
 
     try:
         plan_data = json.loads(stripped)
@@ -0,0 +1,66 @@
+"""
+prompt_optim.py - Shrink the static Ollama prompt templates.
+
+Every planner / reviewer / refiner call ships its whole prompt to a small
+local model, and Ollama prefills every one of those tokens before the
+first output token appears.  compress_prompt() trims the wording that
+costs tokens without telling the model anything:
+
+  * verbose phrases are swapped for short equivalents (one compiled regex)
+  * ══════ banner rules are shortened to a few characters
+  * deep alignment indents (8+ spaces) are cut to 4
+  * consecutive "GOOD: …" / "BAD: …" example lines are merged into one line
+  * trailing spaces and repeated blank lines are dropped
+
+The templates are compressed once, at import time.  Set PROMPT_COMPRESS=0
+to ship them verbatim.
+
+Usage
+-----
+    from ai_build.prompt_optim import compress_prompt
+    MY_PROMPT = compress_prompt(\"\"\"...\"\"\")
+"""
+
+import os
+import re
+
+# Longest phrases first so a shorter key never pre-empts a longer one
+_PHRASES = {
+    "You have no internet access. You do not call APIs. You do not run code. "
+    "You only read and reason.": "No internet, no API calls, no running code: read and reason only.",
+    "return this JSON object and nothing else": "return only this JSON object",
+    "(return this JSON object, nothing else)": "(return only this JSON object)",
+    "due to the fact that": "because",
+    "in order to": "to",
+    "make sure to ": "",
+    "Make sure to ": "",
+    "Your job is to ": "Task: ",
+    "Your job: ": "Task: ",
+    "You receive:": "Input:",
+    "you will receive": "input:",
+}
+
+_PHRASE_RE = re.compile("|".join(map(re.escape, sorted(_PHRASES, key=len, reverse=True))))
+_RULE_RE = re.compile(r"═{4,}")
+_EXAMPLE_RUN_RE = re.compile(r"^([ \t]*)(GOOD|BAD):[ \t]*(.+)(?:\n\1\2:[ \t]*.+)+", re.M)
+_DEEP_INDENT_RE = re.compile(r"^ {8,}", re.M)
+_TRAILING_WS_RE = re.compile(r"[ \t]+$", re.M)
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+
+
+def _merge_examples(match: re.Match) -> str:
+    indent, label = match.group(1), match.group(2)
+    items = [line.split(":", 1)[1].strip() for line in match.group(0).splitlines()]
+    return f"{indent}{label}: {' | '.join(items)}"
+
+
+def compress_prompt(text: str) -> str:
+    """Return *text* with the token-wasting wording trimmed (unchanged if PROMPT_COMPRESS=0)."""
+    if os.getenv("PROMPT_COMPRESS", "1") == "0":
+        return text
+    text = _PHRASE_RE.sub(lambda m: _PHRASES[m.group()], text)
+    text = _RULE_RE.sub("═══", text)
+    text = _EXAMPLE_RUN_RE.sub(_merge_examples, text)
+    text = _DEEP_INDENT_RE.sub("    ", text)
+    text = _TRAILING_WS_RE.sub("", text)
+    return _BLANK_RUN_RE.sub("\n\n", text)
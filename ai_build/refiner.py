@@ -9,7 +9,13 @@ and reviewer) so it has full context budget to reason about both the
 original diff and the feedback simultaneously.
 """
 
+import io
 import os
+import re
+import threading
+from concurrent.futures import Future
+
+from ai_build.prompt_optim import compress_prompt
 
 # ---------------------------------------------------------------------------
 # Prompt
@@ -49,24 +55,104 @@ REVIEW FEEDBACK:
 ORIGINAL DIFF TO IMPROVE:
 {diff}
 """
+_REFINE_PROMPT = compress_prompt(_REFINE_PROMPT)
+
+# ---------------------------------------------------------------------------
+# File contents
+# ---------------------------------------------------------------------------
+
+# Contents per file path: (mtime_ns, size, content).  Re-used while the
+# file's stat is unchanged; oldest entries are evicted first.
+_FILE_CACHE: dict[str, tuple[int, int, str]] = {}
+_FILE_CACHE_MAX = 64
+
+_FILE_CHAR_CAP = 4000   # files up to this size are sent whole
+_WINDOW_LINES  = 20     # lines shown either side of each hunk in larger files
+
+_HUNK_HEADER_RE = re.compile(r"@@ -(\d+)(?:,(\d+))?")
+
+
+def _file_contents(fpath) -> str:
+    """Contents of *fpath*; raises OSError if unreadable."""
+    key = str(fpath)
+    st = os.stat(key)
+    hit = _FILE_CACHE.get(key)
+    if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    content = fpath.read_text(encoding="utf-8", errors="replace")
+    _FILE_CACHE.pop(key, None)
+    _FILE_CACHE[key] = (st.st_mtime_ns, st.st_size, content)
+    while len(_FILE_CACHE) > _FILE_CACHE_MAX:
+        del _FILE_CACHE[next(iter(_FILE_CACHE))]
+    return content
+
+
+def _diff_hunks(diff: str) -> dict[str, list[tuple[int, int]]]:
+    """Map each file path in *diff* to its hunks' (original start, original length)."""
+    hunks: dict[str, list[tuple[int, int]]] = {}
+    current = None
+    for line in diff.splitlines():
+        if line.startswith(("--- ", "+++ ")):
+            path = line[4:].strip()
+            if path != "/dev/null":
+                if path.startswith(("a/", "b/")):
+                    path = path[2:]
+                current = os.path.normpath(path)
+        elif line.startswith("@@") and current:
+            m = _HUNK_HEADER_RE.match(line)
+            if m:
+                hunks.setdefault(current, []).append((int(m.group(1)), int(m.group(2) or 1)))
+    return hunks
+
+
+def _excerpt(content: str, hunks: list[tuple[int, int]] | None) -> str:
+    """
+    What the refiner sees of one file: all of it when small, otherwise the
+    lines around each hunk the diff touches (with their true line numbers),
+    or the first _FILE_CHAR_CAP characters when the diff has no hunk there.
+    """
+    if len(content) <= _FILE_CHAR_CAP:
+        return content
+    if not hunks:
+        return content[:_FILE_CHAR_CAP] + "\n...(truncated)"
+
+    lines = content.splitlines()
+    total = len(lines)
+    windows: list[list[int]] = []
+    for start, length in sorted(hunks):
+        lo = max(0, start - 1 - _WINDOW_LINES)
+        hi = min(total, max(start - 1, 0) + length + _WINDOW_LINES)
+        if windows and lo <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], hi)
+        else:
+            windows.append([lo, hi])
+    return "\n...\n".join(
+        f"(EXCERPT lines {lo + 1}–{hi} of {total} total)\n" + "\n".join(lines[lo:hi])
+        for lo, hi in windows
+    )
+
 
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
-def refine_patch(diff: str, step: dict, review: dict | str, root: str = ".", model: str | None = None) -> tuple[str, str]:
+def refine_patch(diff: str, step: dict, review: dict | str, root: str = ".", model: str | None = None,
+                 cancel: threading.Event | None = None) -> tuple[str, str]:
     """
     Use the Ollama-Refiner to clean up a generated diff based on review feedback.
 
     Each call uses OLLAMA_REFINER_MODEL (falls back to OLLAMA_MODEL) with its
     own fresh 32 768-token context window — independent of the patcher and reviewer.
 
+    Setting *cancel* stops the generation; the original diff is then
+    returned with an error note.
+
     Returns:
         (refined_diff, error_string)
         If refiner cannot improve the diff, original is returned unchanged.
     """
     from ai_build.reviewer import _call_ollama_api
-    from ai_build.local_patcher import _extract_diff, _sanitize_diff
+    from ai_build.local_patcher import _extract_diff, _sanitize_diff, _scan_diff
     import pathlib
 
     # Format review into review text
@@ -85,18 +171,19 @@ def refine_patch(diff: str, step: dict, review: dict | str, root: str = ".", mod
 
     # Read current file contents so refiner can produce correct line numbers
     root_path = pathlib.Path(root).resolve()
-    file_parts: list[str] = []
+    diff_hunks = _diff_hunks(diff)
+    buf = io.StringIO()
     for rel_path in step.get("suggested_files", []):
+        if buf.tell():
+            buf.write("\n")
         fpath = root_path / rel_path
         try:
-            content = fpath.read_text(encoding="utf-8", errors="replace")
-            # Cap at 4000 chars per file to stay within budget
-            if len(content) > 4000:
-                content = content[:4000] + "\n...(truncated)"
-            file_parts.append(f"{'═' * 50}\nFILE: {rel_path}\n{'═' * 50}\n{content}")
+            content = _excerpt(_file_contents(fpath), diff_hunks.get(os.path.normpath(rel_path)))
+            buf.write(f"{'═' * 50}\nFILE: {rel_path}\n{'═' * 50}\n{content}")
         except Exception:
-            file_parts.append(f"FILE: {rel_path} — [new file, does not exist yet]")
-    file_contents = "\n".join(file_parts) if file_parts else "(no files listed)"
+            buf.write(f"FILE: {rel_path} — [new file, does not exist yet]")
+    file_contents = buf.getvalue() or "(no files listed)"
+    buf.close()
 
     prompt = _REFINE_PROMPT.format(
         description=step.get("description", step.get("title", "(no description)")),
@@ -104,9 +191,15 @@ def refine_patch(diff: str, step: dict, review: dict | str, root: str = ".", mod
         review_text=review_text,
         diff=diff,
     )
+    # The prompt holds its own copy; drop the pieces so a long run doesn't
+    # keep them alive for the whole (slow) model call
+    del file_contents, review_text, diff_hunks
 
     model = model or os.getenv("OLLAMA_REFINER_MODEL", os.getenv("OLLAMA_MODEL", "gemma3:4b"))
-    raw = _call_ollama_api(model, prompt, force_json=False)
+    # Stop reading once the diff is over — the explanation the model tends
+    # to add afterwards is never used
+    raw = _call_ollama_api(model, prompt, force_json=False, cancel=cancel, collect=_scan_diff)
+    del prompt
 
     if raw.startswith("(Ollama"):
         # Connection / model error — return original diff unchanged
@@ -118,3 +211,35 @@ def refine_patch(diff: str, step: dict, review: dict | str, root: str = ".", mod
         return diff, ""
 
     return _sanitize_diff(extracted), ""
+
+
+# Stand-in review for a refine started before the real review is back
+_PENDING_REVIEW = {
+    "verdict": "concerns",
+    "summary": "Review still pending — fix anything that is wrong with the diff.",
+    "issues":  [],
+}
+
+
+def refine_speculatively(diff: str, step: dict, root: str = ".", model: str | None = None,
+                         cancel: threading.Event | None = None) -> Future:
+    """
+    Start refine_patch() against a placeholder review on a daemon thread.
+    Start it once the review request is with Ollama, so it queues behind
+    the review rather than in front of it.
+
+    Returns a Future for the (refined_diff, error_string) result.  It is
+    only worth using when the real review comes back "concerns" without
+    listing issues; otherwise callers set *cancel* so the generation stops
+    holding up Ollama.
+    """
+    future: Future = Future()
+
+    def _run():
+        try:
+            future.set_result(refine_patch(diff, step, _PENDING_REVIEW, root=root, model=model, cancel=cancel))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return future
@@ -11,20 +11,35 @@ Calls Ollama with full project context and returns a structured review dict:
   }
 """
 
+import atexit
+import hashlib
+import http.client
 import json
 import os
 import re
 import subprocess
-import urllib.request
+import threading
+import time
 import urllib.error
+import urllib.parse
+
+from ai_build.prompt_optim import compress_prompt
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, see _json_dumps / _json_loads
+    orjson = None
 
 OLLAMA_HOST = "http://localhost:11434"
 
 # ---------------------------------------------------------------------------
 # Agent Prompt
 # ---------------------------------------------------------------------------
+# Split in two: the prefix (role, checklist, project context) is identical
+# for every step of a run, so Ollama can reuse its KV cache for it and only
+# prefill the suffix (step + patch) on each review.
 
-REVIEW_PROMPT = """\
+_REVIEW_PREFIX = """\
 You are a LOCAL-ONLY Code Review Agent acting as an ADVERSARIAL REVIEWER. \
 Assume the patch has problems and hunt for them. You have no internet access. \
 You do not call APIs. You do not run code. You only read and reason.
@@ -54,6 +69,9 @@ Your job is to catch errors BEFORE they reach Claude. Be strict.
 {context}
 ══════════════════════════════════════════════════════════
 
+"""
+
+_REVIEW_SUFFIX = """\
 STEP BEING IMPLEMENTED:
   {description}
 
@@ -84,47 +102,387 @@ VERDICT values:
 
 IMPORTANT: If the patch is correct and complete, issues should be an empty list [].
 """
+_REVIEW_PREFIX = compress_prompt(_REVIEW_PREFIX)
+_REVIEW_SUFFIX = compress_prompt(_REVIEW_SUFFIX)
+REVIEW_PROMPT = _REVIEW_PREFIX + _REVIEW_SUFFIX
+
+# The OUTPUT FORMAT above as a JSON Schema.  Sent as the API request's
+# "format" it makes Ollama sample only output of this shape; the prompt
+# keeps the description for the CLI fallback, which cannot be constrained.
+_REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdict": {"type": "string", "enum": ["approve", "concerns", "reject"]},
+        "summary": {"type": "string"},
+        "issues":  {"type": "array", "items": {"type": "string"}},
+        "notes":   {"type": "string"},
+    },
+    "required": ["verdict", "summary", "issues"],
+}
+
+
+# ---------------------------------------------------------------------------
+# JSON helpers
+# ---------------------------------------------------------------------------
+# Prompts run to tens of KB and every streamed token arrives as its own JSON
+# event, so encoding and decoding go through orjson when it is installed.
+# Whatever orjson refuses (lone surrogates, NaN, integers past 64 bits) is
+# handed to the stdlib json module, which keeps the results identical.
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: str | bytes):
+    """Parse JSON text; raises json.JSONDecodeError like json.loads."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+_JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+
+
+def _scan_json_object(chunks) -> str | None:
+    """
+    Return the text of the first complete top-level JSON object in the
+    concatenated string *chunks* (e.g. a streamed response), or None.
+
+    A single forward pass that only visits braces, quotes and backslashes,
+    tracking string and escape state, so braces inside strings are ignored
+    and nothing is backtracked over.  Chunks after the object closes are
+    never consumed.
+    """
+    parts: list[str] = []
+    depth = 0
+    in_string = False
+    skip = 0   # chunk offset of the next unescaped character
+    for chunk in chunks:
+        if depth:
+            begin = 0
+        else:
+            begin = chunk.find("{")
+            if begin == -1:
+                continue
+        for m in _JSON_TOKEN_RE.finditer(chunk, begin):
+            i = m.start()
+            if i < skip:
+                continue
+            ch = m.group()
+            if in_string:
+                if ch == "\\":
+                    skip = i + 2
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if not depth:
+                    parts.append(chunk[begin:i + 1])
+                    return "".join(parts)
+        # An escape at the very end of a chunk swallows the next chunk's first character
+        skip = max(skip - len(chunk), 0)
+        if depth:
+            parts.append(chunk[begin:])
+    return None
+
+
+def _collect_json(chunks) -> str:
+    """
+    A ``collect`` for JSON replies: all the text up to and including the
+    chunk that closes the first JSON object.  Reading stops there, so the
+    trailing whitespace/EOS tokens the model would still generate are
+    never waited for.
+    """
+    seen: list[str] = []
+
+    def tee():
+        for chunk in chunks:
+            seen.append(chunk)
+            yield chunk
+
+    _scan_json_object(tee())
+    return "".join(seen)
 
 
 # ---------------------------------------------------------------------------
 # Ollama transport
 # ---------------------------------------------------------------------------
 
-def _call_ollama_api(model: str, prompt: str, force_json: bool = False) -> str:
-    """Call Ollama via its REST API. Returns the response text.
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: about 3 characters per token for code-heavy prompts."""
+    return max(1, len(text) // 3)
 
-    Args:
-        force_json: if True, passes ``"format": "json"`` in the request body,
-                    which instructs Ollama to constrain the model's output to
-                    valid JSON (supported by Ollama >= 0.1.9).
+
+# Last num_ctx sent per model.  Ollama reloads a model whenever num_ctx
+# changes, so the size only ever grows within a session.
+_NUM_CTX_BY_MODEL: dict[str, int] = {}
+
+
+def _num_ctx_for(model: str, prompt: str, max_new_tokens: int) -> int:
+    """
+    Context window for one call: prompt estimate plus room for the reply,
+    rounded up to a power of two, at least 2048 and at most OLLAMA_NUM_CTX.
+    OLLAMA_NUM_CTX_AUTO=0 always sends OLLAMA_NUM_CTX itself.
     """
-    url = f"{OLLAMA_HOST}/api/generate"
     # num_ctx tells Ollama how many tokens to keep in the KV cache / context
     # window. Default is often 2048 which silently truncates large prompts.
     # 32768 is well within gemma3:4b's capability and safe for local hardware.
-    num_ctx = int(os.getenv("OLLAMA_NUM_CTX", "32768"))
+    cap = int(os.getenv("OLLAMA_NUM_CTX", "32768"))
+    if os.getenv("OLLAMA_NUM_CTX_AUTO", "1") == "0":
+        return cap
+    needed = _estimate_tokens(prompt) + max_new_tokens
+    size = max(2048, 1 << (needed - 1).bit_length(), _NUM_CTX_BY_MODEL.get(model, 0))
+    size = min(cap, size)
+    _NUM_CTX_BY_MODEL[model] = size
+    return size
+
+
+def _generate_body(model: str, prompt: str, force_json: bool, stream: bool,
+                   schema: dict | None = None) -> bytes:
+    """JSON request body for /api/generate (*schema* takes precedence over *force_json*)."""
+    max_new_tokens = int(os.getenv("OLLAMA_MAX_NEW_TOKENS", "4096"))
     body: dict = {
         "model": model,
         "prompt": prompt,
-        "stream": False,
-        "options": {"num_ctx": num_ctx},
+        "stream": stream,
+        "options": {
+            "num_ctx":     _num_ctx_for(model, prompt, max_new_tokens),
+            "num_predict": max_new_tokens,
+        },
+        # Keep the model (and its cached prompt prefix) loaded between steps
+        "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
     }
-    if force_json:
+    if schema is not None:
+        body["format"] = schema
+    elif force_json:
         body["format"] = "json"
-    payload = json.dumps(body).encode("utf-8")
+    return _json_dumps(body)
 
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
 
+# ── Connection pool ──
+# Idle keep-alive connections to Ollama, shared by every caller (planner,
+# patcher, reviewer, refiner).  Each entry is (netloc, connection); entries
+# for a different OLLAMA_HOST are dropped when they come out of the pool.
+_POOL: list[tuple[str, http.client.HTTPConnection]] = []
+_POOL_LOCK = threading.Lock()
+_POOL_MAX = 4
+
+
+def _checkout(netloc: str) -> tuple[http.client.HTTPConnection, bool]:
+    """An idle connection to *netloc* from the pool, or a new one; and whether it was reused."""
+    with _POOL_LOCK:
+        while _POOL:
+            pooled_netloc, conn = _POOL.pop()
+            if pooled_netloc == netloc:
+                return conn, True
+            conn.close()
+    return http.client.HTTPConnection(netloc, timeout=120), False
+
+
+def _checkin(netloc: str, conn: http.client.HTTPConnection) -> None:
+    """Return a connection whose last response was read to the end."""
+    with _POOL_LOCK:
+        if len(_POOL) < _POOL_MAX:
+            _POOL.append((netloc, conn))
+            return
+    conn.close()
+
+
+@atexit.register
+def _close_pool() -> None:
+    with _POOL_LOCK:
+        while _POOL:
+            _POOL.pop()[1].close()
+
+
+def _post_generate(payload: bytes, sent: threading.Event | None = None) -> tuple[str, http.client.HTTPConnection, http.client.HTTPResponse]:
+    """
+    POST *payload* to /api/generate on a pooled connection and return
+    (netloc, connection, response) with the headers read.  *sent*, if
+    given, is set once the request is written, before the reply is awaited.
+
+    A reused connection the server has meanwhile closed is retried on a
+    fresh one.  Errors are raised as the urllib exceptions callers already
+    handle: URLError when Ollama cannot be reached, HTTPError for 4xx/5xx.
+    """
+    url = f"{OLLAMA_HOST}/api/generate"
+    netloc = urllib.parse.urlsplit(url).netloc
+    while True:
+        conn, reused = _checkout(netloc)
+        try:
+            conn.request("POST", "/api/generate", body=payload,
+                         headers={"Content-Type": "application/json"})
+            if sent is not None:
+                sent.set()
+            resp = conn.getresponse()
+            break
+        except (http.client.HTTPException, OSError) as exc:
+            conn.close()
+            if not reused:
+                raise urllib.error.URLError(exc) from exc
+
+    if resp.status >= 400:
+        resp.read()
+        _checkin(netloc, conn)
+        raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+    return netloc, conn, resp
+
+
+# ── Response cache ──
+# With OLLAMA_CACHE=1, replies are kept on disk under the hash of everything
+# that shapes them, so re-running a step on an unchanged diff is a file
+# read instead of a generation.  Off by default: sampling is not
+# deterministic, and a retry is sometimes meant to get a different answer.
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_build", "ollama")
+
+
+def _cache_key(model: str, prompt: str, force_json: bool, schema: dict | None, collect) -> str | None:
+    """Cache file name for this call, or None when OLLAMA_CACHE is not enabled."""
+    if os.getenv("OLLAMA_CACHE", "0") != "1":
+        return None
+    max_new_tokens = int(os.getenv("OLLAMA_MAX_NEW_TOKENS", "4096"))
+    fmt = _json_dumps(schema).decode() if schema is not None else "json" if force_json else ""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{model}|{_num_ctx_for(model, prompt, max_new_tokens)}|{max_new_tokens}|{fmt}|"
+             f"{getattr(collect, '__qualname__', '')}|".encode())
+    h.update(prompt.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def _cache_get(key: str) -> str | None:
     try:
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            body = resp.read().decode("utf-8")
-            data = json.loads(body)
-            return data.get("response", "").strip()
+        with open(os.path.join(_CACHE_DIR, key), encoding="utf-8") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _cache_put(key: str, text: str) -> None:
+    """Store *text* atomically; a cache that cannot be written is just skipped."""
+    path = os.path.join(_CACHE_DIR, key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _stream_ollama(model: str, prompt: str, force_json: bool = False,
+                   cancel: threading.Event | None = None, schema: dict | None = None,
+                   sent: threading.Event | None = None):
+    """
+    Generator over the response chunks of a streaming /api/generate call.
+
+    Closing the generator early (see _collect_json) closes the connection,
+    which makes Ollama stop generating; a stream read to its final event
+    hands the connection back to the pool.  Setting *cancel* ends the
+    stream the same way at the next event.
+    """
+    netloc, conn, resp = _post_generate(_generate_body(model, prompt, force_json, stream=True, schema=schema), sent)
+    finished = False
+    try:
+        for line in resp:
+            if cancel is not None and cancel.is_set():
+                return
+            if not line.strip():
+                continue
+            event = _json_loads(line)
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            chunk = event.get("response", "")
+            if chunk:
+                yield chunk
+            if event.get("done"):
+                resp.read()  # chunked-encoding trailer
+                finished = True
+                return
+    finally:
+        # Only a fully read response leaves the connection reusable
+        if finished:
+            _checkin(netloc, conn)
+        else:
+            conn.close()
+
+
+def _call_ollama_api(model: str, prompt: str, force_json: bool = False,
+                     cancel: threading.Event | None = None, collect=None,
+                     schema: dict | None = None, sent: threading.Event | None = None) -> str:
+    """Call Ollama via its REST API. Returns the response text.
+
+    The response is streamed (see ``_stream_ollama``); if the server refuses
+    the streaming request, one plain non-streaming request is made instead.
+
+    Args:
+        force_json: if True, passes ``"format": "json"`` in the request body,
+                    which instructs Ollama to constrain the model's output to
+                    valid JSON (supported by Ollama >= 0.1.9).
+        schema:     optional JSON Schema sent as ``"format"`` instead, so the
+                    output must also have that shape (Ollama >= 0.5).  Older
+                    servers reject it; the retry then asks for plain JSON.
+        cancel:     optional event; once set, the call stops reading and
+                    returns "(Ollama request cancelled.)".
+        collect:    optional function turning the response chunks into the
+                    text (default: _collect_json for JSON replies, else join
+                    them all).  It may stop iterating early, which ends the
+                    generation — see local_patcher._scan_diff.
+        sent:       optional event, set once the request has been written
+                    to Ollama — a caller can queue another one behind it.
+
+    With OLLAMA_CACHE=1 a successful reply is stored on disk and returned
+    as is for an identical later call (see _cache_key).
+    """
+    if collect is None:
+        collect = _collect_json if force_json or schema is not None else "".join
+    key = _cache_key(model, prompt, force_json, schema, collect)
+    if key is not None:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+    try:
+        try:
+            chunks = _stream_ollama(model, prompt, force_json, cancel, schema, sent)
+            try:
+                text = collect(chunks).strip()
+            finally:
+                chunks.close()
+            if cancel is not None and cancel.is_set():
+                return "(Ollama request cancelled.)"
+            if key is not None:
+                _cache_put(key, text)
+            return text
+        except urllib.error.HTTPError:
+            pass
+        force_json = force_json or schema is not None
+        netloc, conn, resp = _post_generate(_generate_body(model, prompt, force_json, stream=False), sent)
+        try:
+            body = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        _checkin(netloc, conn)
+        data = _json_loads(body)
+        text = collect((data.get("response", ""),)).strip()
+        if key is not None:
+            _cache_put(key, text)
+        return text
     except urllib.error.URLError as e:
         return f"(Ollama connection error: {e}. Is Ollama running? Run: ollama serve)"
     except json.JSONDecodeError:
@@ -158,6 +516,73 @@ def _call_ollama_cli(model: str, prompt: str) -> str:
 # Response parsing
 # ---------------------------------------------------------------------------
 
+_APPROVE_RE  = re.compile(r"\bapprove\b", re.I)
+_REJECT_RE   = re.compile(r"\breject\b", re.I)
+_SUMMARY_RE  = re.compile(r"SUMMARY[:\s]+(.+)", re.I)
+_SUMMARY_END_RE  = re.compile(r"SUMMARY[:\s]*$", re.I)
+_SUMMARY_CONT_RE = re.compile(r"[:\s]*([^:\s].*)")
+_BULLETS = {"-", "\u2022", "*"}
+
+
+def _scan_review_heuristic(raw: str) -> dict:
+    """
+    Pull verdict, summary and issues out of a non-JSON review in one pass
+    over its lines.
+
+    "reject" anywhere wins over "approve"; otherwise "concerns".  The
+    summary is the text after the first "SUMMARY:" (on the next non-blank
+    line if that line ends there), else the first line; issues are the
+    bullet lines.
+    """
+    approve = reject = False
+    summary = None
+    summary_pending = False   # "SUMMARY" ended its line; the text is on a later one
+    first_line = None
+    issues: list[str] = []
+
+    for line in raw.splitlines():
+        if first_line is None:
+            first_line = line
+        if not approve and _APPROVE_RE.search(line):
+            approve = True
+        if not reject and _REJECT_RE.search(line):
+            reject = True
+
+        if summary is None:
+            if summary_pending:
+                m = _SUMMARY_CONT_RE.match(line)
+                if m:
+                    summary = m.group(1).strip()
+            else:
+                m = _SUMMARY_RE.search(line)
+                # A one-character [:\s] group means nothing but separators
+                # followed "SUMMARY" on this line
+                if m and not (len(m.group(1)) == 1 and (m.group(1) == ":" or m.group(1).isspace())):
+                    summary = m.group(1).strip()
+                elif m or _SUMMARY_END_RE.search(line):
+                    summary_pending = True
+
+        stripped = line.strip()
+        if stripped[:1] in _BULLETS and len(stripped) > 3:
+            issues.append(line.lstrip("- \u2022*").strip())
+
+    if summary is None:
+        if summary_pending:
+            # Only separators followed "SUMMARY" — rare; let the regex decide
+            m = _SUMMARY_RE.search(raw)
+            summary = m.group(1).strip() if m else None
+        if summary is None:
+            summary = (first_line or "")[:120]
+
+    return {
+        "verdict": "reject" if reject else "approve" if approve else "concerns",
+        "summary": summary,
+        "issues":  issues,
+        "notes":   "",
+        "raw":     raw,
+    }
+
+
 def _parse_review(raw: str) -> dict:
     """
     Parse Ollama's response into a structured review dict.
@@ -172,10 +597,10 @@ def _parse_review(raw: str) -> dict:
         text  = "\n".join(lines[1:end]).strip()
 
     # Try to extract a JSON object
-    match = re.search(r"\{[\s\S]*\}", text)
-    if match:
+    obj = _scan_json_object((text,))
+    if obj is not None:
         try:
-            data = json.loads(match.group())
+            data = _json_loads(obj)
             verdict = str(data.get("verdict", "concerns")).lower().strip()
             if verdict not in ("approve", "concerns", "reject"):
                 verdict = "concerns"
@@ -193,28 +618,7 @@ def _parse_review(raw: str) -> dict:
             pass
 
     # ── Heuristic text fallback ─────────────────────────────────────────────────
-    verdict = "concerns"
-    if re.search(r"\bAPPROVE\b|\bapprove\b", raw, re.I):
-        verdict = "approve"
-    if re.search(r"\bREJECT\b|\breject\b", raw, re.I):
-        verdict = "reject"
-
-    summary_match = re.search(r"SUMMARY[:\s]+(.+)", raw, re.I)
-    summary = summary_match.group(1).strip() if summary_match else raw.splitlines()[0][:120]
-
-    issues = [
-        line.lstrip("- \u2022*").strip()
-        for line in raw.splitlines()
-        if line.strip().startswith(("-", "\u2022", "*")) and len(line.strip()) > 3
-    ]
-
-    return {
-        "verdict": verdict,
-        "summary": summary,
-        "issues":  issues,
-        "notes":   "",
-        "raw":     raw,
-    }
+    return _scan_review_heuristic(raw)
 
 
 # ---------------------------------------------------------------------------
@@ -242,7 +646,11 @@ def format_review_text(review: dict) -> str:
 # Main entry point
 # ---------------------------------------------------------------------------
 
-def review_patch(patch: str, step_description: str, context: str = "", model: str | None = None) -> dict:
+_API_ATTEMPTS = 3
+
+
+def review_patch(patch: str, step_description: str, context: str = "", model: str | None = None,
+                 sent: threading.Event | None = None) -> dict:
     """
     Send the patch to Ollama for structured review.
 
@@ -251,17 +659,31 @@ def review_patch(patch: str, step_description: str, context: str = "", model: st
        "issues": [...], "notes": str, "raw": str}
 
     Pass `context` (from context_engine.context_to_text()) for full project awareness.
+    Pass `sent` to learn when the review is queued with Ollama: it is set
+    once the request is written (or when review_patch returns, whichever
+    comes first).
     """
     model = model or os.getenv("OLLAMA_MODEL", "gemma3:4b")
-    prompt = REVIEW_PROMPT.format(
+    prompt = _REVIEW_PREFIX.format(
         context     = context if context else "(no project context provided)",
+    ) + _REVIEW_SUFFIX.format(
         description = step_description,
         patch       = patch,
     )
 
-    # Try API first, fall back to CLI
-    raw = _call_ollama_api(model, prompt)
-    if raw.startswith("(Ollama connection error"):
-        raw = _call_ollama_cli(model, prompt)
+    # Try the API a few times (a redial is far cheaper than spawning the CLI
+    # and reloading the model), then fall back to the CLI once
+    try:
+        for attempt in range(_API_ATTEMPTS):
+            raw = _call_ollama_api(model, prompt, schema=_REVIEW_SCHEMA, sent=sent)
+            if not raw.startswith("(Ollama connection error"):
+                break
+            if attempt + 1 < _API_ATTEMPTS:
+                time.sleep(0.25 * 2 ** attempt)
+        else:
+            raw = _call_ollama_cli(model, prompt)
+    finally:
+        if sent is not None:
+            sent.set()
 
     return _parse_review(raw)
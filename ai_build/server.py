@@ -5,27 +5,30 @@ Run via:  python ai_build.py gui
 Redesigned UI:
   Phase-based wizard layout (Setup → Steps → Deliver)
   Sidebar step navigator + focused main panel
-  Auto-polling while Ollama runs (no manual refresh)
+  Live updates over server-sent events while Ollama runs (no manual refresh)
   Built-in contextual help / onboarding for every action
 """
 
+import http.client
 import json
 import os
+import queue
 import signal
 import threading
-import urllib.request
-import urllib.error
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 
-from flask import Flask, request, render_template_string, redirect, url_for, jsonify
+from flask import Flask, Response, request, render_template_string, redirect, url_for, jsonify, send_file
 
 from ai_build.shutdown import get_shutdown_manager
 
 from ai_build.storage import (
     load_plan, save_plan, save_prompt, save_patch, load_ollama_prompt,
-    save_refined_patch, load_refined_patch, save_final_prompt, load_final_prompt,
-    get_repo_file_tree, read_files, update_step_status,
+    save_refined_patch, load_refined_patch, load_final_prompt, final_prompt_path, ensure_dirs,
+    cached_repo_file_tree, read_files, update_step_status, load_all_patches, flush_writes, PLAN_FILE,
 )
-from ai_build.planner import _build_planning_prompt
+from ai_build.planner import _build_planning_prompt, _strip_plan_fences
 from ai_build.executor import _build_patch_prompt, _looks_like_diff, _strip_code_fences
 from ai_build.reviewer import review_patch
 from ai_build.git_ops import _is_git_repo, is_repo_clean
@@ -51,47 +54,169 @@ def _project_context_text(root: str, max_chars: int = 8_000) -> str:
 # ---------------------------------------------------------------------------
 # In-memory session state (single-user local tool)
 # ---------------------------------------------------------------------------
-_state: dict = {
-    "goal": "",
-    "plan_prompt": "",
-    "patch_prompts": {},    # step_id -> str  (Claude prompts)
-    "ollama_prompts": {},   # step_id -> str  (Ollama prompts)
-    "diffs": {},            # step_id -> str  (raw Ollama-Patcher output)
-    "refined_diffs": {},    # step_id -> str  (Ollama-Refiner output)
-    "reviews": {},          # step_id -> str | dict
-    "final_prompt": "",     # assembled agent prompt (copy into Claude)
-    "active_step_id": None,
-    "error": "",
-    "info": "",
-    "project_root": "",  # empty = no folder chosen yet; set by user on first use
-    "git_exists": False,
-    "bg_running": False,
-    "bg_label": "",
-    "planner_model":  os.getenv("OLLAMA_MODEL", "gemma3:4b"),
-    "patcher_model":  os.getenv("OLLAMA_MODEL", "gemma3:4b"),
-    "reviewer_model": os.getenv("OLLAMA_MODEL", "gemma3:4b"),
-    "refiner_model":  os.getenv("OLLAMA_MODEL", "gemma3:4b"),
-    "num_ctx":        int(os.getenv("OLLAMA_NUM_CTX", "32768")),
-}
+@dataclass(slots=True)
+class SessionState:
+    """Everything the GUI remembers between requests (one browser session)."""
+    goal: str = ""
+    plan_prompt: str = ""
+    patch_prompts: dict = field(default_factory=dict)        # step_id -> str  (Claude prompts)
+    ollama_prompts: dict = field(default_factory=dict)       # step_id -> str  (Ollama prompts)
+    diffs: dict = field(default_factory=dict)                # step_id -> str  (raw Ollama-Patcher output)
+    refined_diffs: dict = field(default_factory=dict)        # step_id -> str  (Ollama-Refiner output)
+    speculative_refines: dict = field(default_factory=dict)  # step_id -> (diff, Future, cancel Event)  (refine started alongside review)
+    reviews: dict = field(default_factory=dict)              # step_id -> str | dict
+    final_prompt_chars: int = 0  # length of the assembled agent prompt (0 = none); the text is served by /final-prompt
+    active_step_id: int | None = None
+    error: str = ""
+    info: str = ""
+    project_root: str = ""  # empty = no folder chosen yet; set by user on first use
+    git_exists: bool = False
+    bg_running: bool = False
+    bg_label: str = ""
+    planner_model: str = os.getenv("OLLAMA_MODEL", "gemma3:4b")
+    patcher_model: str = os.getenv("OLLAMA_MODEL", "gemma3:4b")
+    reviewer_model: str = os.getenv("OLLAMA_MODEL", "gemma3:4b")
+    refiner_model: str = os.getenv("OLLAMA_MODEL", "gemma3:4b")
+    num_ctx: int = int(os.getenv("OLLAMA_NUM_CTX", "32768"))
+    # Steps per status bucket, counted by _index_plan whenever plan.json is
+    # (re)loaded, so the status refresh never walks the steps
+    status_counts: dict = field(
+        default_factory=lambda: {"approved": 0, "skipped": 0, "failed": 0, "pending": 0, "total": 0}
+    )
+    # Lookups into the loaded plan, rebuilt whenever plan.json is (re)read
+    # (see _cached_load_plan) so finding a step never walks the list
+    step_by_id: dict = field(default_factory=dict)     # step_id -> step dict
+    pending_order: list = field(default_factory=list)  # ids of pending steps, in plan order
+
+
+_state = SessionState()
+
+# Bumped (under the condition) whenever something the browser shows while a
+# background job runs has changed; /events waits on it instead of the page
+# polling /status.
+_state_changed = threading.Condition()
+_state_version = 0
 
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _get_status() -> dict:
+# Parsed plan.json as ((path, mtime_ns, size), plan).  Most requests read
+# the plan several times; while the file is unchanged that is one os.stat.
+# The path is part of the key because choosing a project folder chdirs.
+# Callers must treat the returned dict as read-only.
+_plan_cache: dict = {"entry": None}
+
+
+def _cached_load_plan() -> dict | None:
+    path = os.path.abspath(PLAN_FILE)
     try:
-        with urllib.request.urlopen("http://localhost:11434/api/tags", timeout=2) as r:
-            data = json.loads(r.read())
-            models = [m["name"] for m in data.get("models", [])]
-            ollama_ok = True
-            model_name = _state.get("patcher_model", os.getenv("OLLAMA_MODEL", "gemma3:4b"))
-            model_loaded = any(m.startswith(model_name.split(":")[0]) for m in models)
+        st = os.stat(path)
+    except OSError:
+        if _plan_cache["entry"] is not None or _state.step_by_id or _state.status_counts["total"]:
+            _plan_cache["entry"] = None
+            _index_plan(None)
+        return None
+    key = (path, st.st_mtime_ns, st.st_size)
+    entry = _plan_cache["entry"]
+    if entry is None or entry[0] != key:
+        entry = (key, load_plan())
+        _plan_cache["entry"] = entry
+        _index_plan(entry[1])
+    return entry[1]
+
+
+def _index_plan(plan: dict | None):
+    """
+    Rebuild _state.step_by_id, _state.pending_order and _state.status_counts
+    for *plan*.  Runs on every (re)load, so a plan.json changed outside the
+    server (the CLI, a hand edit) is recounted too.
+    """
+    by_id: dict = {}
+    pending: list = []
+    counts = {"approved": 0, "skipped": 0, "failed": 0, "pending": 0, "total": 0}
+    for s in (plan or {}).get("steps", []):
+        by_id.setdefault(s["id"], s)  # first one wins, as a list scan would
+        status = s.get("status", "pending")
+        if status == "pending":
+            pending.append(s["id"])
+        counts[_status_bucket(status)] += 1
+        counts["total"] += 1
+    _state.step_by_id = by_id
+    _state.pending_order = pending
+    _state.status_counts = counts
+
+
+def _invalidate_plan():
+    """Forget the cached plan (after writing it — a rewrite can keep the same mtime)."""
+    _plan_cache["entry"] = None
+
+
+def _status_bucket(status: str | None) -> str:
+    """The status_counts key a step status is counted under ("applied" etc. count as pending)."""
+    return status if status in ("approved", "skipped", "failed") else "pending"
+
+
+def _set_step_status(step_id: int, status: str):
+    """
+    update_step_status() plus dropping the cached plan; the next load
+    re-indexes it, which recounts status_counts (see _index_plan).
+    """
+    update_step_status(step_id, status)
+    _invalidate_plan()
+
+
+# _get_status() is called on every render; its slow part (the Ollama probe,
+# git and plan.json reads) is shared by all callers for _STATUS_TTL seconds.
+# _notify_state_change() drops it so a real change shows up at once.
+_STATUS_TTL = 1.0
+_status_cache: dict = {"t": 0.0, "val": None}
+_status_lock = threading.Lock()
+
+
+# One kept-alive connection for the /api/tags probe, so a status refresh
+# does not open (and tear down) a new TCP connection every time.
+_ollama_probe: dict = {"conn": None}
+_ollama_probe_lock = threading.Lock()
+
+
+def _ollama_tags() -> dict:
+    """GET /api/tags from the local Ollama; raises if it cannot be reached."""
+    with _ollama_probe_lock:
+        while True:
+            conn = _ollama_probe["conn"]
+            reused = conn is not None
+            if not reused:
+                conn = http.client.HTTPConnection("localhost", 11434, timeout=2)
+            try:
+                conn.request("GET", "/api/tags")
+                r = conn.getresponse()
+                body = r.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                _ollama_probe["conn"] = None
+                if reused:
+                    continue  # the server closed the idle connection; dial again
+                raise
+            _ollama_probe["conn"] = conn
+            if r.status != 200:
+                raise http.client.HTTPException(f"/api/tags returned {r.status}")
+            return json.loads(body)
+
+
+def _probe_status() -> dict:
+    try:
+        data = _ollama_tags()
+        models = [m["name"] for m in data.get("models", [])]
+        ollama_ok = True
+        model_name = _state.patcher_model
+        model_loaded = any(m.startswith(model_name.split(":")[0]) for m in models)
     except Exception:
         ollama_ok = False
         models = []
         model_loaded = False
-        model_name = _state.get("patcher_model", os.getenv("OLLAMA_MODEL", "gemma3:4b"))
+        model_name = _state.patcher_model
 
     in_git = _is_git_repo()
     if in_git:
@@ -99,16 +224,10 @@ def _get_status() -> dict:
     else:
         git_status = "missing"
 
-    plan = load_plan() if _state.get("project_root") else None
-    if plan:
-        steps = plan["steps"]
-        total    = len(steps)
-        approved = sum(1 for s in steps if s.get("status") == "approved")
-        skipped  = sum(1 for s in steps if s.get("status") == "skipped")
-        failed   = sum(1 for s in steps if s.get("status") == "failed")
-        pending  = total - approved - skipped - failed
-    else:
-        total = approved = skipped = failed = pending = 0
+    plan = _cached_load_plan() if _state.project_root else None
+    counts = _state.status_counts
+    if not plan:
+        counts = {"approved": 0, "skipped": 0, "failed": 0, "pending": 0, "total": 0}
 
     return {
         "ollama_ok":    ollama_ok,
@@ -118,43 +237,124 @@ def _get_status() -> dict:
         "git_status":   git_status,
         "plan_loaded":  plan is not None,
         "goal":         plan["goal"] if plan else "",
-        "total":        total,
-        "approved":     approved,
-        "skipped":      skipped,
-        "failed":       failed,
-        "pending":      pending,
-        "active_step_id": _state["active_step_id"],
-        "project_root": _state.get("project_root", ""),
-        "git_exists":   _state.get("git_exists", False),
+        "total":        counts["total"],
+        "approved":     counts["approved"],
+        "skipped":      counts["skipped"],
+        "failed":       counts["failed"],
+        "pending":      counts["pending"],
+    }
+
+
+def _get_status() -> dict:
+    cache = _status_cache
+    if cache["val"] is None or time.monotonic() - cache["t"] >= _STATUS_TTL:
+        with _status_lock:
+            # Another request may have refreshed it while we waited
+            if cache["val"] is None or time.monotonic() - cache["t"] >= _STATUS_TTL:
+                cache["val"] = _probe_status()
+                cache["t"] = time.monotonic()
+    return {
+        **cache["val"],
+        "active_step_id": _state.active_step_id,
+        "project_root": _state.project_root,
+        "git_exists":   _state.git_exists,
     }
 
 
 def _active_step() -> dict | None:
-    plan = load_plan() if _state.get("project_root") else None
+    plan = _cached_load_plan() if _state.project_root else None
     if not plan:
         return None
-    sid = _state["active_step_id"]
+    sid = _state.active_step_id
     if sid is None:
         return None
-    for s in plan["steps"]:
-        if s["id"] == sid:
-            return s
-    return None
+    return _state.step_by_id.get(sid)
 
 
 def _first_pending_step() -> dict | None:
-    plan = load_plan() if _state.get("project_root") else None
-    if not plan:
+    plan = _cached_load_plan() if _state.project_root else None
+    if not plan or not _state.pending_order:
         return None
-    for s in plan["steps"]:
-        if s.get("status", "pending") == "pending":
-            return s
-    return None
+    return _state.step_by_id[_state.pending_order[0]]
+
+
+def _notify_state_change():
+    """Drop the cached status and wake every /events stream to push the new state."""
+    global _state_version
+    _status_cache["t"] = 0.0
+    with _state_changed:
+        _state_version += 1
+        _state_changed.notify_all()
+
+
+# Background jobs (plan, patch, refine, Run All) all run on one long-lived
+# daemon worker; starting one is a queue put, not a new thread.  bg_running
+# still decides whether a job may start.  A daemon thread (rather than a
+# ThreadPoolExecutor, whose workers are joined at exit) means quitting
+# never waits for an Ollama call in flight.
+_bg_jobs: queue.SimpleQueue = queue.SimpleQueue()
+_bg_worker: dict = {"thread": None}
+_bg_lock = threading.Lock()
+
+
+def _bg_loop():
+    while True:
+        job = _bg_jobs.get()
+        if job is None:
+            return
+        try:
+            job()
+        except Exception as exc:
+            print(f"Background job failed: {exc}")
+
+
+def _bg_submit(job):
+    """Run *job* on the background worker, starting the worker if needed."""
+    with _bg_lock:
+        worker = _bg_worker["thread"]
+        if worker is None or not worker.is_alive():
+            worker = threading.Thread(target=_bg_loop, name="ai-bg", daemon=True)
+            worker.start()
+            _bg_worker["thread"] = worker
+    _bg_jobs.put(job)
+
+
+def _bg_stop():
+    """Let the background worker exit once its current job is done."""
+    _bg_jobs.put(None)
+
+
+def _drop_speculative_refine(sid=None):
+    """Forget (and cancel) the speculative refine for step *sid*, or all of them."""
+    sids = list(_state.speculative_refines) if sid is None else [sid]
+    for key in sids:
+        spec = _state.speculative_refines.pop(key, None)
+        if spec is not None:
+            spec[2].set()
+
+
+def _prior_diffs(step_ids: list) -> dict:
+    """
+    {step_id: diff} for *step_ids*: the in-memory refined/raw diff where there
+    is one, else the one saved on disk.
+    """
+    def in_memory(sid):
+        return _state.refined_diffs.get(sid) or _state.diffs.get(sid)
+
+    missing = [sid for sid in step_ids if not in_memory(sid)]
+    saved = load_all_patches(missing) if missing else {}
+    diffs: dict = {}
+    for sid in step_ids:
+        d = in_memory(sid) or saved.get(sid)
+        if d:
+            diffs[sid] = d
+    return diffs
 
 
 def _flash(msg: str = "", error: str = ""):
-    _state["info"]  = msg
-    _state["error"] = error
+    _state.info  = msg
+    _state.error = error
+    _notify_state_change()
 
 
 # ---------------------------------------------------------------------------
@@ -169,17 +369,18 @@ def _apply_project_root(path: str) -> tuple[bool, str]:
         os.chdir(path)
     except PermissionError as e:
         return False, f"Cannot access folder: {e}"
-    _state["project_root"] = path
-    _state["git_exists"]   = os.path.isdir(os.path.join(path, ".git"))
-    _state["goal"]           = ""
-    _state["plan_prompt"]    = ""
-    _state["patch_prompts"].clear()
-    _state["ollama_prompts"].clear()
-    _state["diffs"].clear()
-    _state["refined_diffs"].clear()
-    _state["reviews"].clear()
-    _state["final_prompt"]   = ""
-    _state["active_step_id"] = None
+    _state.project_root = path
+    _state.git_exists   = os.path.isdir(os.path.join(path, ".git"))
+    _state.goal           = ""
+    _state.plan_prompt    = ""
+    _state.patch_prompts.clear()
+    _state.ollama_prompts.clear()
+    _state.diffs.clear()
+    _state.refined_diffs.clear()
+    _drop_speculative_refine()
+    _state.reviews.clear()
+    _state.final_prompt_chars = 0
+    _state.active_step_id = None
     return True, ""
 
 
@@ -189,22 +390,22 @@ def _apply_project_root(path: str) -> tuple[bool, str]:
 
 def _render(extra: dict | None = None):
     # Only read plan from disk once the user has chosen a project folder
-    plan = load_plan() if _state.get("project_root") else None
+    plan = _cached_load_plan() if _state.project_root else None
     if plan:
         for step in plan.get("steps", []):
             sid = step["id"]
-            if sid not in _state["ollama_prompts"]:
+            if sid not in _state.ollama_prompts:
                 saved = load_ollama_prompt(sid)
                 if saved:
-                    _state["ollama_prompts"][sid] = saved
-            if sid not in _state["refined_diffs"]:
+                    _state.ollama_prompts[sid] = saved
+            if sid not in _state.refined_diffs:
                 saved = load_refined_patch(sid)
                 if saved:
-                    _state["refined_diffs"][sid] = saved
-    if not _state["final_prompt"]:
+                    _state.refined_diffs[sid] = saved
+    if not _state.final_prompt_chars:
         saved = load_final_prompt()
         if saved:
-            _state["final_prompt"] = saved
+            _state.final_prompt_chars = len(saved)
     ctx = {
         "plan":        plan,
         "state":       _state,
@@ -213,7 +414,10 @@ def _render(extra: dict | None = None):
     }
     if extra:
         ctx.update(extra)
-    return render_template_string(HTML_TEMPLATE, **ctx)
+    # The page template is compiled once (_TEMPLATE, below HTML_TEMPLATE);
+    # render_template_string would lex and compile it again on every request
+    app.update_template_context(ctx)
+    return _TEMPLATE.render(ctx)
 
 
 # ---------------------------------------------------------------------------
@@ -222,34 +426,23 @@ def _render(extra: dict | None = None):
 
 @app.route("/browse", methods=["GET"])
 def browse_folder():
-    result: dict = {"path": "", "error": ""}
-    done = threading.Event()
-
-    def _pick():
-        try:
-            import tkinter as tk
-            from tkinter import filedialog
-            root = tk.Tk()
-            root.withdraw()
-            root.attributes("-topmost", True)
-            chosen = filedialog.askdirectory(
-                title="Select your project folder",
-                initialdir=_state.get("project_root", os.getcwd()),
-                parent=root,
-            )
-            root.destroy()
-            result["path"] = chosen or ""
-        except Exception as exc:
-            result["error"] = str(exc)
-        finally:
-            done.set()
+    """
+    Directory listing for the in-page folder picker:
+    {"path": abs path, "parent": its parent ("" at a root), "dirs": [names]}.
 
-    t = threading.Thread(target=_pick, daemon=True)
-    t.start()
-    done.wait(timeout=60)
-    if result["error"]:
-        return jsonify({"path": "", "error": result["error"]}), 500
-    return jsonify({"path": result["path"]})
+    ?path= picks the folder (default: the project folder, else the cwd).
+    The browser cannot reveal a chosen folder's absolute path, and a native
+    dialog would tie up a server thread until the user answered it.
+    """
+    path = request.args.get("path", "").strip() or _state.project_root or os.getcwd()
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+        with os.scandir(path) as it:
+            dirs = sorted((e.name for e in it if e.is_dir() and not e.name.startswith(".")), key=str.lower)
+    except OSError as exc:
+        return jsonify({"path": path, "error": f"Cannot open folder: {exc.strerror or exc}"}), 400
+    parent = os.path.dirname(path)
+    return jsonify({"path": path, "parent": parent if parent != path else "", "dirs": dirs})
 
 
 @app.route("/set-folder", methods=["POST"])
@@ -262,7 +455,7 @@ def set_folder():
     if not ok:
         _flash(error=err)
         return redirect(url_for("index"))
-    if _state["git_exists"]:
+    if _state.git_exists:
         _flash(f"Project folder set: {path}")
     else:
         _flash(f"Folder set: {path} — no .git found. Use 'Initialise Git' to set it up.")
@@ -272,10 +465,10 @@ def set_folder():
 @app.route("/git-init", methods=["POST"])
 def git_init():
     import subprocess
-    root = _state.get("project_root", os.getcwd())
+    root = _state.project_root
     result = subprocess.run(["git", "init"], capture_output=True, text=True, cwd=root)
     if result.returncode == 0:
-        _state["git_exists"] = True
+        _state.git_exists = True
         _flash(f"Git repo initialised in {root}")
     else:
         _flash(error=f"git init failed: {result.stderr.strip()}")
@@ -285,19 +478,19 @@ def git_init():
 @app.route("/set-models", methods=["POST"])
 def set_models():
     _default = os.getenv("OLLAMA_MODEL", "gemma3:4b")
-    _state["planner_model"]  = request.form.get("planner_model",  _default).strip() or _default
-    _state["patcher_model"]  = request.form.get("patcher_model",  _default).strip() or _default
-    _state["reviewer_model"] = request.form.get("reviewer_model", _default).strip() or _default
-    _state["refiner_model"]  = request.form.get("refiner_model",  _default).strip() or _default
+    _state.planner_model  = request.form.get("planner_model",  _default).strip() or _default
+    _state.patcher_model  = request.form.get("patcher_model",  _default).strip() or _default
+    _state.reviewer_model = request.form.get("reviewer_model", _default).strip() or _default
+    _state.refiner_model  = request.form.get("refiner_model",  _default).strip() or _default
     try:
-        num_ctx = int(request.form.get("num_ctx", _state["num_ctx"]))
+        num_ctx = int(request.form.get("num_ctx", _state.num_ctx))
         if num_ctx < 512:
             num_ctx = 512
-        _state["num_ctx"] = num_ctx
+        _state.num_ctx = num_ctx
         os.environ["OLLAMA_NUM_CTX"] = str(num_ctx)
     except (ValueError, TypeError):
         pass
-    _flash(f"✓ Models updated — Planner:{_state['planner_model']}  Patcher:{_state['patcher_model']}  Reviewer:{_state['reviewer_model']}  Refiner:{_state['refiner_model']}  ctx:{_state['num_ctx']}")
+    _flash(f"✓ Models updated — Planner:{_state.planner_model}  Patcher:{_state.patcher_model}  Reviewer:{_state.reviewer_model}  Refiner:{_state.refiner_model}  ctx:{_state.num_ctx}")
     return redirect(url_for("index"))
 
 
@@ -307,49 +500,76 @@ def set_models():
 
 @app.route("/")
 def index():
-    if _state["active_step_id"] is None:
+    if _state.active_step_id is None:
         step = _first_pending_step()
         if step:
-            _state["active_step_id"] = step["id"]
+            _state.active_step_id = step["id"]
     return _render()
 
 
+def _poll_payload() -> dict:
+    """Background-job state + flash messages, as sent by /status and /events."""
+    return {
+        "bg_running":     _state.bg_running,
+        "bg_label":       _state.bg_label,
+        "info":           _state.info,
+        "error":          _state.error,
+        "planner_model":  _state.planner_model,
+        "patcher_model":  _state.patcher_model,
+        "reviewer_model": _state.reviewer_model,
+        "refiner_model":  _state.refiner_model,
+        "num_ctx":        _state.num_ctx,
+    }
+
+
 @app.route("/status", methods=["GET"])
 def poll_status():
     """AJAX polling endpoint — returns current bg state + flash messages."""
-    _default = os.getenv("OLLAMA_MODEL", "gemma3:4b")
-    return jsonify({
-        "bg_running":     _state["bg_running"],
-        "bg_label":       _state["bg_label"],
-        "info":           _state["info"],
-        "error":          _state["error"],
-        "planner_model":  _state.get("planner_model",  _default),
-        "patcher_model":  _state.get("patcher_model",  _default),
-        "reviewer_model": _state.get("reviewer_model", _default),
-        "refiner_model":  _state.get("refiner_model",  _default),
-        "num_ctx":        _state.get("num_ctx", 32768),
-    })
+    return jsonify(_poll_payload())
+
+
+@app.route("/events", methods=["GET"])
+def events():
+    """
+    Server-sent events: the /status payload once on connect, then again on
+    every state change.  A comment line every 15 s keeps idle proxies and
+    the browser from dropping the stream.
+    """
+    def generate():
+        seen = -1
+        while True:
+            with _state_changed:
+                _state_changed.wait_for(lambda: _state_version != seen, timeout=15)
+                version = _state_version
+            if version == seen:
+                yield ": keep-alive\n\n"
+                continue
+            seen = version
+            yield f"data: {json.dumps(_poll_payload())}\n\n"
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/goal", methods=["POST"])
 def set_goal():
-    _state["goal"] = request.form.get("goal", "").strip()
-    _flash(f"Goal set: {_state['goal'][:60]}")
+    _state.goal = request.form.get("goal", "").strip()
+    _flash(f"Goal set: {_state.goal[:60]}")
     return redirect(url_for("index"))
 
 
 @app.route("/generate-plan", methods=["POST"])
 def generate_plan():
-    goal = request.form.get("goal", "").strip() or _state["goal"]
+    goal = request.form.get("goal", "").strip() or _state.goal
     if not goal:
         _flash(error="Please enter a goal first.")
         return redirect(url_for("index"))
-    _state["goal"] = goal
+    _state.goal = goal
     from ai_build.context import detect_stack
-    file_tree = get_repo_file_tree()
-    stack = detect_stack(_state.get("project_root", "."))
+    file_tree = cached_repo_file_tree()
+    stack = detect_stack(_state.project_root)
     prompt = _build_planning_prompt(goal, file_tree, stack)
-    _state["plan_prompt"] = prompt
+    _state.plan_prompt = prompt
     save_prompt("plan_prompt.txt", prompt)
     _flash("Planning prompt generated — copy it into Claude, then paste the JSON response below.")
     return redirect(url_for("index"))
@@ -357,14 +577,10 @@ def generate_plan():
 
 @app.route("/save-plan", methods=["POST"])
 def save_plan_route():
-    raw = request.form.get("plan_json", "").strip().lstrip("\ufeff")
+    raw = _strip_plan_fences(request.form.get("plan_json", ""))
     if not raw:
         _flash(error="Nothing pasted.")
         return redirect(url_for("index"))
-    if raw.startswith("```"):
-        lines = raw.splitlines()
-        end = len(lines) - 1 if lines[-1].strip() == "```" else len(lines)
-        raw = "\n".join(lines[1:end])
     try:
         data = json.loads(raw)
     except json.JSONDecodeError as e:
@@ -376,16 +592,17 @@ def save_plan_route():
         return redirect(url_for("index"))
     for step in steps:
         step.setdefault("status", "pending")
-    plan = {"goal": _state["goal"] or data.get("goal", ""), "steps": steps}
+    plan = {"goal": _state.goal or data.get("goal", ""), "steps": steps}
     save_plan(plan)
-    _state["active_step_id"] = steps[0]["id"] if steps else None
+    _invalidate_plan()
+    _state.active_step_id = steps[0]["id"] if steps else None
     _flash(f"Plan saved — {len(steps)} steps loaded.")
     return redirect(url_for("index"))
 
 
 @app.route("/select-step/<int:step_id>", methods=["POST"])
 def select_step(step_id: int):
-    _state["active_step_id"] = step_id
+    _state.active_step_id = step_id
     return redirect(url_for("index"))
 
 
@@ -397,7 +614,7 @@ def generate_patch():
         return redirect(url_for("index"))
     extra = request.form.get("extra_instructions", "").strip()
     prompt = _build_patch_prompt(step, extra_instructions=extra)
-    _state["patch_prompts"][step["id"]] = prompt
+    _state.patch_prompts[step["id"]] = prompt
     save_prompt(f"patch_prompt_step_{step['id']}.txt", prompt)
     _flash(f"Patch prompt for step {step['id']} generated — copy it into Claude, then paste the diff below.")
     return redirect(url_for("index"))
@@ -405,34 +622,36 @@ def generate_patch():
 
 @app.route("/plan-local", methods=["POST"])
 def plan_local():
-    goal = request.form.get("goal", "").strip() or _state["goal"]
+    goal = request.form.get("goal", "").strip() or _state.goal
     if not goal:
         _flash(error="Please enter a goal first.")
         return redirect(url_for("index"))
-    if _state["bg_running"]:
+    if _state.bg_running:
         _flash(error="Ollama is already running — please wait.")
         return redirect(url_for("index"))
-    _state["goal"] = goal
-    _state["bg_running"] = True
-    _state["bg_label"] = "Ollama is generating a plan… (30–90 s)"
+    _state.goal = goal
+    _state.bg_running = True
+    _state.bg_label = "Ollama is generating a plan… (30–90 s)"
     def _run():
         try:
             from ai_build.local_planner import generate_plan_local
-            plan_dict, err = generate_plan_local(goal, root=_state.get("project_root", "."), model=_state.get("planner_model"))
+            plan_dict, err = generate_plan_local(goal, root=_state.project_root, model=_state.planner_model)
             if err:
                 _flash(error=f"Ollama planning failed: {err}")
             else:
                 save_plan(plan_dict)
+                _invalidate_plan()
                 steps = plan_dict["steps"]
-                _state["active_step_id"] = steps[0]["id"] if steps else None
-                _state["plan_prompt"] = ""
+                _state.active_step_id = steps[0]["id"] if steps else None
+                _state.plan_prompt = ""
                 _flash(f"✓ Ollama generated a {len(steps)}-step plan.")
         except Exception as exc:
             _flash(error=f"Ollama planning error: {exc}")
         finally:
-            _state["bg_running"] = False
-            _state["bg_label"] = ""
-    threading.Thread(target=_run, daemon=True).start()
+            _state.bg_running = False
+            _state.bg_label = ""
+            _notify_state_change()
+    _bg_submit(_run)
     return redirect(url_for("index"))
 
 
@@ -442,47 +661,73 @@ def patch_local():
     if not step:
         _flash(error="No active step selected.")
         return redirect(url_for("index"))
-    if _state["bg_running"]:
+    if _state.bg_running:
         _flash(error="Ollama is already running — please wait.")
         return redirect(url_for("index"))
-    _state["bg_running"] = True
-    _state["bg_label"] = f"Ollama generating patch for step {step['id']}… (30–90 s)"
+    _state.bg_running = True
+    _state.bg_label = f"Ollama generating patch for step {step['id']}… (30–90 s)"
     def _run():
         try:
             from ai_build.local_patcher import generate_patch_local
-            from ai_build.storage import load_patch, load_refined_patch
 
             # Build prior_diffs: all steps approved before this one
-            plan = load_plan()
+            plan = _cached_load_plan()
             prior_diffs: dict = {}
             if plan:
-                for s in plan["steps"]:
-                    if s["id"] < step["id"] and s.get("status") in ("approved", "applied"):
-                        d = _state["refined_diffs"].get(s["id"]) or _state["diffs"].get(s["id"])
-                        if not d:
-                            d = load_refined_patch(s["id"]) or load_patch(s["id"])
-                        if d:
-                            prior_diffs[s["id"]] = d
-
-            diff, err, ollama_prompt = generate_patch_local(step, root=_state.get("project_root", "."), prior_diffs=prior_diffs, model=_state.get("patcher_model"))
+                prior_ids = [
+                    s["id"] for s in plan["steps"]
+                    if s["id"] < step["id"] and s.get("status") in ("approved", "applied")
+                ]
+                prior_diffs = _prior_diffs(prior_ids)
+
+            diff, err, ollama_prompt = generate_patch_local(step, root=_state.project_root, prior_diffs=prior_diffs, model=_state.patcher_model)
             sid = step["id"]
-            _state["ollama_prompts"][sid] = ollama_prompt
-            save_prompt(f"ollama_patch_step_{sid}.txt", ollama_prompt)
+            _state.ollama_prompts[sid] = ollama_prompt
+            save_prompt(f"ollama_patch_step_{sid}.txt", ollama_prompt, background=True)
             if err:
                 _flash(error=f"Ollama patch generation failed: {err}")
                 return
-            _state["diffs"][sid] = diff
-            save_patch(sid, diff)
-            _proj_ctx = _project_context_text(_state.get("project_root", "."))
-            rev = review_patch(diff, step["description"], context=_proj_ctx, model=_state.get("reviewer_model"))
-            _state["reviews"][sid] = rev
+            _state.diffs[sid] = diff
+            save_patch(sid, diff, background=True)
+            # The review goes to Ollama first — it is what the user is waiting
+            # for.  A speculative refine is queued behind it; /refine-patch
+            # picks that up if the review has concerns but lists no issues,
+            # otherwise it is cancelled as soon as the review is back.
+            _proj_ctx = _project_context_text(_state.project_root)
+            review_sent = threading.Event()
+            review: Future = Future()
+
+            def _review():
+                try:
+                    review.set_result(review_patch(
+                        diff, step["description"], context=_proj_ctx,
+                        model=_state.reviewer_model, sent=review_sent,
+                    ))
+                except BaseException as exc:
+                    review.set_exception(exc)
+
+            threading.Thread(target=_review, daemon=True).start()
+            review_sent.wait()
+            from ai_build.refiner import refine_speculatively
+            _drop_speculative_refine(sid)
+            spec_cancel = threading.Event()
+            _state.speculative_refines[sid] = (
+                diff,
+                refine_speculatively(diff, step, root=_state.project_root, model=_state.refiner_model, cancel=spec_cancel),
+                spec_cancel,
+            )
+            rev = review.result()
+            _state.reviews[sid] = rev
+            if not (isinstance(rev, dict) and rev.get("verdict") == "concerns" and not rev.get("issues")):
+                _drop_speculative_refine(sid)
             _flash(f"✓ Patch generated and reviewed for step {sid}.")
         except Exception as exc:
             _flash(error=f"Ollama patch error: {exc}")
         finally:
-            _state["bg_running"] = False
-            _state["bg_label"] = ""
-    threading.Thread(target=_run, daemon=True).start()
+            _state.bg_running = False
+            _state.bg_label = ""
+            _notify_state_change()
+    _bg_submit(_run)
     return redirect(url_for("index"))
 
 
@@ -502,12 +747,13 @@ def review_patch_route():
         _flash(error="Pasted text doesn't look like a unified diff (needs ---, +++, @@).")
         return redirect(url_for("index"))
     sid = step["id"]
-    _state["diffs"][sid] = patch
-    save_patch(sid, patch)
+    _state.diffs[sid] = patch
+    _drop_speculative_refine(sid)
+    save_patch(sid, patch, background=True)
     _flash("Sending diff to Ollama for review…")
-    _proj_ctx = _project_context_text(_state.get("project_root", "."))
-    review = review_patch(patch, step["description"], context=_proj_ctx, model=_state.get("reviewer_model"))
-    _state["reviews"][sid] = review
+    _proj_ctx = _project_context_text(_state.project_root)
+    review = review_patch(patch, step["description"], context=_proj_ctx, model=_state.reviewer_model)
+    _state.reviews[sid] = review
     _flash("Review complete — choose Approve, Skip, or Retry.")
     return redirect(url_for("index"))
 
@@ -519,22 +765,19 @@ def apply_patch_route():
         _flash(error="No active step selected.")
         return redirect(url_for("index"))
     sid = step["id"]
-    best_diff = _state["refined_diffs"].get(sid) or _state["diffs"].get(sid, "")
+    best_diff = _state.refined_diffs.get(sid) or _state.diffs.get(sid, "")
     if not best_diff:
         _flash(error="No diff found — generate a patch first.")
         return redirect(url_for("index"))
-    update_step_status(sid, "approved")
-    _state["final_prompt"] = ""
-    plan = load_plan()
-    if plan:
-        next_step = next(
-            (s for s in plan["steps"] if s.get("status", "pending") == "pending"), None
-        )
-        _state["active_step_id"] = next_step["id"] if next_step else None
-    else:
-        _state["active_step_id"] = None
-    _state["diffs"].pop(sid, None)
-    _state["reviews"].pop(sid, None)
+    _set_step_status(sid, "approved")
+    _state.final_prompt_chars = 0
+    next_step = _first_pending_step()
+    _state.active_step_id = next_step["id"] if next_step else None
+    _state.diffs.pop(sid, None)
+    _state.reviews.pop(sid, None)
+    _drop_speculative_refine(sid)
+    # Checkpoint: the approved step's diff is what later steps build on
+    flush_writes(sync=True)
     _flash(f"✓ Step {sid} approved.")
     return redirect(url_for("index"))
 
@@ -545,23 +788,32 @@ def refine_patch_route():
     if not step:
         _flash(error="No active step selected.")
         return redirect(url_for("index"))
-    if _state["bg_running"]:
+    if _state.bg_running:
         _flash(error="Ollama is already running — please wait.")
         return redirect(url_for("index"))
     sid = step["id"]
-    diff = _state["diffs"].get(sid, "")
+    diff = _state.diffs.get(sid, "")
     if not diff:
         _flash(error="No diff to refine — generate a patch first.")
         return redirect(url_for("index"))
-    review = _state["reviews"].get(sid, "")
-    _state["bg_running"] = True
-    _state["bg_label"] = f"Ollama-Refiner cleaning up patch for step {sid}…"
+    review = _state.reviews.get(sid, "")
+    _state.bg_running = True
+    _state.bg_label = f"Ollama-Refiner cleaning up patch for step {sid}…"
     def _run():
         try:
             from ai_build.refiner import refine_patch
-            refined, err = refine_patch(diff, step, review, root=_state.get("project_root", "."), model=_state.get("refiner_model"))
-            _state["refined_diffs"][sid] = refined
-            save_refined_patch(sid, refined)
+            spec = _state.speculative_refines.pop(sid, None)
+            if (spec and spec[0] == diff and isinstance(review, dict)
+                    and review.get("verdict") == "concerns" and not review.get("issues")):
+                # Nothing specific to fix, so the speculative pass is as good
+                # as a fresh one
+                refined, err = spec[1].result()
+            else:
+                if spec:
+                    spec[2].set()
+                refined, err = refine_patch(diff, step, review, root=_state.project_root, model=_state.refiner_model)
+            _state.refined_diffs[sid] = refined
+            save_refined_patch(sid, refined, background=True)
             if err:
                 _flash(f"✓ Step {sid} refined (note: {err[:120]})")
             else:
@@ -569,41 +821,43 @@ def refine_patch_route():
         except Exception as exc:
             _flash(error=f"Refiner error: {exc}")
         finally:
-            _state["bg_running"] = False
-            _state["bg_label"] = ""
-    threading.Thread(target=_run, daemon=True).start()
+            _state.bg_running = False
+            _state.bg_label = ""
+            _notify_state_change()
+    _bg_submit(_run)
     return redirect(url_for("index"))
 
 
 @app.route("/assemble-prompt", methods=["POST"])
 def assemble_prompt():
-    plan = load_plan()
+    plan = _cached_load_plan()
     if not plan:
         _flash(error="No plan loaded.")
         return redirect(url_for("index"))
-    approved_diffs: dict[int, str] = {}
-    for step in plan["steps"]:
-        sid = step["id"]
-        if step.get("status") == "approved":
-            diff = _state["refined_diffs"].get(sid) or _state["diffs"].get(sid, "")
-            if not diff:
-                from ai_build.storage import load_refined_patch, load_patch
-                diff = load_refined_patch(sid) or load_patch(sid) or ""
-            if diff:
-                approved_diffs[sid] = diff
+    approved_diffs = _prior_diffs(
+        [step["id"] for step in plan["steps"] if step.get("status") == "approved"]
+    )
     if not approved_diffs:
         _flash(error="No approved steps yet — approve at least one step first.")
         return redirect(url_for("index"))
-    from ai_build.assembler import assemble_final_prompt
-    goal = _state.get("goal", plan.get("goal", ""))
-    root = _state.get("project_root", ".")
-    prompt = assemble_final_prompt(goal, plan, approved_diffs, root=root)
-    _state["final_prompt"] = prompt
-    save_final_prompt(prompt)
+    from ai_build.assembler import write_final_prompt
+    goal = _state.goal
+    root = _state.project_root
+    ensure_dirs()
+    _state.final_prompt_chars = write_final_prompt(goal, plan, approved_diffs, final_prompt_path(), root=root)
     _flash(f"✓ Final prompt assembled from {len(approved_diffs)} approved step(s).")
     return redirect(url_for("index"))
 
 
+@app.route("/final-prompt", methods=["GET"])
+def final_prompt():
+    """The assembled final prompt as plain text (conditional GET, so an unchanged prompt is a 304)."""
+    path = os.path.abspath(final_prompt_path())
+    if not os.path.isfile(path):
+        return "No final prompt assembled yet.", 404
+    return send_file(path, mimetype="text/plain", conditional=True, max_age=0)
+
+
 @app.route("/skip-step", methods=["POST"])
 def skip_step():
     step = _active_step()
@@ -611,27 +865,23 @@ def skip_step():
         _flash(error="No active step.")
         return redirect(url_for("index"))
     sid = step["id"]
-    update_step_status(sid, "skipped")
-    plan = load_plan()
-    if plan:
-        next_step = next(
-            (s for s in plan["steps"] if s.get("status", "pending") == "pending"), None
-        )
-        _state["active_step_id"] = next_step["id"] if next_step else None
-    else:
-        _state["active_step_id"] = None
-    _state["diffs"].pop(sid, None)
-    _state["reviews"].pop(sid, None)
+    _set_step_status(sid, "skipped")
+    next_step = _first_pending_step()
+    _state.active_step_id = next_step["id"] if next_step else None
+    _state.diffs.pop(sid, None)
+    _state.reviews.pop(sid, None)
+    _drop_speculative_refine(sid)
     _flash(f"Step {sid} skipped.")
     return redirect(url_for("index"))
 
 
 @app.route("/reset-step/<int:step_id>", methods=["POST"])
 def reset_step(step_id: int):
-    update_step_status(step_id, "pending")
-    _state["active_step_id"] = step_id
-    _state["diffs"].pop(step_id, None)
-    _state["reviews"].pop(step_id, None)
+    _set_step_status(step_id, "pending")
+    _state.active_step_id = step_id
+    _state.diffs.pop(step_id, None)
+    _state.reviews.pop(step_id, None)
+    _drop_speculative_refine(step_id)
     _flash(f"Step {step_id} reset to pending.")
     return redirect(url_for("index"))
 
@@ -642,91 +892,95 @@ def clear_plan():
     plan_file = pathlib.Path(".ai-build") / "plan.json"
     if plan_file.exists():
         plan_file.unlink()
-    _state["plan_prompt"] = ""
-    _state["patch_prompts"].clear()
-    _state["ollama_prompts"].clear()
-    _state["diffs"].clear()
-    _state["refined_diffs"].clear()
-    _state["reviews"].clear()
-    _state["final_prompt"] = ""
-    _state["active_step_id"] = None
-    _state["goal"] = ""
+    _invalidate_plan()
+    _state.plan_prompt = ""
+    _state.patch_prompts.clear()
+    _state.ollama_prompts.clear()
+    _state.diffs.clear()
+    _state.refined_diffs.clear()
+    _drop_speculative_refine()
+    _state.reviews.clear()
+    _state.final_prompt_chars = 0
+    _state.active_step_id = None
+    _state.goal = ""
     _flash("Plan cleared.")
     return redirect(url_for("index"))
 
 
 @app.route("/run-all", methods=["POST"])
 def run_all():
-    plan = load_plan()
+    plan = _cached_load_plan()
     if not plan:
         _flash(error="No plan loaded.")
         return redirect(url_for("index"))
-    if _state["bg_running"]:
+    if _state.bg_running:
         _flash(error="Already running — please wait.")
         return redirect(url_for("index"))
     pending = [s for s in plan["steps"] if s.get("status", "pending") == "pending"]
     if not pending:
         _flash(error="No pending steps.")
         return redirect(url_for("index"))
-    _state["bg_running"] = True
-    _state["bg_label"] = f"Run All: starting {len(pending)} step(s)…"
+    _state.bg_running = True
+    _state.bg_label = f"Run All: starting {len(pending)} step(s)…"
     def _run():
         try:
             from ai_build.local_patcher import generate_patch_local
-            root = _state.get("project_root", ".")
+            root = _state.project_root
             # Build rich project context once — reused for every step's review
             _proj_ctx = _project_context_text(root)
+            # Diffs of the steps approved before this run (in memory or saved);
+            # each step approved below is added as it goes, so the plan is
+            # scanned once rather than once per step
+            prior_diffs = _prior_diffs(
+                [s["id"] for s in plan["steps"] if s.get("status") in ("approved", "applied")]
+            )
             n = len(pending)
             approved_count = 0
             for i, step in enumerate(pending, 1):
                 sid = step["id"]
-                _state["bg_label"] = f"Step {i}/{n} — Generating: {step['title'][:40]}…"
-
-                # Build prior_diffs from in-memory state — more reliable than
-                # re-reading plan.json mid-loop (avoids stale disk reads).
-                prior_diffs: dict = {}
-                for s in plan["steps"]:
-                    if s["id"] < sid and s.get("status") in ("approved", "applied"):
-                        d = _state["refined_diffs"].get(s["id"]) or _state["diffs"].get(s["id"])
-                        if d:
-                            prior_diffs[s["id"]] = d
-
-                diff, err, ollama_prompt = generate_patch_local(step, root=root, prior_diffs=prior_diffs, model=_state.get("patcher_model"))
-                _state["ollama_prompts"][sid] = ollama_prompt
-                save_prompt(f"ollama_patch_step_{sid}.txt", ollama_prompt)
+                _state.bg_label = f"Step {i}/{n} — Generating: {step['title'][:40]}…"
+                _notify_state_change()
+
+                diff, err, ollama_prompt = generate_patch_local(step, root=root, prior_diffs=prior_diffs, model=_state.patcher_model)
+                _state.ollama_prompts[sid] = ollama_prompt
+                save_prompt(f"ollama_patch_step_{sid}.txt", ollama_prompt, background=True)
                 if err:
                     _flash(error=f"Step {sid} patch failed: {err}")
                     continue
-                _state["diffs"][sid] = diff
-                save_patch(sid, diff)
-                _state["bg_label"] = f"Step {i}/{n} — Reviewing: {step['title'][:40]}…"
-                rev = review_patch(diff, step["description"], context=_proj_ctx, model=_state.get("reviewer_model"))
-                _state["reviews"][sid] = rev
-                update_step_status(sid, "approved")
-                _state["active_step_id"] = sid
+                _state.diffs[sid] = diff
+                save_patch(sid, diff, background=True)
+                _state.bg_label = f"Step {i}/{n} — Reviewing: {step['title'][:40]}…"
+                _notify_state_change()
+                rev = review_patch(diff, step["description"], context=_proj_ctx, model=_state.reviewer_model)
+                _state.reviews[sid] = rev
+                _set_step_status(sid, "approved")
+                prior_diffs[sid] = _state.refined_diffs.get(sid) or diff
+                _state.active_step_id = sid
                 approved_count += 1
-            _state["bg_label"] = "Assembling Final Agent Prompt…"
-            plan2 = load_plan()
+            _state.bg_label = "Assembling Final Agent Prompt…"
+            _notify_state_change()
+            plan2 = _cached_load_plan()
             approved_diffs = {}
             for s in (plan2 or {}).get("steps", []):
                 s2id = s["id"]
                 if s.get("status") == "approved":
-                    d = _state["refined_diffs"].get(s2id) or _state["diffs"].get(s2id, "")
+                    d = _state.refined_diffs.get(s2id) or _state.diffs.get(s2id, "")
                     if d:
                         approved_diffs[s2id] = d
             if approved_diffs:
-                from ai_build.assembler import assemble_final_prompt
-                goal = _state.get("goal", plan2.get("goal", ""))
-                fp = assemble_final_prompt(goal, plan2, approved_diffs, root=root)
-                _state["final_prompt"] = fp
-                save_final_prompt(fp)
+                from ai_build.assembler import write_final_prompt
+                goal = _state.goal
+                ensure_dirs()
+                _state.final_prompt_chars = write_final_prompt(goal, plan2, approved_diffs, final_prompt_path(), root=root)
+            flush_writes(sync=True)
             _flash(f"✓ Run All complete — {approved_count}/{n} steps approved. Final prompt ready!")
         except Exception as exc:
             _flash(error=f"Run All error: {exc}")
         finally:
-            _state["bg_running"] = False
-            _state["bg_label"] = ""
-    threading.Thread(target=_run, daemon=True).start()
+            _state.bg_running = False
+            _state.bg_label = ""
+            _notify_state_change()
+    _bg_submit(_run)
     return redirect(url_for("index"))
 
 
@@ -760,309 +1014,7 @@ HTML_TEMPLATE = r"""<!DOCTYPE html>
 <title>ZeroToken</title>
 <link rel="preconnect" href="https://fonts.googleapis.com">
 <link href="https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@300;400;500;600;700&family=Space+Grotesk:wght@400;500;600;700&display=swap" rel="stylesheet">
-<style>
-/* ── Reset & tokens ─────────────────────────────────────────── */
-*{box-sizing:border-box;margin:0;padding:0;}
-:root{
-  --bg:       #0d0d0f;
-  --surface:  #131316;
-  --surface2: #1a1a1f;
-  --border:   #252530;
-  --border2:  #2e2e3a;
-  --accent:   #5b7fff;
-  --accent-dim:#1e2a5e;
-  --teal:     #2dd4bf;
-  --teal-dim: #0d2b28;
-  --green:    #22c55e;
-  --green-dim:#0d2b1a;
-  --yellow:   #facc15;
-  --yellow-dim:#2a2200;
-  --red:      #f87171;
-  --red-dim:  #2b0d0d;
-  --text:     #e8e8f0;
-  --text2:    #9090a8;
-  --text3:    #55556a;
-  --mono:     'JetBrains Mono', 'Fira Code', monospace;
-  --sans:     'Space Grotesk', system-ui, sans-serif;
-  --r:        10px;
-  --r-sm:     6px;
-}
-
-/* ── Layout skeleton ─────────────────────────────────────────── */
-html,body{height:100%;overflow:hidden;background:var(--bg);color:var(--text);font-family:var(--mono);font-size:13px;}
-.shell{display:grid;grid-template-rows:48px 1fr;grid-template-columns:200px 1fr;height:100vh;}
-.topbar{grid-column:1/-1;grid-row:1;display:flex;align-items:center;gap:12px;padding:0 16px;background:var(--surface);border-bottom:1px solid var(--border);z-index:50;}
-.sidebar{grid-row:2;background:var(--surface);border-right:1px solid var(--border);display:flex;flex-direction:column;overflow-y:auto;}
-.main{grid-row:2;overflow-y:auto;padding:20px;background:var(--bg);}
-
-/* ── Topbar ──────────────────────────────────────────────────── */
-.logo{display:flex;align-items:center;gap:8px;font-weight:700;font-size:14px;letter-spacing:-.3px;}
-.logo svg{flex-shrink:0;}
-.topbar-sep{width:1px;height:20px;background:var(--border);margin:0 4px;}
-.project-name{font-size:11px;color:var(--accent);max-width:200px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;cursor:pointer;border:none;background:none;font-family:var(--mono);padding:2px 4px;border-radius:4px;}
-.project-name:hover{background:var(--accent-dim);}
-.topbar-right{margin-left:auto;display:flex;align-items:center;gap:8px;}
-.pill{display:inline-flex;align-items:center;gap:5px;padding:3px 9px;border-radius:20px;font-size:10px;font-weight:600;font-family:var(--sans);}
-.pill-green{background:#0d2b1a;color:var(--green); border:1px solid #1a5c3a;}
-.pill-red  {background:var(--red-dim);color:var(--red);border:1px solid #5c1a1a;}
-.pill-yellow{background:var(--yellow-dim);color:var(--yellow);border:1px solid #5c4a00;}
-.pill-grey {background:#1a1a22;color:var(--text3);border:1px solid var(--border);}
-.pill-blue {background:var(--accent-dim);color:var(--accent);border:1px solid #2a3a8e;}
-.dot{width:5px;height:5px;border-radius:50%;display:inline-block;}
-
-/* ── Sidebar ─────────────────────────────────────────────────── */
-.sidebar-header{padding:14px 14px 10px;font-size:10px;font-weight:700;letter-spacing:1.2px;text-transform:uppercase;color:var(--text3);}
-.phase-block{padding:6px 10px;margin:0 6px;border-radius:var(--r-sm);}
-.phase-label{font-size:10px;font-weight:700;letter-spacing:.8px;text-transform:uppercase;color:var(--text3);padding:8px 10px 4px;margin-top:4px;}
-.step-item{
-  display:flex;align-items:center;gap:8px;
-  padding:7px 10px;margin:1px 6px;border-radius:var(--r-sm);
-  cursor:pointer;transition:background .12s;
-  font-size:11px;color:var(--text2);text-decoration:none;border:none;background:none;width:calc(100% - 12px);text-align:left;
-}
-.step-item:hover{background:var(--surface2);}
-.step-item.active{background:var(--accent-dim);color:var(--text);}
-.step-dot{width:18px;height:18px;border-radius:50%;border:1.5px solid var(--border2);display:flex;align-items:center;justify-content:center;font-size:9px;flex-shrink:0;}
-.sd-pending {border-color:var(--text3);color:var(--text3);}
-.sd-approved{border-color:var(--green);background:var(--green-dim);color:var(--green);}
-.sd-skipped {border-color:var(--yellow);background:var(--yellow-dim);color:var(--yellow);}
-.sd-failed  {border-color:var(--red);background:var(--red-dim);color:var(--red);}
-.step-title{flex:1;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;font-size:11px;}
-.sidebar-footer{margin-top:auto;padding:8px;border-top:1px solid var(--border);}
-.sidebar-stat{display:flex;justify-content:space-between;font-size:10px;color:var(--text3);padding:3px 4px;}
-.sidebar-stat span:last-child{color:var(--text2);}
-
-/* ── Model-settings collapsible ─────────────────────────────── */
-.model-details{border-top:1px solid var(--border);margin-top:4px;}
-.model-details>summary{
-  list-style:none;display:flex;align-items:center;justify-content:space-between;
-  font-size:10px;font-weight:700;letter-spacing:.8px;text-transform:uppercase;
-  color:var(--text3);padding:8px 10px 6px;cursor:pointer;
-  font-family:var(--sans);
-}
-.model-details>summary::-webkit-details-marker{display:none;}
-.model-details>summary:hover{color:var(--text2);}
-.model-details[open]>summary{color:var(--accent);}
-.model-details>.ms-body{padding:4px 10px 10px;}
-.ms-row{margin-bottom:7px;}
-.ms-label{display:block;font-size:9px;font-weight:700;letter-spacing:.6px;text-transform:uppercase;color:var(--text3);margin-bottom:3px;font-family:var(--sans);}
-.ms-select{
-  width:100%;background:var(--bg);border:1px solid var(--border2);
-  border-radius:4px;color:var(--text);font-family:var(--mono);
-  font-size:10px;padding:3px 5px;appearance:none;
-  background-image:url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='8' height='5' viewBox='0 0 8 5'%3E%3Cpath d='M0 0l4 5 4-5z' fill='%239090a8'/%3E%3C/svg%3E");
-  background-repeat:no-repeat;background-position:calc(100% - 6px) center;padding-right:18px;
-}
-.ms-select:focus{outline:none;border-color:var(--accent);}
-
-/* ── Cards & sections ────────────────────────────────────────── */
-.card{background:var(--surface);border:1px solid var(--border);border-radius:var(--r);margin-bottom:16px;overflow:hidden;}
-.card-title{font-size:11px;font-weight:700;letter-spacing:.8px;text-transform:uppercase;color:var(--text3);padding:14px 16px 0;font-family:var(--sans);}
-.card-body{padding:14px 16px 16px;}
-.page-title{font-family:var(--sans);font-size:20px;font-weight:700;color:var(--text);margin-bottom:4px;}
-.page-sub{font-size:12px;color:var(--text2);margin-bottom:20px;line-height:1.5;}
-
-/* ── How-to boxes ────────────────────────────────────────────── */
-.howto{
-  background:var(--accent-dim);border:1px solid #2a3a8e;
-  border-radius:var(--r);padding:14px 16px;margin-bottom:16px;
-}
-.howto-title{font-family:var(--sans);font-size:12px;font-weight:600;color:var(--accent);margin-bottom:8px;display:flex;align-items:center;gap:6px;}
-.howto-body{font-size:11px;color:#8ba0e8;line-height:1.7;}
-.howto-body b{color:var(--text);font-weight:600;}
-.howto-steps{list-style:none;padding:0;margin:8px 0 0;}
-.howto-steps li{display:flex;gap:10px;margin-bottom:6px;font-size:11px;color:#8ba0e8;line-height:1.5;}
-.howto-steps li .num{
-  width:18px;height:18px;border-radius:50%;background:var(--accent);color:#fff;
-  font-size:9px;font-weight:700;display:flex;align-items:center;justify-content:center;flex-shrink:0;margin-top:1px;
-}
-.tip{background:var(--teal-dim);border:1px solid #1a4a44;border-radius:var(--r-sm);padding:10px 12px;font-size:11px;color:#7dddd4;margin-top:10px;line-height:1.6;}
-.tip b{color:var(--teal);}
-
-/* ── Alerts ──────────────────────────────────────────────────── */
-.alert{padding:10px 14px;border-radius:var(--r-sm);margin-bottom:14px;font-size:12px;line-height:1.5;}
-.alert-info {background:var(--accent-dim);border:1px solid #2a3a8e;color:#8ba0e8;}
-.alert-ok   {background:var(--green-dim);border:1px solid #1a5c3a;color:#6dda8a;}
-.alert-error{background:var(--red-dim);border:1px solid #5c1a1a;color:var(--red);}
-
-/* ── Loading banner ──────────────────────────────────────────── */
-.loading-bar{
-  display:flex;align-items:center;gap:10px;
-  background:var(--accent-dim);border:1px solid var(--accent);
-  border-radius:var(--r-sm);padding:12px 14px;margin-bottom:14px;
-}
-.loading-bar .lb-text{flex:1;font-size:12px;color:var(--text);}
-.loading-bar .lb-time{font-size:10px;color:var(--text2);font-family:var(--sans);}
-@keyframes spin{to{transform:rotate(360deg);}}
-.spinner{width:14px;height:14px;border:2px solid var(--border2);border-top-color:var(--accent);border-radius:50%;animation:spin .8s linear infinite;flex-shrink:0;}
-
-/* ── Forms ───────────────────────────────────────────────────── */
-textarea,input[type=text]{
-  width:100%;background:var(--bg);border:1px solid var(--border2);
-  border-radius:var(--r-sm);color:var(--text);
-  font-family:var(--mono);font-size:12px;padding:10px 12px;
-  resize:vertical;outline:none;transition:border-color .15s;
-}
-textarea:focus,input[type=text]:focus{border-color:var(--accent);}
-label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8px;text-transform:uppercase;color:var(--text3);margin-bottom:6px;font-family:var(--sans);}
-
-/* ── Buttons ─────────────────────────────────────────────────── */
-.btn{
-  display:inline-flex;align-items:center;gap:6px;
-  padding:9px 16px;border:none;border-radius:var(--r-sm);
-  font-family:var(--mono);font-size:12px;font-weight:600;
-  cursor:pointer;transition:opacity .12s,transform .08s;white-space:nowrap;
-}
-.btn:active{transform:scale(.97);}
-.btn:hover{opacity:.85;}
-.btn-sm{padding:6px 12px;font-size:11px;}
-.btn-primary{background:var(--accent);color:#fff;}
-.btn-teal   {background:var(--teal-dim);color:var(--teal);border:1px solid var(--teal);}
-.btn-green  {background:var(--green-dim);color:var(--green);border:1px solid var(--green);}
-.btn-yellow {background:var(--yellow-dim);color:var(--yellow);border:1px solid var(--yellow);}
-.btn-red    {background:var(--red-dim);color:var(--red);border:1px solid var(--red);}
-.btn-ghost  {background:transparent;color:var(--text2);border:1px solid var(--border2);}
-.btn-copy   {background:var(--accent-dim);color:var(--accent);border:1px solid #2a3a8e;}
-.btn-row{display:flex;gap:8px;flex-wrap:wrap;margin-top:10px;align-items:center;}
-
-/* ── Diff viewer ─────────────────────────────────────────────── */
-.diff-view{
-  background:var(--bg);border:1px solid var(--border);border-radius:var(--r-sm);
-  padding:8px;font-size:11px;line-height:1.5;overflow:auto;max-height:240px;
-}
-.diff-view .add{background:#0d2b0d;color:#6abf69;display:block;white-space:pre;}
-.diff-view .del{background:#2b0d0d;color:#f07070;display:block;white-space:pre;}
-.diff-view .hdr{color:#64d2ff;display:block;white-space:pre;}
-.diff-view .ctx{color:var(--text3);display:block;white-space:pre;}
-.diff-view .fn {color:var(--yellow);font-weight:bold;display:block;white-space:pre;}
-
-/* ── Review output ───────────────────────────────────────────── */
-.verdict-badge{display:inline-block;padding:3px 10px;border-radius:20px;font-size:10px;font-weight:700;letter-spacing:.5px;text-transform:uppercase;font-family:var(--sans);margin-bottom:8px;}
-.verdict-approve {background:var(--green-dim);color:var(--green);border:1px solid var(--green);}
-.verdict-concerns{background:var(--yellow-dim);color:var(--yellow);border:1px solid var(--yellow);}
-.verdict-reject  {background:var(--red-dim);color:var(--red);border:1px solid var(--red);}
-.review-summary{font-size:12px;color:#8ba0e8;line-height:1.6;margin-bottom:8px;}
-.review-issues{list-style:none;padding:0;margin:0 0 6px;}
-.review-issues li{font-size:11px;color:var(--text2);line-height:1.8;padding-left:14px;position:relative;}
-.review-issues li::before{content:"·";position:absolute;left:4px;color:var(--yellow);}
-.review-plain{background:var(--bg);border:1px solid var(--border);border-radius:var(--r-sm);padding:10px;font-size:11px;line-height:1.8;color:var(--text2);}
-
-/* ── Prompt box ──────────────────────────────────────────────── */
-.prompt-box{
-  background:var(--bg);border:1px solid var(--border);border-radius:var(--r-sm);
-  padding:10px;font-size:10px;line-height:1.6;white-space:pre-wrap;
-  word-break:break-word;max-height:200px;overflow-y:auto;color:var(--text);
-}
-.prompt-header{display:flex;justify-content:space-between;align-items:center;margin-bottom:6px;}
-
-/* ── Final prompt ────────────────────────────────────────────── */
-.final-ta{
-  width:100%;height:220px;background:#060610;
-  border:1px solid var(--teal);border-radius:var(--r-sm);
-  color:var(--text);font-family:var(--mono);font-size:11px;
-  padding:12px;resize:vertical;line-height:1.5;
-}
-.final-card{background:linear-gradient(135deg,#08101e,var(--teal-dim));border:1px solid var(--teal);}
-
-/* ── Step workflow stages ────────────────────────────────────── */
-.stage{border-left:2px solid var(--border2);padding-left:14px;margin-bottom:18px;position:relative;}
-.stage::before{
-  content:attr(data-n);
-  position:absolute;left:-10px;top:0;
-  width:18px;height:18px;border-radius:50%;
-  background:var(--surface2);border:1.5px solid var(--border2);
-  font-size:9px;font-weight:700;color:var(--text3);
-  display:flex;align-items:center;justify-content:center;
-  font-family:var(--sans);
-}
-.stage.done{border-color:var(--green);}
-.stage.done::before{background:var(--green-dim);border-color:var(--green);color:var(--green);}
-.stage.active-stage{border-color:var(--accent);}
-.stage.active-stage::before{background:var(--accent-dim);border-color:var(--accent);color:var(--accent);}
-.stage-title{font-size:10px;font-weight:700;letter-spacing:.8px;text-transform:uppercase;color:var(--text3);margin-bottom:8px;font-family:var(--sans);}
-
-/* ── Divider ─────────────────────────────────────────────────── */
-.div{border:none;border-top:1px solid var(--border);margin:14px 0;}
-
-/* ── Folder bar ──────────────────────────────────────────────── */
-.folder-display{
-  background:var(--bg);border:1px solid var(--border);border-radius:var(--r-sm);
-  padding:6px 10px;font-size:11px;color:#64d2ff;flex:1;
-  white-space:nowrap;overflow:hidden;text-overflow:ellipsis;
-}
-
-/* ── Onboarding screen ───────────────────────────────────────── */
-.onboard-wrap{
-  max-width:560px;margin:40px auto 0;
-  display:flex;flex-direction:column;gap:0;
-}
-.onboard-logo{
-  display:flex;align-items:center;gap:10px;margin-bottom:6px;
-}
-.onboard-logo-text{
-  font-size:22px;font-weight:700;letter-spacing:-.5px;color:var(--text);
-}
-.onboard-sub{
-  font-size:13px;color:var(--text3);margin-bottom:22px;
-}
-.onboard-field-label{
-  font-size:11px;font-weight:600;text-transform:uppercase;letter-spacing:.06em;
-  color:var(--text2);margin-bottom:6px;
-}
-.onboard-folder-row{
-  display:flex;gap:8px;align-items:center;
-}
-.onboard-btn-row{
-  display:flex;gap:10px;margin-top:14px;
-}
-.onboard-btn{
-  flex:1;padding:11px 16px;font-size:13px;
-}
-.onboard-howto{
-  border:none;border-top:1px solid var(--border);padding-top:14px;
-}
-.onboard-howto summary{
-  font-size:12px;color:var(--text3);cursor:pointer;
-  list-style:none;outline:none;user-select:none;
-}
-.onboard-howto summary::-webkit-details-marker{ display:none; }
-.onboard-howto summary::before{ content:"▸ "; color:var(--accent); }
-.onboard-howto[open] summary::before{ content:"▾ "; }
-
-/* ── FAB ─────────────────────────────────────────────────────── */
-.fab{
-  position:fixed;bottom:24px;right:24px;z-index:200;
-  background:var(--accent);color:#fff;border:none;border-radius:28px;
-  padding:13px 22px;font-family:var(--mono);font-size:13px;font-weight:700;
-  cursor:pointer;box-shadow:0 4px 24px rgba(91,127,255,.45);
-  transition:transform .15s,box-shadow .15s;
-}
-.fab:hover{transform:translateY(-2px);box-shadow:0 6px 32px rgba(91,127,255,.6);}
-
-/* ── Scrollbar ───────────────────────────────────────────────── */
-::-webkit-scrollbar{width:4px;height:4px;}
-::-webkit-scrollbar-track{background:transparent;}
-::-webkit-scrollbar-thumb{background:var(--border2);border-radius:4px;}
-
-/* ── Help modal ──────────────────────────────────────────────── */
-.modal-overlay{position:fixed;inset:0;background:rgba(0,0,0,.75);z-index:500;display:flex;align-items:center;justify-content:center;opacity:0;pointer-events:none;transition:opacity .2s;}
-.modal-overlay.open{opacity:1;pointer-events:all;}
-.modal{background:var(--surface);border:1px solid var(--border2);border-radius:var(--r);padding:24px;max-width:560px;width:90%;max-height:80vh;overflow-y:auto;transform:translateY(8px);transition:transform .2s;}
-.modal-overlay.open .modal{transform:none;}
-.modal-title{font-family:var(--sans);font-size:17px;font-weight:700;margin-bottom:4px;}
-.modal-sub{font-size:11px;color:var(--text2);margin-bottom:18px;}
-.modal-section{margin-bottom:18px;}
-.modal-section h3{font-family:var(--sans);font-size:12px;font-weight:700;color:var(--accent);margin-bottom:8px;text-transform:uppercase;letter-spacing:.5px;}
-.modal-section p{font-size:12px;color:var(--text2);line-height:1.7;margin-bottom:8px;}
-.modal-section ul{list-style:none;padding:0;}
-.modal-section ul li{font-size:12px;color:var(--text2);line-height:1.8;padding-left:14px;position:relative;}
-.modal-section ul li::before{content:"→";position:absolute;left:0;color:var(--accent);}
-.modal-close{margin-top:16px;width:100%;}
-
-/* ── Animations ──────────────────────────────────────────────── */
-@keyframes fadeUp{from{opacity:0;transform:translateY(6px);}to{opacity:1;transform:none;}}
-.main > *{animation:fadeUp .2s ease both;}
-</style>
+<link rel="stylesheet" href="{{ url_for('static', filename='app.css') }}">
 </head>
 <body>
 <div class="shell">
@@ -1080,8 +1032,8 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     ZeroToken
   </div>
   <div class="topbar-sep"></div>
-  <button type="button" class="project-name" onclick="browseFolder()" title="Click to select project folder&#10;{{ status.project_root or 'No folder selected' }}">
-    📁 {{ status.project_root.split('\\')[-1] or status.project_root.split('/')[-1] or status.project_root or 'Select project folder…' }}
+  <button type="button" class="project-name" onclick="browseFolder()" title="Click to select project folder&#10;{{ (status.project_root or 'No folder selected')|e }}">
+    📁 {{ (status.project_root.split('\\')[-1] or status.project_root.split('/')[-1] or status.project_root or 'Select project folder…')|e }}
   </button>
   <div class="topbar-right">
     {% if status.ollama_ok %}
@@ -1126,13 +1078,13 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
   <div class="phase-label">② Steps</div>
   {% for step in plan.steps %}
   {% set st = step.get('status','pending') %}
-  <form method="POST" action="/select-step/{{ step.id }}" style="display:contents;">
+  <form method="POST" action="/select-step/{{ step.id|e }}" style="display:contents;">
     <button type="submit"
       class="step-item {% if active_step and active_step.id == step.id %}active{% endif %}">
-      <span class="step-dot sd-{{ st }}">
+      <span class="step-dot sd-{{ st|e }}">
         {% if st == 'approved' %}✓{% elif st == 'skipped' %}–{% elif st == 'failed' %}✕{% else %}·{% endif %}
       </span>
-      <span class="step-title">{{ loop.index }}. {{ step.title }}</span>
+      <span class="step-title">{{ loop.index }}. {{ step.title|e }}</span>
     </button>
   </form>
   {% endfor %}
@@ -1141,10 +1093,10 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
   <!-- Phase 3 -->
   <div class="phase-label">③ Deliver</div>
   <button type="button"
-    class="step-item {% if state.final_prompt and not active_step %}active{% endif %}"
+    class="step-item {% if state.final_prompt_chars and not active_step %}active{% endif %}"
     onclick="document.getElementById('output-anchor').scrollIntoView({behavior:'smooth'})">
-    <span class="step-dot {% if state.final_prompt %}sd-approved{% else %}sd-pending{% endif %}">
-      {% if state.final_prompt %}✓{% else %}·{% endif %}
+    <span class="step-dot {% if state.final_prompt_chars %}sd-approved{% else %}sd-pending{% endif %}">
+      {% if state.final_prompt_chars %}✓{% else %}·{% endif %}
     </span>
     <span class="step-title">Final Prompt</span>
   </button>
@@ -1161,7 +1113,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     {% else %}
     <div class="sidebar-stat"><span>No plan loaded</span></div>
     {% endif %}
-    <div class="sidebar-stat" style="margin-top:6px;"><span style="color:var(--text3)">{{ status.model_name }}</span></div>
+    <div class="sidebar-stat" style="margin-top:6px;"><span style="color:var(--text3)">{{ status.model_name|e }}</span></div>
 
     <!-- ── Model settings ────────────────────────────── -->
     <details class="model-details">
@@ -1169,18 +1121,18 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
       <form method="POST" action="/set-models" class="ms-body">
         {% for key, label in [('planner_model','Planner'),('patcher_model','Patcher'),('reviewer_model','Reviewer'),('refiner_model','Refiner')] %}
         <div class="ms-row">
-          <label class="ms-label">{{ label }}</label>
-          <select name="{{ key }}" class="ms-select">
-            {% set cur = state[key] %}
+          <label class="ms-label">{{ label|e }}</label>
+          <select name="{{ key|e }}" class="ms-select">
+            {% set cur = state|attr(key) %}
             {% if status.models %}
               {% for m in status.models %}
-              <option value="{{ m }}" {% if m == cur %}selected{% endif %}>{{ m }}</option>
+              <option value="{{ m|e }}" {% if m == cur %}selected{% endif %}>{{ m|e }}</option>
               {% endfor %}
               {% if cur not in status.models %}
-              <option value="{{ cur }}" selected>{{ cur }}</option>
+              <option value="{{ cur|e }}" selected>{{ cur|e }}</option>
               {% endif %}
             {% else %}
-            <option value="{{ cur }}" selected>{{ cur }}</option>
+            <option value="{{ cur|e }}" selected>{{ cur|e }}</option>
             {% endif %}
           </select>
         </div>
@@ -1200,7 +1152,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     <div style="padding:2px 4px;">
       <form method="POST" action="/set-folder" id="sidebar-folder-form" style="display:flex;gap:4px;margin-bottom:6px;">
         <input type="text" name="project_root" id="sidebar-folder-input"
-          value="{{ status.project_root }}"
+          value="{{ status.project_root|e }}"
           style="font-size:10px;padding:4px 6px;flex:1;min-width:0;"
           placeholder="Project path…">
         <button type="submit" class="btn btn-ghost btn-sm" style="padding:4px 7px;font-size:10px;">Set</button>
@@ -1214,13 +1166,13 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
 <main class="main" id="main">
 
   <!-- Flash messages -->
-  {% if state.error %}<div class="alert alert-error">⚠ {{ state.error }}</div>{% endif %}
-  {% if state.info and not state.error %}<div class="alert alert-ok" id="flash-ok">✓ {{ state.info }}</div>{% endif %}
+  {% if state.error %}<div class="alert alert-error">⚠ {{ state.error|e }}</div>{% endif %}
+  {% if state.info and not state.error %}<div class="alert alert-ok" id="flash-ok">✓ {{ state.info|e }}</div>{% endif %}
 
   <!-- Loading banner with auto-poll -->
   <div id="loading-bar" class="loading-bar" style="display:{% if state.bg_running %}flex{% else %}none{% endif %};">
     <span class="spinner"></span>
-    <span class="lb-text" id="lb-text">{{ state.bg_label }}</span>
+    <span class="lb-text" id="lb-text">{{ state.bg_label|e }}</span>
     <span class="lb-time" id="lb-time">0s</span>
   </div>
 
@@ -1245,13 +1197,13 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     <!-- ── FOLDER ROW ── -->
     <div class="onboard-field-label">📁 Project folder</div>
     <div class="onboard-folder-row">
-      <div class="folder-display" id="folder-display" title="{{ status.project_root }}">{{ status.project_root or 'No folder selected — click Browse' }}</div>
+      <div class="folder-display" id="folder-display" title="{{ status.project_root|e }}">{{ (status.project_root or 'No folder selected — click Browse')|e }}</div>
       <button type="button" class="btn btn-copy btn-sm" onclick="browseFolder()">Browse…</button>
     </div>
     <form method="POST" action="/set-folder" id="set-folder-form" style="display:flex;gap:6px;margin-top:6px;">
       <input type="text" name="project_root" id="folder-input"
         placeholder="Or paste a path and press Set"
-        value="{{ status.project_root }}" style="font-size:12px;">
+        value="{{ status.project_root|e }}" style="font-size:12px;">
       <button type="submit" class="btn btn-ghost btn-sm">Set</button>
     </form>
     {% if not status.git_exists %}
@@ -1270,7 +1222,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
       <div class="onboard-field-label">✏ What do you want to build or change?</div>
       <textarea name="goal" rows="5"
         placeholder="e.g. Add a login system with username/password stored in SQLite. Include /login and /logout routes and protect the /dashboard route."
-        style="font-size:13px;line-height:1.6;">{{ state.goal }}</textarea>
+        style="font-size:13px;line-height:1.6;">{{ state.goal|e }}</textarea>
 
       <div class="onboard-btn-row">
         <button type="submit" formaction="/plan-local" class="btn btn-primary onboard-btn"
@@ -1308,7 +1260,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
         <span style="font-size:11px;color:var(--text3);">Copy this → paste into claude.ai → copy Claude's reply → paste below</span>
         <button class="btn btn-copy btn-sm" onclick="copyEl('plan-prompt-box')">⌘ Copy</button>
       </div>
-      <div class="prompt-box" id="plan-prompt-box">{{ state.plan_prompt }}</div>
+      <div class="prompt-box" id="plan-prompt-box">{{ state.plan_prompt|e }}</div>
       <hr class="div">
       <label class="field-label">Paste Claude's JSON reply here</label>
       <form method="POST" action="/save-plan">
@@ -1335,12 +1287,12 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
   {% set has_review        = sid in state.reviews %}
   {% set has_refined       = sid in state.refined_diffs %}
 
-  <div class="page-title">Step {{ sid }} — {{ step.title }}</div>
-  <div class="page-sub">{{ step.description }}</div>
+  <div class="page-title">Step {{ sid|e }} — {{ step.title|e }}</div>
+  <div class="page-sub">{{ step.description|e }}</div>
 
   {% if step.get('suggested_files') %}
   <div class="alert alert-info" style="margin-bottom:14px;">
-    📄 <b>Files involved:</b> {{ step.suggested_files | join(', ') }}
+    📄 <b>Files involved:</b> {{ (step.suggested_files | join(', '))|e }}
   </div>
   {% endif %}
 
@@ -1351,7 +1303,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
       <ul style="list-style:none;padding:0;">
         {% for c in step.acceptance_criteria %}
         <li style="font-size:12px;color:var(--text2);line-height:1.8;padding-left:14px;position:relative;">
-          <span style="position:absolute;left:0;color:var(--green);">✓</span>{{ c }}
+          <span style="position:absolute;left:0;color:var(--green);">✓</span>{{ c|e }}
         </li>
         {% endfor %}
       </ul>
@@ -1362,13 +1314,13 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
   {% if st == 'approved' %}
   <div class="alert alert-ok">✓ This step is approved and included in the final prompt. Select another step or proceed to Deliver.</div>
   <div style="margin-top:10px;">
-    <form method="POST" action="/reset-step/{{ sid }}" style="display:inline;">
+    <form method="POST" action="/reset-step/{{ sid|e }}" style="display:inline;">
       <button type="submit" class="btn btn-ghost btn-sm">↩ Reset to pending</button>
     </form>
   </div>
   {% elif st == 'skipped' %}
   <div class="alert alert-info">This step was skipped.</div>
-  <form method="POST" action="/reset-step/{{ sid }}" style="margin-top:10px;">
+  <form method="POST" action="/reset-step/{{ sid|e }}" style="margin-top:10px;">
     <button type="submit" class="btn btn-ghost btn-sm">↩ Reset to pending</button>
   </form>
   {% else %}
@@ -1401,9 +1353,9 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     <div class="stage-title">Prompt sent to Ollama <span style="font-weight:400;color:var(--text3);text-transform:none;letter-spacing:0;">(for reference)</span></div>
     <div class="prompt-header">
       <span></span>
-      <button class="btn btn-copy btn-sm" onclick="copyEl('op-{{ sid }}')">⌘ Copy</button>
+      <button class="btn btn-copy btn-sm" onclick="copyEl('op-{{ sid|e }}')">⌘ Copy</button>
     </div>
-    <div class="prompt-box" id="op-{{ sid }}" style="max-height:120px;font-size:10px;">{{ state.ollama_prompts[sid] }}</div>
+    <div class="prompt-box" id="op-{{ sid|e }}" style="max-height:120px;font-size:10px;">{{ state.ollama_prompts[sid]|e }}</div>
   </div>
   {% endif %}
 
@@ -1421,10 +1373,10 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
       </ol>
     </div>
     <div class="prompt-header">
-      <span style="font-size:11px;color:var(--text2);">Patch prompt for step {{ sid }}</span>
-      <button class="btn btn-copy btn-sm" onclick="copyEl('pp-{{ sid }}')">⌘ Copy</button>
+      <span style="font-size:11px;color:var(--text2);">Patch prompt for step {{ sid|e }}</span>
+      <button class="btn btn-copy btn-sm" onclick="copyEl('pp-{{ sid|e }}')">⌘ Copy</button>
     </div>
-    <div class="prompt-box" id="pp-{{ sid }}">{{ state.patch_prompts[sid] }}</div>
+    <div class="prompt-box" id="pp-{{ sid|e }}">{{ state.patch_prompts[sid]|e }}</div>
   </div>
 
   <!-- STAGE 3 — Paste diff -->
@@ -1437,7 +1389,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     <form method="POST" action="/review-patch">
       <label class="field-label">Paste Claude's diff here</label>
       <textarea name="diff" rows="8"
-        placeholder="Paste the unified diff from Claude here…">{% if has_diff %}{{ state.diffs[sid] }}{% endif %}</textarea>
+        placeholder="Paste the unified diff from Claude here…">{% if has_diff %}{{ state.diffs[sid]|e }}{% endif %}</textarea>
       <div class="btn-row">
         <button type="submit" class="btn btn-primary" style="flex:1;">🔍 Review with Ollama</button>
       </div>
@@ -1451,11 +1403,11 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     <div class="stage-title">Diff Preview</div>
     <div class="diff-view">
       {% for line in state.diffs[sid].splitlines() %}
-        {% if line.startswith('+++') or line.startswith('---') %}<span class="fn">{{ line }}</span>
-        {% elif line.startswith('+') %}<span class="add">{{ line }}</span>
-        {% elif line.startswith('-') %}<span class="del">{{ line }}</span>
-        {% elif line.startswith('@@') %}<span class="hdr">{{ line }}</span>
-        {% else %}<span class="ctx">{{ line }}</span>
+        {% if line.startswith('+++') or line.startswith('---') %}<span class="fn">{{ line|e }}</span>
+        {% elif line.startswith('+') %}<span class="add">{{ line|e }}</span>
+        {% elif line.startswith('-') %}<span class="del">{{ line|e }}</span>
+        {% elif line.startswith('@@') %}<span class="hdr">{{ line|e }}</span>
+        {% else %}<span class="ctx">{{ line|e }}</span>
         {% endif %}
       {% endfor %}
     </div>
@@ -1473,19 +1425,19 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     {% set r = state.reviews[sid] %}
     {% if r is mapping %}
       {% set verdict = r.get('verdict','concerns') %}
-      <span class="verdict-badge verdict-{{ verdict }}">{{ verdict.upper() }}</span>
-      <div class="review-summary">{{ r.get('summary','') }}</div>
+      <span class="verdict-badge verdict-{{ verdict|e }}">{{ verdict.upper()|e }}</span>
+      <div class="review-summary">{{ r.get('summary','')|e }}</div>
       {% if r.get('issues') %}
-      <ul class="review-issues">{% for issue in r.issues %}<li>{{ issue }}</li>{% endfor %}</ul>
+      <ul class="review-issues">{% for issue in r.issues %}<li>{{ issue|e }}</li>{% endfor %}</ul>
       {% endif %}
-      {% if r.get('notes') %}<div style="font-size:11px;color:var(--text3);margin-top:4px;">{{ r.notes }}</div>{% endif %}
+      {% if r.get('notes') %}<div style="font-size:11px;color:var(--text3);margin-top:4px;">{{ r.notes|e }}</div>{% endif %}
     {% else %}
       <div class="review-plain">
         {% for line in r.splitlines() %}
-          {% if 'APPROVE' in line %}<span style="color:var(--green);font-weight:700;">{{ line }}</span><br>
-          {% elif 'REJECT' in line %}<span style="color:var(--red);font-weight:700;">{{ line }}</span><br>
-          {% elif 'CONCERNS' in line %}<span style="color:var(--yellow);font-weight:700;">{{ line }}</span><br>
-          {% else %}{{ line }}<br>
+          {% if 'APPROVE' in line %}<span style="color:var(--green);font-weight:700;">{{ line|e }}</span><br>
+          {% elif 'REJECT' in line %}<span style="color:var(--red);font-weight:700;">{{ line|e }}</span><br>
+          {% elif 'CONCERNS' in line %}<span style="color:var(--yellow);font-weight:700;">{{ line|e }}</span><br>
+          {% else %}{{ line|e }}<br>
           {% endif %}
         {% endfor %}
       </div>
@@ -1496,11 +1448,11 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
     <div class="diff-view">
       {% set display_diff = state.refined_diffs.get(sid) or state.diffs.get(sid, '') %}
       {% for line in display_diff.splitlines() %}
-        {% if line.startswith('+++') or line.startswith('---') %}<span class="fn">{{ line }}</span>
-        {% elif line.startswith('+') %}<span class="add">{{ line }}</span>
-        {% elif line.startswith('-') %}<span class="del">{{ line }}</span>
-        {% elif line.startswith('@@') %}<span class="hdr">{{ line }}</span>
-        {% else %}<span class="ctx">{{ line }}</span>
+        {% if line.startswith('+++') or line.startswith('---') %}<span class="fn">{{ line|e }}</span>
+        {% elif line.startswith('+') %}<span class="add">{{ line|e }}</span>
+        {% elif line.startswith('-') %}<span class="del">{{ line|e }}</span>
+        {% elif line.startswith('@@') %}<span class="hdr">{{ line|e }}</span>
+        {% else %}<span class="ctx">{{ line|e }}</span>
         {% endif %}
       {% endfor %}
     </div>
@@ -1572,7 +1524,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
   <!-- ────────────────────────────────────────────────────────── -->
   <!-- PHASE 3: Final prompt (always shown when available)       -->
   <!-- ────────────────────────────────────────────────────────── -->
-  {% if state.final_prompt %}
+  {% if state.final_prompt_chars %}
   <div id="output-anchor" style="height:1px;margin-top:8px;"></div>
   <div class="card final-card" style="margin-top:16px;">
     <div class="card-title" style="color:var(--teal);">⚡ Final Agent Prompt</div>
@@ -1592,7 +1544,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
       </div>
 
       <div class="prompt-header">
-        <span style="font-size:11px;color:var(--text2);">{{ state.final_prompt | length }} characters</span>
+        <span style="font-size:11px;color:var(--text2);">{{ state.final_prompt_chars }} characters · saved to <code>.ai-build/prompts/final_prompt.txt</code> · <a href="/final-prompt" target="_blank" style="color:var(--accent);">open as text</a></span>
         <div style="display:flex;gap:8px;">
           <button class="btn btn-copy btn-sm" onclick="copyEl('final-prompt-ta')">⌘ Copy All</button>
           <form method="POST" action="/assemble-prompt" style="margin:0;">
@@ -1600,7 +1552,7 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
           </form>
         </div>
       </div>
-      <textarea id="final-prompt-ta" class="final-ta" readonly onclick="this.select()">{{ state.final_prompt }}</textarea>
+      <textarea id="final-prompt-ta" class="final-ta" readonly onclick="this.select()" placeholder="Loading…"></textarea>
     </div>
   </div>
   {% endif %}
@@ -1668,117 +1620,29 @@ label.field-label{display:block;font-size:10px;font-weight:700;letter-spacing:.8
   </div>
 </div>
 
-<script>
-/* ── Auto-poll while Ollama runs ───────────────────────────── */
-let pollTimer = null;
-let pollStart = null;
-
-function startPoll() {
-  if (pollTimer) return;
-  pollStart = Date.now();
-  pollTimer = setInterval(doPoll, 2500);
-}
-
-function stopPoll() {
-  clearInterval(pollTimer);
-  pollTimer = null;
-  pollStart = null;
-}
-
-async function doPoll() {
-  try {
-    const r = await fetch('/status');
-    const d = await r.json();
-    const bar = document.getElementById('loading-bar');
-    const lbText = document.getElementById('lb-text');
-    const lbTime = document.getElementById('lb-time');
-    if (d.bg_running) {
-      if (bar) { bar.style.display = 'flex'; }
-      if (lbText) lbText.textContent = d.bg_label || 'Ollama is working…';
-      if (lbTime && pollStart) {
-        const secs = Math.floor((Date.now() - pollStart) / 1000);
-        lbTime.textContent = secs + 's';
-      }
-    } else {
-      stopPoll();
-      // Reload to show new state
-      window.location.reload();
-    }
-  } catch(e) { /* network error, keep polling */ }
-}
-
-// Start polling if already running on load
-(function(){
-  const bar = document.getElementById('loading-bar');
-  if (bar && bar.style.display !== 'none') {
-    startPoll();
-  }
-})();
-
-/* ── Copy helper ────────────────────────────────────────────── */
-function copyEl(id) {
-  const el = document.getElementById(id);
-  if (!el) return;
-  const text = el.tagName === 'TEXTAREA' ? el.value : el.innerText;
-  navigator.clipboard.writeText(text).then(() => {
-    const btn = document.querySelector(`[onclick="copyEl('${id}')"]`);
-    if (btn) {
-      const orig = btn.textContent;
-      btn.textContent = '✓ Copied!';
-      setTimeout(() => btn.textContent = orig, 2000);
-    }
-  }).catch(() => {
-    const ta = document.createElement('textarea');
-    ta.value = text; document.body.appendChild(ta);
-    ta.select(); document.execCommand('copy');
-    document.body.removeChild(ta);
-  });
-}
-
-/* ── Folder browse ──────────────────────────────────────────── */
-function browseFolder(mode) {
-  const allBtns = document.querySelectorAll('[onclick^="browseFolder"]');
-  allBtns.forEach(b => { b.textContent = 'Opening…'; b.disabled = true; });
-
-  fetch('/browse')
-    .then(r => r.json())
-    .then(d => {
-      allBtns.forEach(b => { b.disabled = false; b.textContent = b.textContent.includes('sidebar') ? '📁 Browse folder…' : '📁 Browse'; });
-      if (d.error) { alert('Browse error: ' + d.error); return; }
-      if (!d.path) return;
-      // Update topbar inputs if present
-      const fi = document.getElementById('folder-input');
-      const fd = document.getElementById('folder-display');
-      const sf = document.getElementById('set-folder-form');
-      if (fi) fi.value = d.path;
-      if (fd) { fd.textContent = d.path; fd.title = d.path; }
-      // Update sidebar inputs
-      const sfi = document.getElementById('sidebar-folder-input');
-      if (sfi) sfi.value = d.path;
-      // Submit whichever form is available
-      if (sf) { sf.submit(); }
-      else {
-        const sff = document.getElementById('sidebar-folder-form');
-        if (sff) sff.submit();
-      }
-    })
-    .catch(e => {
-      allBtns.forEach(b => { b.disabled = false; });
-      alert('Browse failed: ' + e);
-    });
-}
-
-/* ── Help modal ─────────────────────────────────────────────── */
-function openHelp()  { document.getElementById('help-modal').classList.add('open'); }
-function closeHelp() { document.getElementById('help-modal').classList.remove('open'); }
-document.addEventListener('keydown', e => { if (e.key === 'Escape') closeHelp(); });
-
-/* ── Auto-dismiss flash after 6s ───────────────────────────── */
-const flash = document.getElementById('flash-ok');
-if (flash) setTimeout(() => { flash.style.opacity = '0'; flash.style.transition = 'opacity .5s'; }, 6000);
-</script>
+<div class="modal-overlay" id="browse-modal" onclick="if(event.target===this)closeBrowse()">
+  <div class="modal">
+    <div class="modal-title">Select project folder</div>
+    <div class="modal-sub">Click a folder to open it, then press “Use this folder”.</div>
+    <form onsubmit="event.preventDefault(); loadDir(document.getElementById('browse-path').value);" style="display:flex;gap:6px;margin-bottom:10px;">
+      <input type="text" id="browse-path" style="font-size:12px;flex:1;min-width:0;">
+      <button type="submit" class="btn btn-ghost btn-sm">Go</button>
+    </form>
+    <div class="alert alert-error" id="browse-error" style="display:none;"></div>
+    <div class="browse-list" id="browse-list"></div>
+    <div class="btn-row">
+      <button type="button" class="btn btn-primary btn-sm" onclick="useBrowsedFolder()">Use this folder</button>
+      <button type="button" class="btn btn-ghost btn-sm" onclick="closeBrowse()">Cancel</button>
+    </div>
+  </div>
+</div>
+
+<script src="{{ url_for('static', filename='app.js') }}"></script>
 </body>
 </html>"""
+# Compiled without autoescape: the page embeds whole prompts and diffs, and
+# every expression that can hold text escapes itself with |e instead
+_TEMPLATE = app.jinja_env.overlay(autoescape=False).from_string(HTML_TEMPLATE)
 
 
 # ---------------------------------------------------------------------------
@@ -1795,9 +1659,11 @@ def run_server(host: str = "127.0.0.1", port: int = 5000, open_browser: bool = T
         signal.signal(signal.SIGINT,  lambda s, f: sm.shutdown(reason="SIGINT"))
         signal.signal(signal.SIGTERM, lambda s, f: sm.shutdown(reason="SIGTERM"))
 
-    srv = make_server(host, port, app)
+    # Threaded: an open /events stream must not hold up other requests
+    srv = make_server(host, port, app, threaded=True)
     srv.timeout = 1
 
+    sm.register_callback(_bg_stop, name="background worker")
     sm.register_callback(srv.shutdown, name="werkzeug-server")
 
     server_thread = threading.Thread(target=srv.serve_forever, daemon=True, name="flask-server")
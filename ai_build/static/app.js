@@ -0,0 +1,152 @@
+/* ── Live updates while Ollama runs ─────────────────────────── */
+// The server pushes /status over /events whenever it changes; plain
+// polling is only the fallback for browsers without EventSource.
+let pollTimer = null;
+let pollStart = null;
+let eventSrc = null;
+let clockTimer = null;
+
+function startPoll() {
+  if (pollTimer || eventSrc) return;
+  pollStart = Date.now();
+  clockTimer = setInterval(tickClock, 1000);
+  if (window.EventSource) {
+    eventSrc = new EventSource('/events');
+    eventSrc.onmessage = e => showStatus(JSON.parse(e.data));
+  } else {
+    pollTimer = setInterval(doPoll, 2500);
+  }
+}
+
+function stopPoll() {
+  clearInterval(pollTimer);
+  clearInterval(clockTimer);
+  if (eventSrc) eventSrc.close();
+  pollTimer = null;
+  clockTimer = null;
+  eventSrc = null;
+  pollStart = null;
+}
+
+function tickClock() {
+  const lbTime = document.getElementById('lb-time');
+  if (lbTime && pollStart) {
+    const secs = Math.floor((Date.now() - pollStart) / 1000);
+    lbTime.textContent = secs + 's';
+  }
+}
+
+function showStatus(d) {
+  const bar = document.getElementById('loading-bar');
+  const lbText = document.getElementById('lb-text');
+  if (d.bg_running) {
+    if (bar) { bar.style.display = 'flex'; }
+    if (lbText) lbText.textContent = d.bg_label || 'Ollama is working…';
+  } else {
+    stopPoll();
+    // Reload to show new state
+    window.location.reload();
+  }
+}
+
+async function doPoll() {
+  try {
+    const r = await fetch('/status');
+    showStatus(await r.json());
+  } catch(e) { /* network error, keep polling */ }
+}
+
+// Start listening if already running on load
+(function(){
+  const bar = document.getElementById('loading-bar');
+  if (bar && bar.style.display !== 'none') {
+    startPoll();
+  }
+})();
+
+/* ── Final prompt (fetched, not embedded in the page) ──────── */
+(function(){
+  const ta = document.getElementById('final-prompt-ta');
+  if (!ta) return;
+  fetch('/final-prompt').then(r => r.ok ? r.text() : '').then(t => { ta.value = t; });
+})();
+
+/* ── Copy helper ────────────────────────────────────────────── */
+function copyEl(id) {
+  const el = document.getElementById(id);
+  if (!el) return;
+  const text = el.tagName === 'TEXTAREA' ? el.value : el.innerText;
+  navigator.clipboard.writeText(text).then(() => {
+    const btn = document.querySelector(`[onclick="copyEl('${id}')"]`);
+    if (btn) {
+      const orig = btn.textContent;
+      btn.textContent = '✓ Copied!';
+      setTimeout(() => btn.textContent = orig, 2000);
+    }
+  }).catch(() => {
+    const ta = document.createElement('textarea');
+    ta.value = text; document.body.appendChild(ta);
+    ta.select(); document.execCommand('copy');
+    document.body.removeChild(ta);
+  });
+}
+
+/* ── Folder browse ──────────────────────────────────────────── */
+// Folders are listed by the server (/browse) and picked in a modal; the
+// chosen absolute path is submitted through the existing /set-folder form.
+let browsePath = '';
+
+function browseFolder(mode) {
+  document.getElementById('browse-modal').classList.add('open');
+  loadDir('');
+}
+
+function closeBrowse() { document.getElementById('browse-modal').classList.remove('open'); }
+
+function loadDir(path) {
+  const err = document.getElementById('browse-error');
+  fetch('/browse?path=' + encodeURIComponent(path))
+    .then(r => r.json())
+    .then(d => {
+      if (d.error) { err.textContent = d.error; err.style.display = 'block'; return; }
+      err.style.display = 'none';
+      browsePath = d.path;
+      document.getElementById('browse-path').value = d.path;
+      const list = document.getElementById('browse-list');
+      list.replaceChildren();
+      const addItem = (label, target) => {
+        const b = document.createElement('button');
+        b.type = 'button'; b.className = 'browse-item'; b.textContent = label;
+        b.onclick = () => loadDir(target);
+        list.appendChild(b);
+      };
+      if (d.parent) addItem('↑ ..', d.parent);
+      const sep = d.path.includes('\\') ? '\\' : '/';
+      const base = d.path.endsWith(sep) ? d.path : d.path + sep;
+      d.dirs.forEach(name => addItem('📁 ' + name, base + name));
+      if (!d.dirs.length) {
+        const empty = document.createElement('div');
+        empty.className = 'browse-empty'; empty.textContent = 'No subfolders';
+        list.appendChild(empty);
+      }
+    })
+    .catch(e => { err.textContent = 'Browse failed: ' + e; err.style.display = 'block'; });
+}
+
+function useBrowsedFolder() {
+  if (!browsePath) return;
+  // Submit whichever form is available
+  const form = document.getElementById('set-folder-form') || document.getElementById('sidebar-folder-form');
+  if (!form) return;
+  form.querySelector('[name="project_root"]').value = browsePath;
+  form.submit();
+}
+
+/* ── Help modal ─────────────────────────────────────────────── */
+function openHelp()  { document.getElementById('help-modal').classList.add('open'); }
+function closeHelp() { document.getElementById('help-modal').classList.remove('open'); }
+document.addEventListener('keydown', e => { if (e.key === 'Escape') { closeHelp(); closeBrowse(); } });
+
+/* ── Auto-dismiss flash after 6s ───────────────────────────── */
+const flash = document.getElementById('flash-ok');
+if (flash) setTimeout(() => { flash.style.opacity = '0'; flash.style.transition = 'opacity .5s'; }, 6000);
@@ -3,9 +3,12 @@ storage.py - Save/load plan.json and step state. Scan the repo file tree.
             Also saves generated prompts to .ai-build/prompts/ for reference.
 """
 
+import atexit
 import os
 import json
 import pathlib
+import queue
+import threading
 
 AI_BUILD_DIR = ".ai-build"
 PLAN_FILE = os.path.join(AI_BUILD_DIR, "plan.json")
@@ -45,6 +48,114 @@ def ensure_dirs():
     os.makedirs(PROMPTS_DIR, exist_ok=True)
 
 
+# ---------------------------------------------------------------------------
+# Background writes
+# ---------------------------------------------------------------------------
+# Prompts and diffs are written by a daemon thread so the GUI's Ollama loop
+# never waits on the disk.  Content waiting to be written is kept in
+# _pending (keyed by absolute path, newest content wins) and the readers
+# below look there first, so a queued write is visible straight away.
+
+_writer_q: queue.SimpleQueue = queue.SimpleQueue()
+_pending: dict[str, bytes] = {}
+_pending_cv = threading.Condition()
+_writer: threading.Thread | None = None
+_unsynced: set[str] = set()   # files written since the last flush_writes(sync=True)
+
+
+def _writer_loop():
+    while True:
+        path = _writer_q.get()
+        with _pending_cv:
+            data = _pending.get(path)
+        if data is None:
+            continue  # already written with newer content
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+        except OSError as exc:
+            print(f"Could not save {path}: {exc}")
+        with _pending_cv:
+            _unsynced.add(path)
+            if _pending.get(path) is data:
+                del _pending[path]
+            _pending_cv.notify_all()
+
+
+def queue_write(path: str, content: str) -> str:
+    """
+    Write *content* to *path* on the background writer thread.  A second
+    write to the same path before the first lands replaces it.  Returns
+    *path*.
+    """
+    global _writer
+    key = os.path.abspath(path)
+    with _pending_cv:
+        _pending[key] = content.encode("utf-8")
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name="ai-build-writer", daemon=True)
+            _writer.start()
+    _writer_q.put(key)
+    return path
+
+
+def flush_writes(sync: bool = False):
+    """
+    Block until every queued write is on disk.  With *sync*, also fsync the
+    files written since the last sync and the patches and prompts
+    directories, so both their contents and their entries survive a crash.
+    """
+    with _pending_cv:
+        _pending_cv.wait_for(lambda: not _pending)
+        written = list(_unsynced) if sync else []
+        if sync:
+            _unsynced.clear()
+    if sync:
+        for path in written:
+            _fsync_path(path)
+        for d in (PATCHES_DIR, PROMPTS_DIR):
+            _fsync_path(d)
+
+
+def _fsync_path(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+atexit.register(flush_writes)
+
+
+def queued_text(path: str) -> str | None:
+    """Content still queued for *path* on the writer thread, or None if nothing is."""
+    with _pending_cv:
+        data = _pending.get(os.path.abspath(path))
+    return data.decode("utf-8") if data is not None else None
+
+
+def _read_text(path: str) -> str | None:
+    """Contents of *path* (including a write still queued for it), or None if absent."""
+    queued = queued_text(path)
+    if queued is not None:
+        return queued
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
 def save_plan(plan: dict, quiet: bool = False):
     ensure_dirs()
     with open(PLAN_FILE, "w", encoding="utf-8") as f:
@@ -76,30 +187,31 @@ def patch_path(step_id: int) -> str:
     return os.path.join(PATCHES_DIR, f"step-{step_id}.diff")
 
 
-def save_patch(step_id: int, patch_content: str) -> str:
+def save_patch(step_id: int, patch_content: str, background: bool = False) -> str:
     ensure_dirs()
     path = patch_path(step_id)
+    if background:
+        return queue_write(path, patch_content)
     with open(path, "w", encoding="utf-8") as f:
         f.write(patch_content)
     return path
 
 
 def load_patch(step_id: int) -> str | None:
-    path = patch_path(step_id)
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+    return _read_text(patch_path(step_id))
 
 
-def save_prompt(filename: str, content: str) -> str:
+def save_prompt(filename: str, content: str, background: bool = False) -> str:
     """
     Save a generated prompt to .ai-build/prompts/<filename> so the user
     can always find the full prompt text even after closing the terminal.
+    With *background*, the write is handed to the writer thread.
     Returns the saved file path.
     """
     ensure_dirs()
     path = os.path.join(PROMPTS_DIR, filename)
+    if background:
+        return queue_write(path, content)
     with open(path, "w", encoding="utf-8") as f:
         f.write(content)
     return path
@@ -107,21 +219,19 @@ def save_prompt(filename: str, content: str) -> str:
 
 def load_ollama_prompt(step_id: int) -> str | None:
     """Load the Ollama prompt that was used to generate the patch for *step_id*."""
-    path = os.path.join(PROMPTS_DIR, f"ollama_patch_step_{step_id}.txt")
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+    return _read_text(os.path.join(PROMPTS_DIR, f"ollama_patch_step_{step_id}.txt"))
 
 
 # ---------------------------------------------------------------------------
 # Refined patches  (.ai-build/patches/step-X-refined.diff)
 # ---------------------------------------------------------------------------
 
-def save_refined_patch(step_id: int, content: str) -> str:
+def save_refined_patch(step_id: int, content: str, background: bool = False) -> str:
     """Save the Ollama-Refiner output for *step_id*."""
     ensure_dirs()
     path = os.path.join(PATCHES_DIR, f"step-{step_id}-refined.diff")
+    if background:
+        return queue_write(path, content)
     with open(path, "w", encoding="utf-8") as f:
         f.write(content)
     return path
@@ -129,11 +239,33 @@ def save_refined_patch(step_id: int, content: str) -> str:
 
 def load_refined_patch(step_id: int) -> str | None:
     """Load the refined diff for *step_id*, or None if not yet refined."""
-    path = os.path.join(PATCHES_DIR, f"step-{step_id}-refined.diff")
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+    return _read_text(os.path.join(PATCHES_DIR, f"step-{step_id}-refined.diff"))
+
+
+def load_all_patches(step_ids) -> dict[int, str]:
+    """
+    Best saved diff for each of *step_ids* — the refined one if present and
+    non-empty, else the raw one — as {step_id: diff}.  Steps with neither
+    are left out.  Lists the patches directory once instead of probing two
+    paths per step.
+    """
+    try:
+        with os.scandir(PATCHES_DIR) as it:
+            names = {entry.name for entry in it}
+    except OSError:
+        return {}
+    patches_dir = os.path.abspath(PATCHES_DIR)
+    with _pending_cv:
+        names.update(os.path.basename(p) for p in _pending if os.path.dirname(p) == patches_dir)
+    diffs: dict[int, str] = {}
+    for sid in step_ids:
+        for name in (f"step-{sid}-refined.diff", f"step-{sid}.diff"):
+            if name in names:
+                content = _read_text(os.path.join(PATCHES_DIR, name))
+                if content:
+                    diffs[sid] = content
+                    break
+    return diffs
 
 
 # ---------------------------------------------------------------------------
@@ -149,6 +281,11 @@ def save_final_prompt(content: str) -> str:
     return path
 
 
+def final_prompt_path() -> str:
+    """Where save_final_prompt() (or assembler.write_final_prompt) keeps the final prompt."""
+    return os.path.join(PROMPTS_DIR, "final_prompt.txt")
+
+
 def load_final_prompt() -> str | None:
     """Load the assembled final agent prompt from disk, or None if not yet built."""
     path = os.path.join(PROMPTS_DIR, "final_prompt.txt")
@@ -158,11 +295,25 @@ def load_final_prompt() -> str | None:
         return f.read()
 
 
-def get_repo_file_tree(root: str = ".") -> str:
-    """Return a text representation of the repository file tree."""
+def get_repo_file_tree(root: str = ".", dir_stamps: dict[str, int] | None = None) -> str:
+    """
+    Return a text representation of the repository file tree.
+
+    If *dir_stamps* is given, the mtime of every listed directory is recorded
+    in it, taken before the directory is read — the tree only changes when
+    one of them does.
+    """
     lines = []
     root_path = pathlib.Path(root).resolve()
 
+    def stamp(path) -> None:
+        if dir_stamps is not None:
+            try:
+                dir_stamps[str(path)] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+
+    stamp(root_path)
     for dirpath, dirnames, filenames in os.walk(root_path):
         # Prune ignored directories in-place so os.walk doesn't descend into them
         dirnames[:] = [
@@ -171,6 +322,8 @@ def get_repo_file_tree(root: str = ".") -> str:
             and not d.endswith(".egg-info")
             and not d.startswith(IGNORE_DIR_PREFIXES)
         ]
+        for d in dirnames:
+            stamp(os.path.join(dirpath, d))
 
         rel_dir = pathlib.Path(dirpath).relative_to(root_path)
         depth = len(rel_dir.parts)
@@ -191,6 +344,34 @@ def get_repo_file_tree(root: str = ".") -> str:
     return "\n".join(lines)
 
 
+def stamps_unchanged(stamps: dict[str, int]) -> bool:
+    """True if every path in *stamps* still has the recorded mtime (and exists)."""
+    for path, mtime_ns in stamps.items():
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+# File tree per resolved root: (directory mtimes it was built from, tree).
+# Any file added, removed or renamed changes its directory's mtime.
+_TREE_CACHE: dict[str, tuple[dict[str, int], str]] = {}
+
+
+def cached_repo_file_tree(root: str = ".") -> str:
+    """get_repo_file_tree(root), reused across calls while no directory changes."""
+    key = os.path.realpath(root)
+    hit = _TREE_CACHE.get(key)
+    if hit is not None and stamps_unchanged(hit[0]):
+        return hit[1]
+    stamps: dict[str, int] = {}
+    tree = get_repo_file_tree(root, stamps)
+    _TREE_CACHE[key] = (stamps, tree)
+    return tree
+
+
 def read_files(file_paths: list[str]) -> dict[str, str]:
     """Read the contents of the given files. Returns {path: content}."""
     contents = {}
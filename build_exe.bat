@@ -8,6 +8,7 @@ echo Installing PyInstaller...
 echo Building ZeroToken.exe...
 .venv\Scripts\python.exe -m PyInstaller _launcher_entry.py ^
     --onefile --noconsole --name ZeroToken ^
+    --add-data "%CD%\ai_build\static;ai_build\static" ^
     --distpath . --workpath build\pyinstaller --specpath build
 
 echo.